@@ -3,8 +3,9 @@ Flask application for Daily Brief Bot testing interface
 """
 from flask import Flask, render_template, jsonify, request, redirect, url_for
 from utils.content_filter import ContentFilterManager
-from crawlers.hacker_news import HackerNewsCrawler
-from crawlers.weibo import WeiboCrawler
+from crawlers.deadlines import LatencyHistory, RunBudget, late_notice
+from crawlers.registry import run_sources
+from crawlers.result_cache import SourceResultCache
 # WeChat crawler removed
 from datetime import datetime
 import sys
@@ -15,7 +16,7 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import logging
 import json
-from config import EMAIL_CONFIG, SUBSCRIBERS, USER_INTERESTS
+from config import CONTENT_CONFIG, EMAIL_CONFIG, SOURCES, SUBSCRIBERS, USER_INTERESTS
 import traceback
 from flask_apscheduler import APScheduler
 from pytz import timezone
@@ -49,13 +50,21 @@ def restore_output(buffer):
     sys.stdout = sys.__stdout__
     return buffer.getvalue()
 
-def fetch_hackernews():
-    crawler = HackerNewsCrawler()
-    return crawler.fetch_trending(5)
+# 各来源最近一次的好结果：过期不久时先返回旧结果，后台刷新
+result_cache = SourceResultCache()
 
-def fetch_weibo():
-    crawler = WeiboCrawler()
-    return crawler.fetch_trending(5)
+def fetch_content(names=None, limit=5, budget=None, serve_stale=True):
+    """在同一个事件循环上抓取多个来源，默认为 config.SOURCES 中的全部来源
+
+    budget: RunBudget，给定时各来源按历史耗时分配截止时间，总耗时不超过预算
+    serve_stale: False 时当场抓取，缓存只在抓取失败时兜底（每日简报使用）
+    """
+    names = names or list(SOURCES)
+    specs = {name: {**SOURCES.get(name, {}), 'limit': limit} for name in names}
+    return run_sources(specs, cache=result_cache, budget=budget, serve_stale=serve_stale)
+
+def fetch_source(name, limit=5):
+    return fetch_content([name], limit).get(name, [])
 
 # WeChat source removed
 
@@ -238,6 +247,10 @@ def format_html_content(content):
                 """
             
             html += "</div>"
+
+        notice = late_notice(content.get('late'))
+        if notice:
+            html += f'<div class="item" style="color: #6c757d;">{notice}</div>'
     
     html += """
         </body>
@@ -280,11 +293,10 @@ def send_daily_brief(is_test=False):
     global last_push_content
     logger.info("开始执行每日简报任务...")
     try:
-        # 1. 收集所有来源的内容
-        raw_content = {
-            'hackernews': fetch_hackernews(),
-            'weibo': fetch_weibo()
-        }
+        # 1. 收集所有来源的内容，慢的来源错过截止时间也要按时发送
+        budget = RunBudget(CONTENT_CONFIG['FETCH_BUDGET'], LatencyHistory())
+        # 简报一天一次，前一天的缓存不能直接用，只在抓取失败时兜底
+        raw_content = fetch_content(budget=budget, serve_stale=False)
         
         # 2. 使用 AI 进行内容筛选
         logger.info("开始 AI 内容筛选...")
@@ -296,7 +308,8 @@ def send_daily_brief(is_test=False):
         
         # 3. 发送筛选后的内容
         logger.info(f"发送筛选后的 {len(filtered_content)} 条内容...")
-        content_data = {'filtered_content': filtered_content}
+        # 错过截止时间的来源只在邮件末尾说明，不作为内容条目
+        content_data = {'filtered_content': filtered_content, 'late': budget.late}
         success, message = send_email(content_data)
         
         if success:
@@ -410,9 +423,9 @@ def edit_sections():
 def test_hackernews():
     buffer = capture_output()
     try:
-        results = fetch_hackernews()
+        results = fetch_source('hackernews')
         output = restore_output(buffer)
-        return jsonify({'success': True, 'data': results, 'log': output})
+        return jsonify({'success': True, 'data': results, 'cache': result_cache.meta('hackernews'), 'log': output})
     except Exception as e:
         output = restore_output(buffer)
         return jsonify({'success': False, 'error': str(e), 'log': output})
@@ -421,9 +434,20 @@ def test_hackernews():
 def test_weibo():
     buffer = capture_output()
     try:
-        results = fetch_weibo()
+        results = fetch_source('weibo')
         output = restore_output(buffer)
-        return jsonify({'success': True, 'data': results, 'log': output})
+        return jsonify({'success': True, 'data': results, 'cache': result_cache.meta('weibo'), 'log': output})
+    except Exception as e:
+        output = restore_output(buffer)
+        return jsonify({'success': False, 'error': str(e), 'log': output})
+
+@app.route('/test/xiaohongshu')
+def test_xiaohongshu():
+    buffer = capture_output()
+    try:
+        results = fetch_source('xiaohongshu')
+        output = restore_output(buffer)
+        return jsonify({'success': True, 'data': results, 'cache': result_cache.meta('xiaohongshu'), 'log': output})
     except Exception as e:
         output = restore_output(buffer)
         return jsonify({'success': False, 'error': str(e), 'log': output})
@@ -432,13 +456,15 @@ def test_weibo():
 def test_all():
     buffer = capture_output()
     try:
+        # 测试面板里 HackerNews 的来源名是 hacker-news
+        content = fetch_content()
         results = {
-            'hacker-news': fetch_hackernews(),
-            'weibo': fetch_weibo(),
-            # WeChat source removed
+            ('hacker-news' if name == 'hackernews' else name): items
+            for name, items in content.items()
         }
         output = restore_output(buffer)
-        return jsonify({'success': True, 'data': results, 'log': output})
+        cache = {name: result_cache.meta(name) for name in content}
+        return jsonify({'success': True, 'data': results, 'cache': cache, 'log': output})
     except Exception as e:
         output = restore_output(buffer)
         return jsonify({'success': False, 'error': str(e), 'log': output})
@@ -451,15 +477,12 @@ def test_email():
         # 获取所有来源的内容
         content = {}
         
-        # 获取HackerNews内容
-        hn_content = fetch_hackernews()
-        if hn_content:
-            content['HackerNews'] = hn_content
-            
-        # 获取微博内容
-        weibo_content = fetch_weibo()
-        if weibo_content:
-            content['Weibo'] = weibo_content
+        # 获取HackerNews和微博内容
+        fetched = fetch_content(['hackernews', 'weibo'])
+        if fetched.get('hackernews'):
+            content['HackerNews'] = fetched['hackernews']
+        if fetched.get('weibo'):
+            content['Weibo'] = fetched['weibo']
             
         # 获取B站内容
         bilibili_response = test_bilibili()
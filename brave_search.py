@@ -5,8 +5,8 @@ Handles web search requests using the Brave Search API.
 
 import os
 from typing import Dict, List, Optional, Union
-import requests
 from requests.exceptions import RequestException
+from crawlers.http_client import get_session
 
 class BraveSearchError(Exception):
     """Custom exception for Brave Search related errors."""
@@ -37,6 +37,7 @@ class BraveSearch:
             raise BraveSearchError("No API key provided. Set BRAVE_API_KEY environment variable or pass key to constructor.")
         
         self.base_url = "https://api.search.brave.com/res/v1/web/search"
+        self.session = get_session()
         
     def search(self, query: str, count: int = 10) -> Dict[str, Union[List[Dict], int]]:
         """
@@ -68,7 +69,7 @@ class BraveSearch:
             }
             
             # Make the API request
-            response = requests.get(
+            response = self.session.get(
                 self.base_url,
                 headers=headers,
                 params=params,
@@ -27,11 +27,24 @@ API_KEYS = {
 CONTENT_CONFIG = {
     'HACKER_NEWS_LIMIT': 10,    # Number of HackerNews stories to fetch
     'WEIBO_LIMIT': 10,          # Number of Weibo topics to fetch
+    # Weibo boards merged by hot value; m.weibo.cn has no public tech board, so entertainment
+    # stands in for it. Any other board can be listed by its containerid.
+    'WEIBO_BOARDS': ['realtime', 'society', 'entertainment'],
+    'FETCH_BUDGET': 90,         # Seconds all sources get together before the brief goes out without them
     'max_content_length': 1000,  # Maximum content length for analysis
     'min_similarity_score': 0.7, # Minimum similarity score for content matching
     'max_recommendations': 10,   # Maximum number of recommendations per request
 }
 
+# Daily brief sources: name registered under crawlers/ -> item limit and crawler options
+SOURCES = {
+    'hackernews': {'limit': CONTENT_CONFIG['HACKER_NEWS_LIMIT']},
+    'weibo': {
+        'limit': CONTENT_CONFIG['WEIBO_LIMIT'],
+        'options': {'boards': CONTENT_CONFIG['WEIBO_BOARDS'], 'use_history': True},
+    },
+}
+
 # User Interests Configuration
 USER_INTERESTS = {
     'academic': {
@@ -1,29 +1,43 @@
 """
-Bilibili Up主信息爬虫 - 使用httpx和aiohttp
+Bilibili Up主信息爬虫 - 使用aiohttp
 """
-import httpx
 import asyncio
-import aiohttp
 import json
 import logging
 from pathlib import Path
-import time
-import random
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import hashlib
 import os
+from ..politeness import get_scheduler, is_throttled
+from ..http_client import AsyncSessionHolder, run_with_sessions
+from ..registry import register_source
+from .watermark import WatermarkStore
+from .wbi import WBI_REJECT_CODES, WbiSigner, key_from_url
 
 logger = logging.getLogger(__name__)
 
+@register_source('bilibili')
 class BilibiliCrawler:
-    def __init__(self):
-        self.client = httpx.Client(http2=True)
+    def __init__(self, scheduler=None, watermarks=None, incremental=True, fetch_mode='auto'):
+        # 同一事件循环内的所有请求复用一个连接池
+        self.http = AsyncSessionHolder()
         self.base_url = "https://api.bilibili.com"
-        self._last_request_time = 0
-        self.min_request_interval = 3
-        self.wbi_key = None
-        self.wbi_key_expire = 0
+        # 共享的礼貌调度器，被 -799/-412 风控时自动拉长请求间隔
+        self.scheduler = scheduler or get_scheduler()
+        # 同时在抓取的UP主数量上限
+        self.max_concurrent_ups = 5
+        # 增量模式：按每个UP主的水位线只抓新内容，并跳过近期不太可能更新的UP主
+        if watermarks is None and incremental:
+            watermarks = WatermarkStore()
+        self.watermarks = watermarks
+        # WBI 签名密钥持久化到磁盘，并发请求共享同一次刷新
+        self.wbi = WbiSigner(self._fetch_wbi_keys)
         self.session = self._load_or_create_session()
+        # 抓取模式：feed 读取登录账号的关注动态流，per_user 逐个UP主请求，
+        # auto 在配置了 SESSDATA 时使用 feed
+        self.fetch_mode = fetch_mode
+        self.sessdata = self._load_sessdata()
+        self.feed_max_pages = 5
 
     def _load_or_create_session(self) -> Dict[str, str]:
         session_file = Path(__file__).parent.parent.parent / 'config' / 'bilibili_session.json'
@@ -39,6 +53,17 @@ class BilibiliCrawler:
             logger.error(f"处理会话时出错: {e}")
             return self._generate_session()
 
+    def _load_sessdata(self) -> Optional[str]:
+        config_file = Path(__file__).parent.parent.parent / 'config' / 'bilibili_config.json'
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('SESSDATA') or None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"读取B站配置失败: {e}")
+            return None
+
     def _generate_session(self) -> Dict[str, str]:
         return {
             'buvid': hashlib.md5(os.urandom(16)).hexdigest(),
@@ -46,206 +71,392 @@ class BilibiliCrawler:
             'bili_jct': hashlib.md5(os.urandom(16)).hexdigest()
         }
 
-    def _ensure_request_interval(self):
-        now = time.time()
-        elapsed = now - self._last_request_time
-        if elapsed < self.min_request_interval:
-            sleep_time = self.min_request_interval - elapsed + random.uniform(2, 5)
-            time.sleep(sleep_time)
-        self._last_request_time = time.time()
+    async def _ensure_request_interval(self):
+        await self.scheduler.wait(self.base_url)
 
-    async def _get_wbi_key(self):
-        if self.wbi_key and time.time() < self.wbi_key_expire:
-            return self.wbi_key
+    async def _report_response(self, response, data: Optional[Dict] = None):
+        status = response.status
+        code = data.get('code') if isinstance(data, dict) else None
+        self.scheduler.report(self.base_url, status=status, code=code)
+        if code in WBI_REJECT_CODES:
+            self.wbi.invalidate()
+        # HTTP 200 但业务码表示风控时，HTTP 层已经按成功报告过；
+        # 补报这次失败并只换掉服务这次请求的出口（HTTP 412/429 已在 http_client 中处理）
+        proxy = getattr(response, 'proxy_exit', None)
+        if proxy is not None and is_throttled(code=code) and not is_throttled(status):
+            await self.http.proxy_router.report(proxy, self.base_url, status=status, code=code)
 
-        try:
-            response = await self.client.get("https://api.bilibili.com/x/web-interface/nav")
-            data = response.json()
-            if data['code'] == 0:
-                img_url = data['data']['wbi_img']['img_url']
-                sub_url = data['data']['wbi_img']['sub_url']
-                self.wbi_key = img_url.split('/')[-1].split('.')[0] + sub_url.split('/')[-1].split('.')[0]
-                self.wbi_key_expire = time.time() + 3600
-                return self.wbi_key
-        except Exception as e:
-            logger.error(f"获取wbi key失败: {e}")
-        return None
+    async def _fetch_wbi_keys(self) -> Tuple[str, str]:
+        await self._ensure_request_interval()
+        async with self.http.get().get(f"{self.base_url}/x/web-interface/nav", cookies=self.session) as response:
+            data = await response.json()
+        # 未登录时 code 为 -101，但 wbi_img 仍然会返回
+        wbi_img = (data.get('data') or {}).get('wbi_img')
+        if not wbi_img:
+            raise ValueError(f"nav 接口没有返回 wbi_img: {data.get('code')}")
+        return key_from_url(wbi_img['img_url']), key_from_url(wbi_img['sub_url'])
 
     async def get_up_info(self, uid: str) -> Optional[Dict]:
         try:
-            self._ensure_request_interval()
-
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'application/json, text/plain, */*',
-                    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-                    'Origin': 'https://space.bilibili.com',
-                    'Referer': f'https://space.bilibili.com/{uid}/',
-                }
-
-                params = {
-                    'mid': uid,
-                    'token': '',
-                    'platform': 'web',
-                    'web_location': '1550101',
-                    'w_rid': hashlib.md5(f"{uid}{int(time.time())}".encode()).hexdigest(),
-                }
+            await self._ensure_request_interval()
 
-                async with session.get(
-                    f"{self.base_url}/x/space/wbi/acc/info",
-                    headers=headers,
-                    params=params,
-                    cookies=self.session
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data['code'] == 0:
-                            return data
-                        logger.error(f"获取UP主信息失败: {data}")
-                    return None
+            session = self.http.get()
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                'Accept': 'application/json, text/plain, */*',
+                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+                'Origin': 'https://space.bilibili.com',
+                'Referer': f'https://space.bilibili.com/{uid}/',
+            }
+
+            params = {
+                'mid': uid,
+                'token': '',
+                'platform': 'web',
+                'web_location': '1550101',
+            }
+            params = await self.wbi.sign(params)
+
+            async with session.get(
+                f"{self.base_url}/x/space/wbi/acc/info",
+                headers=headers,
+                params=params,
+                cookies=self.session
+            ) as response:
+                if response.status != 200:
+                    await self._report_response(response)
+                if response.status == 200:
+                    data = await response.json()
+                    await self._report_response(response, data)
+                    if data['code'] == 0:
+                        return data
+                    logger.error(f"获取UP主信息失败: {data}")
+                return None
 
         except Exception as e:
             logger.error(f"获取UP主信息失败: {e}")
             return None
 
     def get_up_info_sync(self, uid: str) -> Optional[Dict]:
-        return asyncio.run(self.get_up_info(uid))
+        return run_with_sessions(self.get_up_info(uid), self.http)
 
-    async def get_up_videos(self, uid: str, page_size: int = 5) -> Optional[List[Dict]]:
-        try:
-            self._ensure_request_interval()
-
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'application/json, text/plain, */*',
-                    'Origin': 'https://space.bilibili.com',
-                    'Referer': f'https://space.bilibili.com/{uid}/',
-                }
-
-                params = {
-                    'mid': uid,
-                    'ps': page_size,
-                    'tid': 0,
-                    'special_type': '',
-                    'pn': 1,
-                    'keyword': '',
-                    'order': 'pubdate',
-                    'platform': 'web',
-                    'web_location': '1550101',
-                    'order_avoided': 'true',
-                }
+    async def _get_videos_page(self, uid: str, page_size: int, page: int) -> Optional[List[Dict]]:
+        await self._ensure_request_interval()
 
-                async with session.get(
-                    f"{self.base_url}/x/space/wbi/arc/search",
-                    headers=headers,
-                    params=params,
-                    cookies=self.session
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data['code'] == 0:
-                            videos = data['data']['list']['vlist']
-                            return [
-                                {
-                                    'title': video['title'],
-                                    'description': video['description'],
-                                    'url': f'https://www.bilibili.com/video/{video["bvid"]}',
-                                    'source': 'Bilibili',
-                                    'up_name': video['author'],
-                                    'created': video['created'],
-                                    'length': video.get('length', ''),
-                                    'play': video.get('play', 0),
-                                    'comment': video.get('comment', 0)
-                                }
-                                for video in videos
-                            ]
-                    return None
+        session = self.http.get()
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': 'application/json, text/plain, */*',
+            'Origin': 'https://space.bilibili.com',
+            'Referer': f'https://space.bilibili.com/{uid}/',
+        }
+
+        params = {
+            'mid': uid,
+            'ps': page_size,
+            'tid': 0,
+            'special_type': '',
+            'pn': page,
+            'keyword': '',
+            'order': 'pubdate',
+            'platform': 'web',
+            'web_location': '1550101',
+            'order_avoided': 'true',
+        }
+        params = await self.wbi.sign(params)
+
+        async with session.get(
+            f"{self.base_url}/x/space/wbi/arc/search",
+            headers=headers,
+            params=params,
+            cookies=self.session
+        ) as response:
+            if response.status != 200:
+                await self._report_response(response)
+            if response.status == 200:
+                data = await response.json()
+                await self._report_response(response, data)
+                if data['code'] == 0:
+                    videos = data['data']['list']['vlist']
+                    return [
+                        {
+                            'title': video['title'],
+                            'description': video['description'],
+                            'url': f'https://www.bilibili.com/video/{video["bvid"]}',
+                            'source': 'Bilibili',
+                            'up_name': video['author'],
+                            'created': video['created'],
+                            'length': video.get('length', ''),
+                            'play': video.get('play', 0),
+                            'comment': video.get('comment', 0)
+                        }
+                        for video in videos
+                    ]
+            return None
+
+    async def get_up_videos(self, uid: str, page_size: int = 5, since: Optional[int] = None,
+                            max_pages: int = 3) -> Optional[List[Dict]]:
+        """获取UP主最新视频；指定 since 时只返回更新的视频，翻页到已见过的视频为止"""
+        try:
+            videos = []
+            for page in range(1, (max_pages if since else 1) + 1):
+                page_videos = await self._get_videos_page(uid, page_size, page)
+                if page_videos is None:
+                    return None if page == 1 else videos
+                if since is None:
+                    return page_videos
+                videos.extend(video for video in page_videos if video['created'] > since)
+                if len(page_videos) < page_size or any(video['created'] <= since for video in page_videos):
+                    break
+            return videos
 
         except Exception as e:
             logger.error(f"获取UP主视频失败: {e}")
             return None
 
     def get_up_videos_sync(self, uid: str, page_size: int = 5) -> Optional[List[Dict]]:
-        return asyncio.run(self.get_up_videos(uid, page_size))
+        return run_with_sessions(self.get_up_videos(uid, page_size), self.http)
 
-    async def get_up_dynamics(self, uid: str) -> Optional[List[Dict]]:
+    async def _get_dynamics_page(self, uid: str, offset: str = '') -> Optional[Tuple[List[Dict], str, bool]]:
+        await self._ensure_request_interval()
+
+        session = self.http.get()
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': 'application/json, text/plain, */*',
+            'Origin': 'https://space.bilibili.com',
+            'Referer': f'https://space.bilibili.com/{uid}/',
+        }
+
+        params = {
+            'host_mid': uid,
+            'offset': offset,
+            'need_top': 0 if offset else 1,
+            'platform': 'web',
+        }
+
+        async with session.get(
+            f"{self.base_url}/x/polymer/web-dynamic/v1/feed/space",
+            headers=headers,
+            params=params,
+            cookies=self.session
+        ) as response:
+            if response.status != 200:
+                await self._report_response(response)
+            if response.status == 200:
+                data = await response.json()
+                await self._report_response(response, data)
+                if data['code'] == 0:
+                    items = [
+                        {
+                            'dynamic_id': item.get('id_str'),
+                            'type': item['type'],
+                            'description': item.get('modules', {}).get('desc', {}).get('text', ''),
+                            'timestamp': item['modules']['module_author']['pub_ts'],
+                            'source': 'Bilibili动态',
+                            # 置顶动态可能很旧，不能用来判断是否翻到已见内容
+                            'pinned': bool(item['modules'].get('module_tag')),
+                        }
+                        for item in data['data']['items']
+                    ]
+                    return items, str(data['data'].get('offset', '')), bool(data['data'].get('has_more'))
+            return None
+
+    async def get_up_dynamics(self, uid: str, since: Optional[int] = None,
+                              max_pages: int = 3) -> Optional[List[Dict]]:
+        """获取UP主最新动态；指定 since 时只返回更新的动态，翻页到已见过的动态为止"""
         try:
-            self._ensure_request_interval()
-
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'application/json, text/plain, */*',
-                    'Origin': 'https://space.bilibili.com',
-                    'Referer': f'https://space.bilibili.com/{uid}/',
-                }
-
-                params = {
-                    'host_mid': uid,
-                    'offset_dynamic_id': 0,
-                    'need_top': 1,
-                    'platform': 'web',
-                }
+            if since is None:
+                page = await self._get_dynamics_page(uid)
+                if page is None:
+                    return None
+                dynamics = page[0][:5]
+            else:
+                dynamics = []
+                offset = ''
+                for page_no in range(max_pages):
+                    page = await self._get_dynamics_page(uid, offset)
+                    if page is None:
+                        if page_no == 0:
+                            return None
+                        break
+                    items, offset, has_more = page
+                    dynamics.extend(item for item in items if item['timestamp'] > since)
+                    reached_seen = any(item['timestamp'] <= since for item in items if not item['pinned'])
+                    if reached_seen or not has_more or not offset:
+                        break
+            # 置顶标记只用于翻页判断，不出现在返回的内容里
+            for item in dynamics:
+                item.pop('pinned', None)
+            return dynamics
+
+        except Exception as e:
+            logger.error(f"获取UP主动态失败: {e}")
+            return None
+
+    def get_up_dynamics_sync(self, uid: str) -> Optional[List[Dict]]:
+        return run_with_sessions(self.get_up_dynamics(uid), self.http)
+
+    def _load_up_users(self) -> List[Dict]:
+        config_path = Path(__file__).parent.parent.parent / 'config' / 'up_users.json'
+        if not config_path.exists():
+            return []
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('up_users', [])
+
+    async def _fetch_up_updates(self, uid: str, semaphore: asyncio.Semaphore) -> List[Dict]:
+        video_since = dynamic_since = None
+        if self.watermarks is not None:
+            if not self.watermarks.should_check(uid):
+                logger.debug(f"UP主 {uid} 近期不太可能更新，使用缓存内容")
+                return self.watermarks.recent(uid)
+            video_since, dynamic_since = self.watermarks.since(uid)
+
+        async with semaphore:
+            results = await asyncio.gather(
+                self.get_up_videos(uid, since=video_since),
+                self.get_up_dynamics(uid, since=dynamic_since),
+                return_exceptions=True
+            )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"获取UP主 {uid} 的更新失败: {result}")
+        videos, dynamics = [None if isinstance(result, Exception) else result for result in results]
+
+        if self.watermarks is not None:
+            self.watermarks.update(uid, videos, dynamics)
+            return self.watermarks.recent(uid)
+        return (videos or []) + (dynamics or [])
 
+    def _use_followed_feed(self) -> bool:
+        if self.fetch_mode == 'feed':
+            return True
+        return self.fetch_mode == 'auto' and bool(self.sessdata)
+
+    def _parse_feed_item(self, item: Dict) -> Dict:
+        modules = item.get('modules', {})
+        author = modules.get('module_author', {})
+        dynamic = modules.get('module_dynamic') or {}
+        archive = (dynamic.get('major') or {}).get('archive')
+        if archive:
+            return {
+                'title': archive.get('title', ''),
+                'description': archive.get('desc', ''),
+                'url': f'https://www.bilibili.com/video/{archive.get("bvid", "")}',
+                'source': 'Bilibili',
+                'up_name': author.get('name', ''),
+                'created': author.get('pub_ts', 0),
+                'length': archive.get('duration_text', ''),
+                'play': archive.get('stat', {}).get('play', 0),
+                'comment': archive.get('stat', {}).get('danmaku', 0),
+            }
+        return {
+            'dynamic_id': item.get('id_str'),
+            'type': item.get('type'),
+            'description': (dynamic.get('desc') or {}).get('text', ''),
+            'timestamp': author.get('pub_ts', 0),
+            'source': 'Bilibili动态',
+            'up_name': author.get('name', ''),
+        }
+
+    async def fetch_followed_feed(self, limit: int = 5, up_users: Optional[List[Dict]] = None) -> Optional[List[Dict]]:
+        """读取登录账号的关注动态流，一个分页流代替逐个UP主的视频和动态请求。
+
+        动态流按时间倒序，攒够 limit 条就停止翻页。配置了UP主列表时只保留列表中的UP主。
+        未登录或接口出错时返回 None，由调用方回退到逐个UP主抓取。
+        """
+        if not self.sessdata:
+            return None
+        wanted = {str(up['uid']) for up in up_users or []}
+        cookies = {**self.session, 'SESSDATA': self.sessdata}
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': 'application/json, text/plain, */*',
+            'Origin': 'https://t.bilibili.com',
+            'Referer': 'https://t.bilibili.com/',
+        }
+
+        try:
+            session = self.http.get()
+            updates = []
+            offset = ''
+            for page in range(1, self.feed_max_pages + 1):
+                await self._ensure_request_interval()
+                params = {'type': 'all', 'page': page, 'offset': offset, 'platform': 'web'}
                 async with session.get(
-                    f"{self.base_url}/x/polymer/web-dynamic/v1/feed/space",
+                    f"{self.base_url}/x/polymer/web-dynamic/v1/feed/all",
                     headers=headers,
                     params=params,
-                    cookies=self.session
+                    cookies=cookies
                 ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data['code'] == 0:
-                            items = data['data']['items'][:5]
-                            return [
-                                {
-                                    'type': item['type'],
-                                    'description': item.get('modules', {}).get('desc', {}).get('text', ''),
-                                    'timestamp': item['modules']['module_author']['pub_ts'],
-                                    'source': 'Bilibili动态',
-                                }
-                                for item in items
-                            ]
-                    return None
+                    if response.status != 200:
+                        await self._report_response(response)
+                        return None if page == 1 else updates[:limit]
+                    data = await response.json()
+                await self._report_response(response, data)
+                if data['code'] != 0:
+                    logger.error(f"获取关注动态失败: {data.get('code')} {data.get('message')}")
+                    return None if page == 1 else updates[:limit]
+
+                for item in data['data'].get('items', []):
+                    mid = str(item.get('modules', {}).get('module_author', {}).get('mid', ''))
+                    if wanted and mid not in wanted:
+                        continue
+                    updates.append(self._parse_feed_item(item))
+
+                offset = data['data'].get('offset', '')
+                if len(updates) >= limit or not data['data'].get('has_more') or not offset:
+                    break
+
+            return updates[:limit]
 
         except Exception as e:
-            logger.error(f"获取UP主动态失败: {e}")
+            logger.error(f"获取关注动态失败: {e}")
             return None
 
-    def get_up_dynamics_sync(self, uid: str) -> Optional[List[Dict]]:
-        return asyncio.run(self.get_up_dynamics(uid))
-
-    def fetch_trending(self, limit: int = 5) -> List[Dict]:
+    async def fetch_trending_async(self, limit: int = 5) -> List[Dict]:
         try:
-            config_path = Path(__file__).parent.parent.parent / 'config' / 'up_users.json'
-            if not config_path.exists():
+            up_users = self._load_up_users()
+            if self._use_followed_feed():
+                updates = await self.fetch_followed_feed(limit, up_users)
+                if updates is not None:
+                    return updates
+                logger.warning("关注动态流不可用，回退到逐个UP主抓取")
+
+            if not up_users:
                 return []
-            
-            with open(config_path, 'r', encoding='utf-8') as f:
-                up_users = json.load(f)
-            
+
+            # 所有UP主并发抓取，请求节奏由共享调度器按 host 控制
+            semaphore = asyncio.Semaphore(self.max_concurrent_ups)
+            results = await asyncio.gather(
+                *(self._fetch_up_updates(up['uid'], semaphore) for up in up_users),
+                return_exceptions=True
+            )
+
             all_updates = []
-            for up in up_users.get('up_users', []):
-                try:
-                    uid = up['uid']
-                    videos = self.get_up_videos_sync(uid)
-                    if videos:
-                        all_updates.extend(videos)
-                    
-                    dynamics = self.get_up_dynamics_sync(uid)
-                    if dynamics:
-                        all_updates.extend(dynamics)
-                    
-                    time.sleep(random.uniform(3, 6))
-                except Exception as e:
-                    logger.error(f"获取UP主 {uid} 的更新失败: {e}")
+            for up, result in zip(up_users, results):
+                if isinstance(result, Exception):
+                    logger.error(f"获取UP主 {up.get('uid')} 的更新失败: {result}")
                     continue
-            
+                all_updates.extend(result)
+
+            if self.watermarks is not None:
+                self.watermarks.save()
+
             all_updates.sort(key=lambda x: x.get('created', 0) or x.get('timestamp', 0), reverse=True)
             return all_updates[:limit]
-            
+
         except Exception as e:
             logger.error(f"获取UP主更新失败: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    async def fetch(self, limit: int = 5):
+        """异步来源接口"""
+        for update in await self.fetch_trending_async(limit):
+            yield update
+
+    async def aclose(self):
+        await self.http.close()
+
+    def fetch_trending(self, limit: int = 5) -> List[Dict]:
+        return run_with_sessions(self.fetch_trending_async(limit), self.http)
@@ -0,0 +1,115 @@
+"""
+Per-UP watermarks for incremental Bilibili crawling
+"""
+import json
+import math
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WATERMARK_PATH = Path(__file__).parent.parent.parent / 'cache' / 'bilibili_watermarks.json'
+
+
+def _item_ts(item: Dict) -> int:
+    return item.get('created') or item.get('timestamp') or 0
+
+
+def _item_key(item: Dict):
+    """视频的 URL 里带 bvid；动态没有 URL，按动态 ID 区分。旧缓存里没有 ID 的动态退回按时间区分"""
+    return item.get('url') or item.get('dynamic_id') or ('', _item_ts(item))
+
+
+class WatermarkStore:
+    """记录每个UP主已见过的最新视频/动态时间，以及最近的发布节奏。
+
+    - `since(uid)` 给出增量抓取的起点，分页遇到不晚于它的内容即可停止
+    - `should_check(uid)` 根据历史发布间隔估计这段时间内发过新内容的概率，
+      概率过低时跳过该UP主，但最多间隔 `max_skip` 秒一定会检查一次
+    - `recent(uid)` 返回缓存的最近内容，跳过或增量抓取时与新内容合并
+    """
+
+    def __init__(self, path: Optional[Path] = None, min_post_probability: float = 0.2,
+                 max_skip: int = 12 * 3600, keep_recent: int = 10, keep_post_times: int = 20):
+        self.path = Path(path) if path else DEFAULT_WATERMARK_PATH
+        self.min_post_probability = min_post_probability
+        self.max_skip = max_skip
+        self.keep_recent = keep_recent
+        self.keep_post_times = keep_post_times
+        self.entries: Dict[str, Dict] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取Bilibili水位线失败，重新开始: {e}")
+            self.entries = {}
+
+    def save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, separators=(',', ':'))
+            tmp_path.replace(self.path)
+        except Exception as e:
+            logger.warning(f"保存Bilibili水位线失败: {e}")
+
+    def since(self, uid: str) -> Tuple[Optional[int], Optional[int]]:
+        """返回 (视频水位线, 动态水位线)，未抓取过时为 None"""
+        entry = self.entries.get(str(uid))
+        if not entry:
+            return None, None
+        return entry.get('video_ts'), entry.get('dynamic_ts')
+
+    def recent(self, uid: str) -> List[Dict]:
+        return list(self.entries.get(str(uid), {}).get('recent', []))
+
+    def post_probability(self, uid: str, now: Optional[float] = None) -> float:
+        """按泊松过程估计自上次检查以来发布过新内容的概率"""
+        entry = self.entries.get(str(uid))
+        if not entry or not entry.get('last_checked'):
+            return 1.0
+        post_times = sorted(entry.get('post_times', []))
+        if len(post_times) < 2:
+            return 1.0
+        gaps = sorted(b - a for a, b in zip(post_times, post_times[1:]) if b > a)
+        if not gaps:
+            return 1.0
+        median_gap = gaps[len(gaps) // 2]
+        elapsed = (now or time.time()) - entry['last_checked']
+        return 1 - math.exp(-elapsed / median_gap)
+
+    def should_check(self, uid: str, now: Optional[float] = None) -> bool:
+        now = now or time.time()
+        entry = self.entries.get(str(uid))
+        if not entry or now - entry.get('last_checked', 0) >= self.max_skip:
+            return True
+        return self.post_probability(uid, now) >= self.min_post_probability
+
+    def update(self, uid: str, videos: Optional[List[Dict]], dynamics: Optional[List[Dict]],
+               now: Optional[float] = None):
+        """合并新抓到的内容并推进水位线；某类请求失败（None）时不推进该类水位线"""
+        entry = self.entries.setdefault(str(uid), {})
+        new_items = []
+        for kind, items in (('video_ts', videos), ('dynamic_ts', dynamics)):
+            if items is None:
+                continue
+            newest = max((_item_ts(item) for item in items), default=0)
+            entry[kind] = max(entry.get(kind) or 0, newest)
+            new_items.extend(items)
+
+        seen = {_item_key(item) for item in entry.get('recent', [])}
+        fresh = [item for item in new_items if _item_key(item) not in seen]
+        recent = sorted(entry.get('recent', []) + fresh, key=_item_ts, reverse=True)
+        entry['recent'] = recent[:self.keep_recent]
+
+        post_times = set(entry.get('post_times', [])) | {_item_ts(item) for item in fresh if _item_ts(item)}
+        entry['post_times'] = sorted(post_times)[-self.keep_post_times:]
+        entry['last_checked'] = now or time.time()
@@ -0,0 +1,116 @@
+"""
+WBI request signing for Bilibili web APIs
+
+The mixin key is derived once from the `img_key`/`sub_key` pair returned by
+`/x/web-interface/nav`, persisted to disk with its expiry so short-lived runs
+start warm, and refreshed at most once at a time however many requests are
+waiting on it.
+"""
+import asyncio
+import hashlib
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WBI_CACHE_PATH = Path(__file__).parent.parent.parent / 'cache' / 'bilibili_wbi.json'
+
+MIXIN_KEY_ENC_TAB = [
+    46, 47, 18, 2, 53, 8, 23, 32, 15, 50, 10, 31, 58, 3, 45, 35, 27, 43, 5, 49,
+    33, 9, 42, 19, 29, 28, 14, 39, 12, 38, 41, 13, 37, 48, 7, 16, 24, 55, 40,
+    61, 26, 17, 0, 1, 60, 51, 30, 4, 22, 25, 54, 21, 56, 59, 6, 63, 57, 62, 11,
+    36, 20, 34, 44, 52
+]
+
+# WBI 签名失效或被风控时的业务码
+WBI_REJECT_CODES = {-352, -403}
+
+
+def get_mixin_key(img_key: str, sub_key: str) -> str:
+    orig = img_key + sub_key
+    return ''.join(orig[i] for i in MIXIN_KEY_ENC_TAB)[:32]
+
+
+def key_from_url(url: str) -> str:
+    return url.rsplit('/', 1)[-1].split('.')[0]
+
+
+def sign_params(params: Dict, mixin_key: str, wts: Optional[int] = None) -> Dict:
+    """返回带 wts 和 w_rid 的新参数字典"""
+    signed = dict(params)
+    signed['wts'] = int(wts if wts is not None else time.time())
+    signed = dict(sorted(signed.items()))
+    # 值中的 !'()* 不参与签名，也不能出现在请求里
+    signed = {
+        key: ''.join(ch for ch in str(value) if ch not in "!'()*")
+        for key, value in signed.items()
+    }
+    query = urlencode(signed)
+    signed['w_rid'] = hashlib.md5((query + mixin_key).encode()).hexdigest()
+    return signed
+
+
+class WbiSigner:
+    def __init__(self, fetch_keys: Callable[[], Awaitable[Tuple[str, str]]],
+                 path: Optional[Path] = None, ttl: int = 12 * 3600):
+        """fetch_keys: 协程函数，返回 nav 接口中的 (img_key, sub_key)"""
+        self.fetch_keys = fetch_keys
+        self.path = Path(path) if path else DEFAULT_WBI_CACHE_PATH
+        self.ttl = ttl
+        self.mixin_key: Optional[str] = None
+        self.expires_at: float = 0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('expires_at', 0) > time.time():
+                self.mixin_key = data['mixin_key']
+                self.expires_at = data['expires_at']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取WBI缓存失败: {e}")
+
+    def _save(self):
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({'mixin_key': self.mixin_key, 'expires_at': self.expires_at}, f)
+        except Exception as e:
+            logger.warning(f"保存WBI缓存失败: {e}")
+
+    def is_valid(self) -> bool:
+        return bool(self.mixin_key) and time.time() < self.expires_at
+
+    def invalidate(self):
+        """签名被拒绝时调用，下次签名前重新获取密钥"""
+        self.mixin_key = None
+        self.expires_at = 0
+
+    async def _refresh(self) -> str:
+        img_key, sub_key = await self.fetch_keys()
+        self.mixin_key = get_mixin_key(img_key, sub_key)
+        self.expires_at = time.time() + self.ttl
+        self._save()
+        logger.info("WBI密钥已刷新")
+        return self.mixin_key
+
+    async def get_key(self) -> str:
+        if self.is_valid():
+            return self.mixin_key
+        # 并发请求共享同一次刷新；任务属于已结束的事件循环时重新创建
+        task = self._refresh_task
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(self._refresh())
+            self._refresh_task = task
+        return await asyncio.shield(task)
+
+    async def sign(self, params: Dict) -> Dict:
+        return sign_params(params, await self.get_key())
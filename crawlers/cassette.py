@@ -0,0 +1,251 @@
+"""
+Record/replay cassettes for every upstream the pipeline talks to
+
+A cassette is a gzip-compressed JSON-lines file with one interaction per
+line: the request (method, normalised URL, hash of the request body), the
+response (status, headers, decoded body) and how long it took. The shared
+requests/aiohttp clients (`http_client.py`), the httpx transport handed to
+the Anthropic client and the SMTP step in `main.py` all consult the active
+cassette:
+
+- record: requests go out as usual and every interaction is appended
+- replay: nothing touches the network; responses come from the cassette,
+  either after the recorded latency (`latency='original'`) or immediately
+  (`latency='zero'`). A request that was never recorded raises `CassetteMiss`.
+
+Activate with `use_cassette(Cassette(...))`, or from the environment:
+`CASSETTE=cassettes/daily.jsonl.gz CASSETTE_MODE=record|replay
+CASSETTE_LATENCY=original|zero python main.py`.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Mapping, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+MODES = ('record', 'replay')
+LATENCIES = ('original', 'zero')
+
+# 每次请求都会变化的签名参数（B 站 WBI），不参与匹配
+VOLATILE_PARAMS = {'wts', 'w_rid'}
+
+# 录制的是解码后的响应体，这些头部不再适用；Set-Cookie 可能包含登录态
+_UNRECORDED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie'}
+
+# 持久化缓存会让两次运行发出的请求不同，回放前按来源关掉
+SOURCE_CACHE_OPTIONS = {
+    'hackernews': {'use_item_cache': False},
+    'xiaohongshu': {'use_cache': False},
+    'bilibili': {'incremental': False},
+    # 热度历史会参与排序（上升话题排到前面），回放时还会把回放的热度写进历史
+    'weibo': {'use_history': False},
+}
+
+
+class CassetteMiss(LookupError):
+    """回放时遇到录制里没有的请求"""
+
+
+def match_key(method: str, url: str, body: Optional[bytes] = None) -> str:
+    """请求的匹配键：方法 + 去掉易变参数并排序查询串的 URL + 请求体哈希"""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in VOLATILE_PARAMS)
+    url = urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urlencode(query), ''))
+    digest = hashlib.sha256(body).hexdigest()[:16] if body else '-'
+    return f"{method.upper()} {url} {digest}"
+
+
+def clean_headers(headers: Mapping[str, str]) -> Dict[str, str]:
+    return {name: value for name, value in headers.items() if name.lower() not in _UNRECORDED_HEADERS}
+
+
+class Cassette:
+    """一盘录制带。录制模式下 `save()` 写回磁盘；回放时同一个请求重复出现会
+    依次取录制里的下一条，取完后一直返回最后一条。"""
+
+    def __init__(self, path, mode: str = 'replay', latency: str = 'zero'):
+        if mode not in MODES:
+            raise ValueError(f"未知的录制模式: {mode}")
+        if latency not in LATENCIES:
+            raise ValueError(f"未知的回放延迟模式: {latency}")
+        self.path = Path(path)
+        self.mode = mode
+        self.latency = latency
+        self.interactions: List[Dict[str, Any]] = []
+        self._queues: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._last: Dict[str, Dict[str, Any]] = {}
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        if self.replaying:
+            self._load()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    interaction = json.loads(line)
+                    self.interactions.append(interaction)
+                    self._queues[interaction['key']].append(interaction)
+        logger.info(f"载入录制带 {self.path}: {len(self.interactions)} 条交互")
+
+    def save(self):
+        if not self.recording:
+            return
+        with self._lock:
+            interactions = sorted(self.interactions, key=lambda i: i['started'])
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for interaction in interactions:
+                f.write(json.dumps(interaction, ensure_ascii=False, separators=(',', ':')) + '\n')
+        tmp_path.replace(self.path)
+        logger.info(f"保存录制带 {self.path}: {len(interactions)} 条交互")
+
+    def _append(self, interaction: Dict[str, Any]):
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def _take(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                self._last[key] = queue.popleft()
+            elif key not in self._last:
+                raise CassetteMiss(f"录制带中没有这个请求: {key}")
+            return self._last[key]
+
+    def delay(self, interaction: Dict[str, Any]) -> float:
+        """回放这条交互前应等待的秒数"""
+        return interaction.get('elapsed', 0.0) if self.latency == 'original' else 0.0
+
+    # HTTP
+
+    def record_http(self, method: str, url: str, body: Optional[bytes], status: int,
+                    headers: Mapping[str, str], content: bytes, started: float, elapsed: float):
+        """started 为 time.monotonic() 时间点，elapsed 为请求耗时（秒）"""
+        self._append({
+            'kind': 'http',
+            'key': match_key(method, url, body),
+            'url': url,
+            'status': status,
+            'headers': clean_headers(headers),
+            'body': base64.b64encode(content).decode('ascii'),
+            'started': round(started - self._started, 4),
+            'elapsed': round(elapsed, 4),
+        })
+
+    def replay_http(self, method: str, url: str, body: Optional[bytes] = None) -> Dict[str, Any]:
+        """返回录制的交互，'content' 为解码后的响应体"""
+        interaction = self._take(match_key(method, url, body))
+        return {**interaction, 'content': base64.b64decode(interaction['body'])}
+
+    # SMTP
+
+    def record_smtp(self, recipient: str, subject: str, started: float, elapsed: float):
+        self._append({
+            'kind': 'smtp',
+            'key': f"SMTP {recipient}",
+            'subject': subject,
+            'started': round(started - self._started, 4),
+            'elapsed': round(elapsed, 4),
+        })
+
+    def replay_smtp(self, recipient: str) -> Dict[str, Any]:
+        return self._take(f"SMTP {recipient}")
+
+
+_active: Optional[Cassette] = None
+_env_loaded = False
+
+
+def get_cassette() -> Optional[Cassette]:
+    """返回当前生效的录制带；第一次调用时按 CASSETTE 环境变量加载"""
+    global _active, _env_loaded
+    if not _env_loaded:
+        _env_loaded = True
+        path = os.getenv('CASSETTE')
+        if path and _active is None:
+            _active = Cassette(path, mode=os.getenv('CASSETTE_MODE', 'replay'),
+                               latency=os.getenv('CASSETTE_LATENCY', 'zero'))
+    return _active
+
+
+def replaying() -> bool:
+    cassette = get_cassette()
+    return cassette is not None and cassette.replaying
+
+
+@contextmanager
+def use_cassette(cassette: Cassette):
+    """在 with 块内启用录制带，退出时恢复原来的设置，录制模式下保存"""
+    global _active, _env_loaded
+    previous, _active, _env_loaded = get_cassette(), cassette, True
+    try:
+        yield cassette
+    finally:
+        _active = previous
+        cassette.save()
+
+
+def deterministic_specs(specs: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """给来源配置加上关闭持久化缓存的选项，让录制和回放发出同样的请求
+
+    这些选项覆盖 config.SOURCES 里的同名设置（例如微博的 use_history=True）。
+    """
+    return {
+        name: {**spec, 'options': {**spec.get('options', {}), **SOURCE_CACHE_OPTIONS.get(name, {})}}
+        for name, spec in specs.items()
+    }
+
+
+def httpx_transport(cassette: Optional[Cassette] = None):
+    """返回接入录制带的 httpx 传输层（给 Anthropic 客户端用），没有启用录制带时返回 None"""
+    cassette = cassette or get_cassette()
+    if cassette is None:
+        return None
+    import httpx
+
+    class CassetteTransport(httpx.BaseTransport):
+        def __init__(self):
+            self._transport = httpx.HTTPTransport()
+
+        def handle_request(self, request: httpx.Request) -> httpx.Response:
+            body = request.read()
+            if cassette.replaying:
+                interaction = cassette.replay_http(request.method, str(request.url), body)
+                time.sleep(cassette.delay(interaction))
+                return httpx.Response(interaction['status'], headers=interaction['headers'],
+                                      content=interaction['content'], request=request)
+            started = time.monotonic()
+            response = self._transport.handle_request(request)
+            try:
+                content = response.read()
+            finally:
+                response.close()
+            cassette.record_http(request.method, str(request.url), body, response.status_code,
+                                 response.headers, content, started, time.monotonic() - started)
+            return httpx.Response(response.status_code, headers=clean_headers(response.headers),
+                                  content=content, request=request)
+
+        def close(self):
+            self._transport.close()
+
+    return CassetteTransport()
@@ -0,0 +1,136 @@
+"""
+Adaptive per-source deadlines within a global run budget
+
+`LatencyHistory` keeps the last few fetch durations of every source on disk
+and derives a deadline from them (p99 plus a margin, clamped). `RunBudget`
+caps a whole run: each source gets `min(its learned deadline, time left in
+the run)`, sources that miss their slot keep what they fetched so far and are
+reported in `budget.late`, and callers render `late_notice(budget.late)` at
+the bottom of the brief so it says it is incomplete instead of silently
+dropping the source. The notice is not a content item, so filtering and
+comment generation never see it.
+"""
+import json
+import math
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_PATH = Path(__file__).parent.parent / 'cache' / 'source_latency.json'
+
+# 超时的样本只知道「至少这么久」，按放大后的值记，否则截止时间永远追不上真实耗时
+TIMEOUT_PENALTY = 1.5
+
+
+class LatencyHistory:
+    """按来源记录最近的抓取耗时（秒），据此给出截止时间"""
+
+    def __init__(self, path: Optional[Path] = None, max_samples: int = 50, min_samples: int = 5,
+                 quantile: float = 0.99, margin: float = 0.5, min_deadline: float = 3.0,
+                 max_deadline: float = 120.0):
+        """
+        min_samples: 样本不足时使用调用方给的默认截止时间
+        margin: 截止时间 = 分位数 * (1 + margin)，再限制在 [min_deadline, max_deadline]
+        """
+        self.path = Path(path) if path else DEFAULT_HISTORY_PATH
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self.quantile = quantile
+        self.margin = margin
+        self.min_deadline = min_deadline
+        self.max_deadline = max_deadline
+        self.samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.samples = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取来源耗时记录失败，重新开始: {e}")
+            self.samples = {}
+
+    def save(self):
+        with self._lock:
+            samples = {name: list(values) for name, values in self.samples.items()}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(samples, f, separators=(',', ':'))
+            tmp_path.replace(self.path)
+        except Exception as e:
+            logger.warning(f"保存来源耗时记录失败: {e}")
+
+    def add(self, name: str, seconds: float, timed_out: bool = False):
+        if timed_out:
+            seconds = min(seconds * TIMEOUT_PENALTY, self.max_deadline)
+        with self._lock:
+            values = self.samples.setdefault(name, [])
+            values.append(round(seconds, 3))
+            del values[:-self.max_samples]
+
+    def percentile(self, name: str) -> Optional[float]:
+        with self._lock:
+            values = sorted(self.samples.get(name, []))
+        if len(values) < self.min_samples:
+            return None
+        # nearest-rank 分位数
+        index = min(len(values), max(1, math.ceil(self.quantile * len(values)))) - 1
+        return values[index]
+
+    def deadline(self, name: str, default: Optional[float]) -> Optional[float]:
+        value = self.percentile(name)
+        if value is None:
+            return default
+        return min(max(value * (1 + self.margin), self.min_deadline), self.max_deadline)
+
+
+class RunBudget:
+    """一次运行的总时间预算，给每个来源分配截止时间并记录错过截止时间的来源"""
+
+    def __init__(self, total: float, latencies: Optional[LatencyHistory] = None):
+        self.total = total
+        self.latencies = latencies
+        self.started = time.monotonic()
+        self.deadlines: Dict[str, float] = {}
+        self.late: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return max(0.0, self.total - (time.monotonic() - self.started))
+
+    def deadline_for(self, name: str, default: Optional[float]) -> float:
+        learned = self.latencies.deadline(name, default) if self.latencies else default
+        deadline = self.remaining() if learned is None else min(learned, self.remaining())
+        with self._lock:
+            self.deadlines[name] = deadline
+        return deadline
+
+    def record(self, name: str, elapsed: float, timed_out: bool, received: int):
+        if self.latencies is not None:
+            self.latencies.add(name, elapsed, timed_out)
+        if timed_out:
+            with self._lock:
+                self.late[name] = received
+            logger.warning(f"{name} missed its {self.deadlines.get(name, elapsed):.1f}s slot, "
+                           f"keeping {received} items")
+
+    def save(self):
+        if self.latencies is not None:
+            self.latencies.save()
+
+
+def late_notice(late: Optional[Dict[str, int]]) -> str:
+    """简报末尾的一句说明，列出错过截止时间的来源；没有时返回空字符串"""
+    if not late:
+        return ''
+    sources = '、'.join(f"{name}（已收到 {received} 条）" for name, received in late.items())
+    return f"以下来源未能在截止时间前返回全部内容，本期简报不完整：{sources}"
@@ -1,48 +1,75 @@
 """
 HackerNews crawler with enhanced error handling and debugging
 """
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import aiohttp
 from datetime import datetime
 import traceback
-import time
-import random
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 import logging
+from .http_client import ACCEPT_ENCODING, AsyncSessionHolder, get_session, run_with_sessions
+from .hn_item_cache import HNItemCache
+from .hn_parser import get_parser
+from .politeness import get_scheduler
+from .registry import register_source
 
 logger = logging.getLogger(__name__)
 
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+@register_source('hackernews')
 class HackerNewsCrawler:
-    def __init__(self):
+    def __init__(self, api_concurrency=10, api_fanout=True, item_cache=None, use_item_cache=True,
+                 parser=None, hedge_delay=3.0, hedge_primary='website', scheduler=None):
         self.base_url = "https://news.ycombinator.com/"
         self.api_base_url = "https://hacker-news.firebaseio.com/v0"
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
+            'Accept-Encoding': ACCEPT_ENCODING,
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1'
         }
         
-        # 配置重试策略
-        retry_strategy = Retry(
-            total=3,  # 最多重试3次
-            backoff_factor=1,  # 重试间隔
-            status_forcelist=[429, 500, 502, 503, 504],
-        )
+        # 共享的连接池会话（重试和超时在 crawlers.http_client 中统一配置）
+        self.session = get_session()
+        self.http = AsyncSessionHolder(headers={'User-Agent': self.headers['User-Agent']})
+        
+        # 按 host 共享的礼貌调度器，代替固定的随机 sleep
+        self.scheduler = scheduler or get_scheduler()
+        
+        # 首页解析后端，None 表示自动选择已安装的最快后端
+        self.parse_front_page = get_parser(parser)
         
-        # 创建会话并配置
-        self.session = requests.Session()
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.session.mount("https://", adapter)
-        self.session.mount("http://", adapter)
-        self.session.timeout = 30
+        # API 回退时并发拉取 item 详情
+        self.api_fanout = api_fanout
+        self.api_concurrency = api_concurrency
+        self.api_timeout = 10
+        
+        # 持久化 item 缓存，只重新拉取变化过的 story
+        if item_cache is None and use_item_cache:
+            item_cache = HNItemCache()
+        self.item_cache = item_cache
+        
+        # 对冲请求：主路径 hedge_delay 秒内没有结果就同时启动另一条路径，取先成功的一个
+        # hedge_delay=None 关闭对冲（网页失败后再走 API），0 表示两条路径同时启动
+        self.hedge_delay = hedge_delay
+        self.hedge_primary = hedge_primary
+        self.website_timeout = 15
         
     def fetch_trending(self, limit=5):
         """Fetch top stories from HackerNews with fallback to official API"""
         try:
+            if self.hedge_delay is not None and not _in_event_loop():
+                return run_with_sessions(self.fetch_trending_hedged(limit), self.http)
+
             # 首先尝试网页抓取
             stories = self._fetch_from_website(limit)
             if stories:
@@ -56,49 +83,85 @@ class HackerNewsCrawler:
             logger.error(f"Error fetching HackerNews: {str(e)}")
             logger.debug(f"Traceback: {traceback.format_exc()}")
             return []
+
+    async def fetch(self, limit=5):
+        """Async source protocol: yield stories without leaving the caller's event loop"""
+        try:
+            if self.hedge_delay is not None:
+                stories = await self.fetch_trending_hedged(limit)
+            else:
+                stories = await self._fetch_from_website_async(limit)
+                if not stories:
+                    logger.info("Website scraping failed, falling back to official API")
+                    stories = await self._fetch_from_api_async(limit)
+        except Exception as e:
+            logger.error(f"Error fetching HackerNews: {str(e)}")
+            logger.debug(f"Traceback: {traceback.format_exc()}")
+            stories = []
+        for story in stories:
+            yield story
+
+    async def aclose(self):
+        await self.http.close()
+
+    async def fetch_trending_hedged(self, limit=5):
+        """Race the website and API paths, returning the first non-empty result"""
+        paths = {
+            'website': self._fetch_from_website_async,
+            'api': self._fetch_from_api_async,
+        }
+        primary_name = self.hedge_primary
+        secondary_name = 'api' if primary_name == 'website' else 'website'
+
+        tasks = {asyncio.create_task(paths[primary_name](limit)): primary_name}
+        try:
+            if self.hedge_delay:
+                await asyncio.wait(tasks, timeout=self.hedge_delay)
+            result = self._first_result(tasks)
+            if result is not None:
+                return result
+
+            logger.info(f"Hedging HackerNews fetch: starting {secondary_name} path")
+            tasks[asyncio.create_task(paths[secondary_name](limit))] = secondary_name
+            pending = {task for task in tasks if not task.done()}
+            while pending:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                result = self._first_result(tasks)
+                if result is not None:
+                    return result
+            return []
+        finally:
+            # 取消仍在进行的另一条路径
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _first_result(self, tasks):
+        for task, name in tasks.items():
+            if task.done() and not task.cancelled() and task.exception() is None and task.result():
+                logger.debug(f"HackerNews {name} path won the race")
+                return task.result()
+        return None
             
     def _fetch_from_website(self, limit):
         """Fetch stories from HackerNews website"""
         try:
-            # 添加随机延时
-            time.sleep(random.uniform(1, 3))
+            self.scheduler.wait_sync(self.base_url)
             
             logger.info(f"Fetching news from {self.base_url}")
             response = self.session.get(self.base_url, headers=self.headers)
+            self.scheduler.report(self.base_url, status=response.status_code)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.text, 'html.parser')
             stories = []
-            
-            items = soup.find_all('tr', class_='athing')
-            logger.debug(f"Found {len(items)} stories")
-            
-            for idx, item in enumerate(items[:limit], 1):
-                try:
-                    title_link = item.select_one('.titleline > a')
-                    if not title_link:
-                        logger.warning(f"No title link found in story {idx}")
-                        continue
-                        
-                    subtext = item.find_next_sibling('tr')
-                    score = 'No score'
-                    if subtext:
-                        score_elem = subtext.find('span', class_='score')
-                        score = score_elem.text if score_elem else 'No score'
-                        
-                    story = {
-                        'title': title_link.get_text().strip(),
-                        'url': title_link.get('href'),
-                        'score': score,
-                        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'source': 'HackerNews'
-                    }
-                    stories.append(story)
-                    logger.debug(f"Added story {idx}: {story['title']}")
-                    
-                except Exception as e:
-                    logger.error(f"Error processing story {idx}: {str(e)}")
-                    continue
+            for idx, item in enumerate(self.parse_front_page(response.text, limit), 1):
+                story = {
+                    **item,
+                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'source': 'HackerNews'
+                }
+                stories.append(story)
+                logger.debug(f"Added story {idx}: {story['title']}")
                     
             return stories
             
@@ -106,40 +169,164 @@ class HackerNewsCrawler:
             logger.error(f"Error scraping website: {str(e)}")
             return []
             
+    async def _fetch_from_website_async(self, limit):
+        """Fetch stories from HackerNews website without blocking the event loop"""
+        try:
+            await self.scheduler.wait(self.base_url)
+
+            logger.info(f"Fetching news from {self.base_url}")
+            timeout = aiohttp.ClientTimeout(total=self.website_timeout)
+            async with self.http.get().get(self.base_url, headers=self.headers, timeout=timeout) as response:
+                self.scheduler.report(self.base_url, status=response.status)
+                response.raise_for_status()
+                page = await response.text()
+
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            return [
+                {**item, 'timestamp': timestamp, 'source': 'HackerNews'}
+                for item in self.parse_front_page(page, limit)
+            ]
+
+        except Exception as e:
+            logger.error(f"Error scraping website: {str(e)}")
+            return []
+            
     def _fetch_from_api(self, limit):
         """Fetch stories from HackerNews official API"""
+        if self.api_fanout:
+            if not _in_event_loop():
+                # 当前线程没有事件循环（to_thread / Flask），可以直接并发拉取
+                return run_with_sessions(self._fetch_from_api_async(limit), self.http)
+            logger.debug("Event loop already running, using sequential API fetch")
+        return self._fetch_from_api_sequential(limit)
+
+    def _get_json(self, path):
+        response = self.session.get(f"{self.api_base_url}/{path}")
+        response.raise_for_status()
+        return response.json()
+
+    def _fetch_from_api_sequential(self, limit):
+        """Fetch stories from HackerNews official API one by one"""
         try:
             # 获取热门故事 ID
-            top_stories_url = f"{self.api_base_url}/topstories.json"
-            response = self.session.get(top_stories_url)
-            response.raise_for_status()
-            story_ids = response.json()[:limit]
-            
+            story_ids = self._get_json('topstories.json')[:limit]
+
+            if self.item_cache is not None:
+                try:
+                    self._apply_item_updates(self._get_json('updates.json'), self._get_json('maxitem.json'))
+                except Exception as e:
+                    self._drop_item_cache(e)
+
             stories = []
             for story_id in story_ids:
                 try:
-                    # 获取每个故事的详细信息
-                    story_url = f"{self.api_base_url}/item/{story_id}.json"
-                    story_response = self.session.get(story_url)
-                    story_response.raise_for_status()
-                    story_data = story_response.json()
-                    
-                    story = {
-                        'title': story_data.get('title', ''),
-                        'url': story_data.get('url', ''),
-                        'score': f"{story_data.get('score', 0)} points",
-                        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'source': 'HackerNews'
-                    }
-                    stories.append(story)
-                    logger.debug(f"Added story from API: {story['title']}")
+                    item = self.item_cache.get(story_id) if self.item_cache is not None else None
+                    if item is None:
+                        # 获取每个故事的详细信息
+                        item = self._get_json(f"item/{story_id}.json")
+                        if self.item_cache is not None:
+                            self.item_cache.put(item)
+                    story = self._story_from_item(item)
+                    if story:
+                        stories.append(story)
+                        logger.debug(f"Added story from API: {story['title']}")
                     
                 except Exception as e:
                     logger.error(f"Error fetching story {story_id}: {str(e)}")
                     continue
-                    
+
+            if self.item_cache is not None:
+                self.item_cache.save()
             return stories
             
         except Exception as e:
             logger.error(f"Error fetching from API: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+    async def _fetch_from_api_async(self, limit):
+        """Fetch stories from HackerNews official API concurrently, keeping topstories order"""
+        try:
+            session = self.http.get()
+            timeout = aiohttp.ClientTimeout(total=self.api_timeout)
+            async with session.get(f"{self.api_base_url}/topstories.json", timeout=timeout) as response:
+                response.raise_for_status()
+                story_ids = (await response.json())[:limit]
+
+            if self.item_cache is not None:
+                await self._sync_item_cache(session, timeout)
+                missing_ids = self.item_cache.missing(story_ids)
+            else:
+                missing_ids = story_ids
+
+            semaphore = asyncio.Semaphore(self.api_concurrency)
+
+            async def fetch_item(story_id):
+                async with semaphore:
+                    try:
+                        story_url = f"{self.api_base_url}/item/{story_id}.json"
+                        async with session.get(story_url, timeout=timeout) as story_response:
+                            story_response.raise_for_status()
+                            return await story_response.json()
+                    except Exception as e:
+                        logger.error(f"Error fetching story {story_id}: {str(e)}")
+                        return None
+
+            # gather 按输入顺序返回结果，保持 topstories 的排名
+            fetched = await asyncio.gather(*(fetch_item(story_id) for story_id in missing_ids))
+            items = dict(zip(missing_ids, fetched))
+
+            if self.item_cache is not None:
+                for item in fetched:
+                    self.item_cache.put(item)
+                self.item_cache.save()
+                logger.debug(f"HN item cache: {len(story_ids) - len(missing_ids)} hits, {len(missing_ids)} fetched")
+
+            stories = []
+            for story_id in story_ids:
+                item = items.get(story_id)
+                if item is None and self.item_cache is not None:
+                    item = self.item_cache.get(story_id)
+                story = self._story_from_item(item)
+                if story:
+                    stories.append(story)
+            logger.debug(f"Fetched {len(stories)}/{len(story_ids)} stories from API")
+            return stories
+
+        except Exception as e:
+            logger.error(f"Error fetching from API: {str(e)}")
+            return []
+
+    async def _sync_item_cache(self, session, timeout):
+        """用 updates.json / maxitem.json 失效发生变化的缓存 item"""
+        async def get_json(path):
+            async with session.get(f"{self.api_base_url}/{path}", timeout=timeout) as response:
+                response.raise_for_status()
+                return await response.json()
+
+        try:
+            updates, max_item = await asyncio.gather(get_json('updates.json'), get_json('maxitem.json'))
+        except Exception as e:
+            self._drop_item_cache(e)
+            return
+        self._apply_item_updates(updates, max_item)
+
+    def _apply_item_updates(self, updates, max_item):
+        removed = self.item_cache.apply_updates(updates, max_item)
+        logger.debug(f"HN updates feed invalidated {removed} cached items")
+
+    def _drop_item_cache(self, error):
+        # 拿不到更新列表时无法判断哪些缓存仍然有效，全部重新拉取
+        logger.warning(f"Error fetching HN updates, dropping item cache: {str(error)}")
+        self.item_cache.items.clear()
+
+    def _story_from_item(self, story_data):
+        """Convert a Firebase API item into a story dict"""
+        if not story_data:
+            return None
+        return {
+            'title': story_data.get('title', ''),
+            'url': story_data.get('url', ''),
+            'score': f"{story_data.get('score', 0)} points",
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'source': 'HackerNews'
+        }
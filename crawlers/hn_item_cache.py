@@ -0,0 +1,109 @@
+"""
+Persistent HackerNews item cache with incremental refresh
+"""
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / 'cache' / 'hn_items.json'
+
+# 只保留生成简报需要的字段，控制缓存文件体积
+ITEM_FIELDS = ('id', 'type', 'title', 'url', 'score', 'time', 'descendants', 'by')
+
+
+class HNItemCache:
+    """按 story ID 缓存 Firebase API 返回的 item。
+
+    `/v0/updates.json` 只包含最近一小段时间内变化过的 item，两次运行间隔较长时
+    无法覆盖全部变化，所以每条缓存还带有 `max_age` 过期时间作为兜底。
+    两次同步之间 `/v0/maxitem.json` 增长超过 `max_item_gap`，说明期间站点上的
+    变化多到更新列表来不及覆盖，此时整个缓存作废。
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_age: int = 3600, max_items: int = 2000,
+                 max_item_gap: int = 2000):
+        self.path = Path(path) if path else DEFAULT_CACHE_PATH
+        self.max_age = max_age
+        self.max_items = max_items
+        self.max_item_gap = max_item_gap
+        self.items: Dict[int, Dict] = {}
+        self.max_item: Optional[int] = None
+        self.synced_at: float = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.items = {int(k): v for k, v in data.get('items', {}).items()}
+            self.max_item = data.get('max_item')
+            self.synced_at = data.get('synced_at', 0)
+            logger.debug(f"Loaded {len(self.items)} cached HN items")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Failed to load HN item cache, starting empty: {str(e)}")
+            self.items = {}
+
+    def save(self):
+        """裁剪并写回磁盘"""
+        if len(self.items) > self.max_items:
+            newest = sorted(self.items.items(), key=lambda kv: kv[1].get('_fetched_at', 0), reverse=True)
+            self.items = dict(newest[:self.max_items])
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'items': {str(k): v for k, v in self.items.items()},
+                    'max_item': self.max_item,
+                    'synced_at': self.synced_at,
+                }, f, ensure_ascii=False, separators=(',', ':'))
+            tmp_path.replace(self.path)
+        except Exception as e:
+            logger.warning(f"Failed to save HN item cache: {str(e)}")
+
+    def get(self, item_id: int) -> Optional[Dict]:
+        """返回未过期的缓存 item，否则返回 None"""
+        item = self.items.get(int(item_id))
+        if item is None:
+            return None
+        if time.time() - item.get('_fetched_at', 0) > self.max_age:
+            return None
+        return item
+
+    def put(self, item: Dict):
+        if not item or 'id' not in item:
+            return
+        entry = {field: item[field] for field in ITEM_FIELDS if field in item}
+        entry['_fetched_at'] = time.time()
+        self.items[int(item['id'])] = entry
+
+    def invalidate(self, item_ids: Iterable[int]) -> int:
+        """删除已变化的 item，返回实际删除的数量"""
+        removed = 0
+        for item_id in item_ids:
+            if self.items.pop(int(item_id), None) is not None:
+                removed += 1
+        return removed
+
+    def apply_updates(self, updates: Dict, max_item: Optional[int]) -> int:
+        """根据 updates.json / maxitem.json 的结果失效缓存"""
+        if max_item is not None and self.max_item is not None and max_item - self.max_item > self.max_item_gap:
+            logger.debug(f"HN max item advanced by {max_item - self.max_item} since last sync, dropping item cache")
+            removed = len(self.items)
+            self.items.clear()
+        else:
+            removed = self.invalidate(updates.get('items', []) if updates else [])
+        if max_item is not None:
+            self.max_item = max_item
+        self.synced_at = time.time()
+        return removed
+
+    def missing(self, item_ids: List[int]) -> List[int]:
+        """返回需要重新拉取的 ID，保持原顺序"""
+        return [item_id for item_id in item_ids if self.get(item_id) is None]
@@ -0,0 +1,167 @@
+"""
+HackerNews front-page parsers
+
+All backends return the first `limit` stories as dicts with `title`, `url`
+and `score`. The fastest installed backend is used by default:
+selectolax > lxml > scanner. `bs4` is the original BeautifulSoup parser.
+"""
+import html
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+NO_SCORE = 'No score'
+
+
+def parse_with_scanner(page: str, limit: int) -> List[Dict]:
+    """只扫描 athing 行的标题链接和下一行的 score，不构建 DOM 树"""
+    stories = []
+    pos = page.find('class="athing')
+    while pos != -1 and len(stories) < limit:
+        next_row = page.find('class="athing', pos + 1)
+        row_end = next_row if next_row != -1 else len(page)
+
+        title_pos = page.find('class="titleline"', pos, row_end)
+        link_pos = page.find('<a ', title_pos, row_end) if title_pos != -1 else -1
+        if link_pos == -1:
+            pos = next_row
+            continue
+
+        href_start = page.find('href="', link_pos, row_end)
+        tag_end = page.find('>', link_pos, row_end)
+        url = None
+        if href_start != -1 and href_start < tag_end:
+            href_start += len('href="')
+            url = html.unescape(page[href_start:page.find('"', href_start)])
+        title = html.unescape(page[tag_end + 1:page.find('</a>', tag_end)]).strip()
+
+        score = NO_SCORE
+        score_pos = page.find('class="score"', tag_end, row_end)
+        if score_pos != -1:
+            score_start = page.find('>', score_pos) + 1
+            score = page[score_start:page.find('<', score_start)].strip()
+
+        stories.append({'title': title, 'url': url, 'score': score})
+        pos = next_row
+    return stories
+
+
+def parse_with_lxml(page: str, limit: int) -> List[Dict]:
+    from lxml import html as lxml_html
+
+    tree = lxml_html.fromstring(page)
+    stories = []
+    for row in tree.xpath('//tr[contains(concat(" ", normalize-space(@class), " "), " athing ")]'):
+        links = row.xpath('.//span[@class="titleline"]/a[1]')
+        if not links:
+            continue
+        score = NO_SCORE
+        subtext = row.getnext()
+        if subtext is not None:
+            score_elems = subtext.xpath('.//span[@class="score"]')
+            if score_elems:
+                score = score_elems[0].text_content()
+        stories.append({
+            'title': links[0].text_content().strip(),
+            'url': links[0].get('href'),
+            'score': score,
+        })
+        if len(stories) >= limit:
+            break
+    return stories
+
+
+def _selectolax_parser():
+    try:
+        from selectolax.lexbor import LexborHTMLParser
+        return LexborHTMLParser
+    except ImportError:
+        # selectolax < 0.3.13 只有 modest 后端
+        from selectolax.parser import HTMLParser
+        return HTMLParser
+
+
+def parse_with_selectolax(page: str, limit: int) -> List[Dict]:
+    HTMLParser = _selectolax_parser()
+    stories = []
+    for row in HTMLParser(page).css('tr.athing'):
+        link = row.css_first('.titleline > a')
+        if link is None:
+            continue
+        subtext = row.next
+        while subtext is not None and subtext.tag != 'tr':
+            subtext = subtext.next
+        score_elem = subtext.css_first('span.score') if subtext is not None else None
+        stories.append({
+            'title': link.text().strip(),
+            'url': link.attributes.get('href'),
+            'score': score_elem.text() if score_elem is not None else NO_SCORE,
+        })
+        if len(stories) >= limit:
+            break
+    return stories
+
+
+def parse_with_bs4(page: str, limit: int) -> List[Dict]:
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(page, 'html.parser')
+    stories = []
+    for item in soup.find_all('tr', class_='athing'):
+        title_link = item.select_one('.titleline > a')
+        if not title_link:
+            continue
+        subtext = item.find_next_sibling('tr')
+        score = NO_SCORE
+        if subtext:
+            score_elem = subtext.find('span', class_='score')
+            score = score_elem.text if score_elem else NO_SCORE
+        stories.append({
+            'title': title_link.get_text().strip(),
+            'url': title_link.get('href'),
+            'score': score,
+        })
+        if len(stories) >= limit:
+            break
+    return stories
+
+
+PARSERS: Dict[str, Callable[[str, int], List[Dict]]] = {
+    'selectolax': parse_with_selectolax,
+    'lxml': parse_with_lxml,
+    'scanner': parse_with_scanner,
+    'bs4': parse_with_bs4,
+}
+
+
+def _is_available(name: str) -> bool:
+    module = {'selectolax': 'selectolax', 'lxml': 'lxml.html', 'bs4': 'bs4'}.get(name)
+    if module is None:
+        return True
+    try:
+        __import__(module)
+        if name == 'selectolax':
+            _selectolax_parser()
+        return True
+    except ImportError:
+        return False
+
+
+def get_parser(name: Optional[str] = None) -> Callable[[str, int], List[Dict]]:
+    """按名称获取解析器，未指定时选择已安装的最快后端"""
+    if name:
+        if name not in PARSERS:
+            raise ValueError(f"Unknown HackerNews parser: {name}")
+        if not _is_available(name):
+            logger.warning(f"HackerNews parser {name} is not installed, using scanner")
+            return parse_with_scanner
+        return PARSERS[name]
+    for candidate in ('selectolax', 'lxml', 'scanner'):
+        if _is_available(candidate):
+            return PARSERS[candidate]
+    return parse_with_scanner
+
+
+def parse_front_page(page: str, limit: int, backend: Optional[str] = None) -> List[Dict]:
+    return get_parser(backend)(page, limit)
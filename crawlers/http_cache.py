@@ -0,0 +1,343 @@
+"""
+On-disk HTTP cache shared by the requests and aiohttp clients
+
+Responses to GET requests are stored under `cache/http/`: bodies are
+content-addressed by their sha256 (identical bodies are stored once), and a
+SQLite index maps each URL to its headers, freshness deadline and body.
+
+- Freshness follows RFC 9111: `Cache-Control: max-age`, `Expires`/`Date`,
+  `Age`, and the Last-Modified heuristic. `no-store` and `Vary: *` responses
+  are never stored, `no-cache` responses are always revalidated.
+- Stale entries are revalidated with `If-None-Match` / `If-Modified-Since`;
+  a 304 refreshes the stored headers and the cached body is served.
+- `host_ttls` gives a lifetime to APIs that send no freshness headers at all
+  (the Firebase HN API, Weibo's container API, Brave Search).
+- The total body size is capped; least recently used entries are evicted.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Mapping, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / 'cache' / 'http'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+HEURISTIC_FRACTION = 0.1     # RFC 9111 4.2.2 建议的 Last-Modified 启发式比例
+MAX_HEURISTIC_LIFETIME = 24 * 3600
+
+# 不发缓存头的接口按 host 给一个新鲜期（秒）
+DEFAULT_HOST_TTLS = {
+    'hacker-news.firebaseio.com': 60,
+    'm.weibo.cn': 60,
+    'api.search.brave.com': 3600,
+}
+
+# 缓存的是解码后的响应体，这些头部不再适用
+_UNSTORED_HEADERS = {
+    'connection', 'keep-alive', 'proxy-connection', 'te', 'trailer', 'transfer-encoding', 'upgrade',
+    'content-encoding', 'content-length', 'set-cookie',
+}
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """'max-age=60, no-cache' -> {'max-age': '60', 'no-cache': None}"""
+    directives: Dict[str, Optional[str]] = {}
+    for part in (value or '').split(','):
+        name, _, arg = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip().strip('"') if arg else None
+    return directives
+
+
+def _parse_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+def _parse_seconds(value: Optional[str]) -> Optional[int]:
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _lower_headers(headers: Mapping[str, str]) -> Dict[str, str]:
+    # 同名头部（例如多个 Vary）合并成逗号分隔
+    merged: Dict[str, str] = {}
+    for name, value in headers.items():
+        name = name.lower()
+        merged[name] = f"{merged[name]}, {value}" if name in merged else value
+    return merged
+
+
+def _vary_names(headers: Mapping[str, str]) -> list:
+    return sorted({name.strip().lower() for name in headers.get('vary', '').split(',') if name.strip()})
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    status: int
+    headers: Dict[str, str]
+    body_hash: str
+    size: int
+    stored_at: float
+    expires_at: float
+    vary: Dict[str, str] = field(default_factory=dict)
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) < self.expires_at
+
+    def validators(self) -> Dict[str, str]:
+        """重新验证时附加的条件请求头"""
+        conditional = {}
+        if 'etag' in self.headers:
+            conditional['If-None-Match'] = self.headers['etag']
+        if 'last-modified' in self.headers:
+            conditional['If-Modified-Since'] = self.headers['last-modified']
+        return conditional
+
+
+class HTTPCache:
+    """按 RFC 9111 语义缓存 GET 响应，响应体按内容寻址存储，超过容量按 LRU 淘汰。
+
+    SQLite 索引可以被多个线程和进程（Flask 与定时任务）同时使用。
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 host_ttls: Optional[Dict[str, float]] = None):
+        """host_ttls: {host: 秒}，只对没有任何新鲜度信息的响应生效，None 时用 DEFAULT_HOST_TTLS"""
+        self.path = Path(path) if path else DEFAULT_CACHE_PATH
+        self.max_bytes = max_bytes
+        self.host_ttls = dict(DEFAULT_HOST_TTLS if host_ttls is None else host_ttls)
+        self.bodies = self.path / 'bodies'
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path / 'index.sqlite3'), timeout=10, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                ' key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, vary TEXT,'
+                ' body_hash TEXT, size INTEGER, stored_at REAL, expires_at REAL, last_access REAL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)')
+
+    @staticmethod
+    def key(method: str, url: str) -> str:
+        return hashlib.sha256(f"{method.upper()} {url}".encode('utf-8')).hexdigest()
+
+    def _body_path(self, body_hash: str) -> Path:
+        return self.bodies / body_hash[:2] / body_hash
+
+    def freshness_lifetime(self, url: str, headers: Mapping[str, str], now: Optional[float] = None) -> float:
+        """按 RFC 9111 4.2.1 计算剩余新鲜期（已扣除 Age），headers 的键为小写"""
+        now = now or time.time()
+        directives = parse_cache_control(headers.get('cache-control'))
+        if 'no-cache' in directives:
+            return 0
+        date = _parse_date(headers.get('date')) or now
+        if 'max-age' in directives:
+            lifetime = _parse_seconds(directives['max-age']) or 0
+        elif 'expires' in headers:
+            expires = _parse_date(headers['expires'])
+            # 无法解析的 Expires 视为已过期
+            lifetime = max(0.0, expires - date) if expires is not None else 0
+        elif urlsplit(url).hostname in self.host_ttls:
+            lifetime = self.host_ttls[urlsplit(url).hostname]
+        elif 'last-modified' in headers:
+            last_modified = _parse_date(headers['last-modified'])
+            lifetime = 0
+            if last_modified is not None and last_modified < date:
+                lifetime = min((date - last_modified) * HEURISTIC_FRACTION, MAX_HEURISTIC_LIFETIME)
+        else:
+            lifetime = 0
+        age = max(_parse_seconds(headers.get('age')) or 0, now - date)
+        return lifetime - age
+
+    def storable(self, method: str, status: int, headers: Mapping[str, str]) -> bool:
+        headers = _lower_headers(headers)
+        if method.upper() != 'GET' or status != 200:
+            return False
+        directives = parse_cache_control(headers.get('cache-control'))
+        if 'no-store' in directives or headers.get('vary', '').strip() == '*':
+            return False
+        return True
+
+    def lookup(self, url: str, request_headers: Optional[Mapping[str, str]] = None,
+               method: str = 'GET') -> Optional[CacheEntry]:
+        """返回缓存条目（可能已过期，需要调用方重新验证），Vary 不匹配时返回 None"""
+        if method.upper() != 'GET':
+            return None
+        with self._lock:
+            row = self._db.execute(
+                'SELECT url, status, headers, vary, body_hash, size, stored_at, expires_at'
+                ' FROM entries WHERE key = ?', (self.key(method, url),)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = CacheEntry(url=row[0], status=row[1], headers=json.loads(row[2]), vary=json.loads(row[3]),
+                           body_hash=row[4], size=row[5], stored_at=row[6], expires_at=row[7])
+        request_headers = _lower_headers(request_headers or {})
+        if any(request_headers.get(name, '') != value for name, value in entry.vary.items()):
+            return None
+        if not self._body_path(entry.body_hash).exists():
+            return None
+        self._touch(method, url)
+        return entry
+
+    def body(self, entry: CacheEntry) -> Optional[bytes]:
+        try:
+            return self._body_path(entry.body_hash).read_bytes()
+        except OSError as e:
+            logger.warning(f"读取 HTTP 缓存内容失败: {e}")
+            return None
+
+    def store(self, url: str, status: int, headers: Mapping[str, str], body: bytes,
+              request_headers: Optional[Mapping[str, str]] = None, method: str = 'GET',
+              now: Optional[float] = None) -> Optional[CacheEntry]:
+        if not self.storable(method, status, headers):
+            return None
+        now = now or time.time()
+        headers = {name: value for name, value in _lower_headers(headers).items()
+                   if name not in _UNSTORED_HEADERS}
+        lifetime = self.freshness_lifetime(url, headers, now)
+        if lifetime <= 0 and 'etag' not in headers and 'last-modified' not in headers:
+            # 既不新鲜也无法重新验证，存了也用不上
+            return None
+        headers.setdefault('date', formatdate(now, usegmt=True))
+        request_headers = _lower_headers(request_headers or {})
+        vary = {name: request_headers.get(name, '') for name in _vary_names(headers)}
+        body_hash = hashlib.sha256(body).hexdigest()
+        entry = CacheEntry(url=url, status=status, headers=headers, body_hash=body_hash, size=len(body),
+                           stored_at=now, expires_at=now + lifetime, vary=vary)
+        try:
+            self._write_body(body_hash, body)
+            with self._lock, self._db:
+                old = self._db.execute('SELECT body_hash FROM entries WHERE key = ?',
+                                       (self.key(method, url),)).fetchone()
+                self._db.execute(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (self.key(method, url), url, status, json.dumps(headers), json.dumps(vary),
+                     body_hash, len(body), now, entry.expires_at, now)
+                )
+                orphans = [old[0]] if old and old[0] != body_hash else []
+                orphans += self._evict()
+            self._delete_bodies(orphans)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"写入 HTTP 缓存失败: {e}")
+            return None
+        return entry
+
+    def refresh(self, entry: CacheEntry, headers: Mapping[str, str], method: str = 'GET',
+                now: Optional[float] = None) -> CacheEntry:
+        """收到 304 后用新的头部更新条目（RFC 9111 4.3.4），返回更新后的条目"""
+        now = now or time.time()
+        merged = dict(entry.headers)
+        merged.update({name: value for name, value in _lower_headers(headers).items()
+                       if name not in _UNSTORED_HEADERS})
+        # 304 没带 Date 时，旧的 Date 会让刚验证过的条目看起来已经很老
+        if 'date' not in _lower_headers(headers):
+            merged['date'] = formatdate(now, usegmt=True)
+        entry.headers = merged
+        entry.stored_at = now
+        entry.expires_at = now + self.freshness_lifetime(entry.url, merged, now)
+        try:
+            with self._lock, self._db:
+                self._db.execute(
+                    'UPDATE entries SET headers = ?, stored_at = ?, expires_at = ?, last_access = ? WHERE key = ?',
+                    (json.dumps(merged), now, entry.expires_at, now, self.key(method, entry.url))
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"更新 HTTP 缓存失败: {e}")
+        return entry
+
+    def _touch(self, method: str, url: str):
+        try:
+            with self._lock, self._db:
+                self._db.execute('UPDATE entries SET last_access = ? WHERE key = ?',
+                                 (time.time(), self.key(method, url)))
+        except sqlite3.Error as e:
+            logger.debug(f"更新 HTTP 缓存访问时间失败: {e}")
+
+    def _write_body(self, body_hash: str, body: bytes):
+        path = self._body_path(body_hash)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{body_hash}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(body)
+        tmp_path.replace(path)
+
+    def _evict(self) -> list:
+        """在持有锁和事务的情况下按最近访问时间淘汰条目，返回可能已无引用的 body_hash"""
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        evicted = []
+        if total <= self.max_bytes:
+            return evicted
+        for key, body_hash, size in self._db.execute(
+                'SELECT key, body_hash, size FROM entries ORDER BY last_access').fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            evicted.append(body_hash)
+            total -= size
+        return evicted
+
+    def _delete_bodies(self, body_hashes):
+        for body_hash in set(body_hashes):
+            with self._lock:
+                referenced = self._db.execute('SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1',
+                                              (body_hash,)).fetchone()
+            if not referenced:
+                try:
+                    self._body_path(body_hash).unlink()
+                except FileNotFoundError:
+                    pass
+
+    def total_size(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._db:
+            hashes = [row[0] for row in self._db.execute('SELECT DISTINCT body_hash FROM entries')]
+            self._db.execute('DELETE FROM entries')
+        self._delete_bodies(hashes)
+
+
+_cache: Optional[HTTPCache] = None
+_cache_lock = threading.Lock()
+
+
+def http_cache_enabled() -> bool:
+    return os.getenv('HTTP_CACHE', '1').lower() not in ('0', 'false', 'no', 'off')
+
+
+def get_http_cache() -> Optional[HTTPCache]:
+    """返回进程内共享的 HTTPCache；设置 HTTP_CACHE=0 时关闭缓存，返回 None"""
+    global _cache
+    if not http_cache_enabled():
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = HTTPCache()
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning(f"初始化 HTTP 缓存失败，不使用缓存: {e}")
+                    return None
+    return _cache
@@ -0,0 +1,524 @@
+"""
+Shared pooled HTTP clients for crawlers and search
+
+- `get_session()` returns a process-wide `requests.Session` with keep-alive
+  pools, per-host connection limits, retries and an enforced default timeout.
+- `AsyncSessionHolder` lazily creates one `aiohttp.ClientSession` per event
+  loop with DNS caching and per-host limits, so every request a crawler makes
+  on that loop reuses the same connections (and TLS handshakes).
+
+Both the requests session and the aiohttp sessions go through the on-disk
+`HTTPCache` (see `http_cache.py`) unless `HTTP_CACHE=0`. Streamed bodies are
+only stored once they have been read to the end. When a cassette is active
+(see `cassette.py`) the cache is bypassed and requests are recorded or
+replayed instead. With `PROXY_POOL` set, aiohttp requests that reach the
+network go through the proxy pool (see `proxy_routing.py`).
+
+`ACCEPT_ENCODING` only advertises `br` when a brotli decoder is installed,
+both urllib3 and aiohttp decode it transparently in that case.
+"""
+import asyncio
+import io
+import json
+import ssl
+import threading
+import time
+import logging
+from http import HTTPStatus
+from typing import Dict, Mapping, Optional
+
+import aiohttp
+import requests
+from multidict import CIMultiDict, CIMultiDictProxy
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.util.retry import Retry
+from yarl import URL
+
+from .cassette import Cassette, clean_headers, get_cassette
+from .http_cache import CacheEntry, HTTPCache, get_http_cache
+from .proxy_routing import ProxiedRequest, ProxyRouter, get_proxy_router
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 15
+CONNECT_TIMEOUT = 5
+POOL_CONNECTIONS = 20       # 缓存的 host 连接池数量
+POOL_MAXSIZE_PER_HOST = 10  # 每个 host 的最大连接数
+DNS_CACHE_TTL = 300
+
+
+def _has_module(name: str) -> bool:
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+
+HAS_BROTLI = _has_module('brotli') or _has_module('brotlicffi')
+ACCEPT_ENCODING = 'gzip, deflate, br' if HAS_BROTLI else 'gzip, deflate'
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """requests 的 Session 没有全局超时，在适配器上补一个默认值"""
+
+    def __init__(self, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+_CONDITIONAL_HEADERS = ('if-none-match', 'if-modified-since')
+
+
+def _is_conditional(headers) -> bool:
+    """调用方自己带了条件请求头时不经过缓存，304 要原样交给它"""
+    return any(name.lower() in _CONDITIONAL_HEADERS for name in (headers or {}))
+
+
+def _reason(status: int) -> str:
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return ''
+
+
+class _TeeRaw:
+    """包装 urllib3 响应：响应体被完整读完后把（解码后的）内容交给 on_complete"""
+
+    def __init__(self, raw, on_complete):
+        self._raw = raw
+        self._on_complete = on_complete
+
+    def stream(self, amt=2 ** 16, decode_content=None):
+        chunks = []
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            chunks.append(chunk)
+            yield chunk
+        # 提前停止读取的流式响应不会走到这里，也就不会缓存不完整的内容
+        self._on_complete(b''.join(chunks))
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class CachingHTTPAdapter(TimeoutHTTPAdapter):
+    """GET 请求先查 HTTPCache：新鲜的条目直接返回，过期的带上条件请求头重新验证。
+    启用录制带时改为录制或回放全部请求。"""
+
+    def __init__(self, *args, cache: Optional[HTTPCache] = None, **kwargs):
+        self.cache = cache
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        cassette = get_cassette()
+        if cassette is not None and hasattr(request, 'method'):
+            return self._send_cassette(cassette, request, **kwargs)
+        if self.cache is None or getattr(request, 'method', None) != 'GET' or _is_conditional(request.headers):
+            return super().send(request, **kwargs)
+
+        entry = self.cache.lookup(request.url, request.headers)
+        if entry is not None and entry.is_fresh():
+            cached = self._cached_response(request, entry)
+            if cached is not None:
+                return cached
+        if entry is not None:
+            request.headers.update(entry.validators())
+
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            cached = self._cached_response(request, self.cache.refresh(entry, response.headers))
+            if cached is not None:
+                response.close()
+                return cached
+        elif self.cache.storable('GET', response.status_code, response.headers):
+            url, status = request.url, response.status_code
+            headers, request_headers = dict(response.headers), dict(request.headers)
+            response.raw = _TeeRaw(
+                response.raw, lambda body: self.cache.store(url, status, headers, body, request_headers))
+        return response
+
+    def _send_cassette(self, cassette: Cassette, request, **kwargs) -> requests.Response:
+        body = request.body.encode('utf-8') if isinstance(request.body, str) else request.body
+        if cassette.replaying:
+            interaction = cassette.replay_http(request.method, request.url, body)
+            time.sleep(cassette.delay(interaction))
+            return self._build_response(request, interaction['status'], interaction['headers'],
+                                        interaction['content'])
+        started = time.monotonic()
+        response = super().send(request, **kwargs)
+        # 录制时总是读完整个响应体，流式读取的调用方拿到的是内存里的内容
+        content = response.content
+        cassette.record_http(request.method, request.url, body, response.status_code, response.headers,
+                             content, started, time.monotonic() - started)
+        return response
+
+    def _cached_response(self, request, entry: CacheEntry) -> Optional[requests.Response]:
+        body = self.cache.body(entry)
+        if body is None:
+            return None
+        return self._build_response(request, entry.status, entry.headers, body)
+
+    def _build_response(self, request, status: int, headers: Mapping[str, str], body: bytes) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.reason = _reason(status)
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(body)
+        response._content = body
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.from_cache = True
+        return response
+
+
+def create_session(timeout: float = DEFAULT_TIMEOUT, retries: int = 3,
+                   pool_maxsize: int = POOL_MAXSIZE_PER_HOST,
+                   http_cache: Optional[HTTPCache] = None) -> requests.Session:
+    """http_cache: 传入 HTTPCache 时 GET 响应会按 HTTP 缓存语义存取"""
+    retry_strategy = Retry(
+        total=retries,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['HEAD', 'GET', 'OPTIONS'],
+    )
+    adapter = CachingHTTPAdapter(
+        cache=http_cache,
+        timeout=timeout,
+        max_retries=retry_strategy,
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize,
+        pool_block=True,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+    return session
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """返回进程内共享的 requests.Session"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session(http_cache=get_http_cache())
+    return _session
+
+
+_ssl_context: Optional[ssl.SSLContext] = None
+
+
+def _get_ssl_context() -> ssl.SSLContext:
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+        try:
+            import certifi
+            _ssl_context.load_verify_locations(certifi.where())
+        except ImportError:
+            pass
+    return _ssl_context
+
+
+def create_async_session(headers: Optional[Dict[str, str]] = None,
+                         timeout: float = DEFAULT_TIMEOUT,
+                         limit_per_host: int = POOL_MAXSIZE_PER_HOST) -> aiohttp.ClientSession:
+    """创建带连接池、DNS 缓存和超时的 aiohttp 会话，必须在事件循环中调用"""
+    connector = aiohttp.TCPConnector(
+        limit=100,
+        limit_per_host=limit_per_host,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=30,
+        ssl=_get_ssl_context(),
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers={'Accept-Encoding': ACCEPT_ENCODING, **(headers or {})},
+        timeout=aiohttp.ClientTimeout(total=timeout, connect=CONNECT_TIMEOUT),
+    )
+
+
+class _CachedContent:
+    def __init__(self, body: bytes):
+        self._stream = io.BytesIO(body)
+
+    async def read(self, n: int = -1) -> bytes:
+        return self._stream.read(n)
+
+    async def iter_chunked(self, n: int):
+        while True:
+            chunk = self._stream.read(n)
+            if not chunk:
+                return
+            yield chunk
+
+
+class CachedResponse:
+    """从 HTTPCache 或录制带取出的响应，提供爬虫用到的那部分 aiohttp.ClientResponse 接口"""
+
+    from_cache = True
+    proxy_exit = None
+
+    def __init__(self, url: URL, status: int, headers: Mapping[str, str], body: bytes):
+        self.url = url
+        self.status = status
+        self.reason = _reason(status)
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self.content = _CachedContent(body)
+        self._body = body
+
+    @property
+    def charset(self) -> Optional[str]:
+        for param in self.headers.get('Content-Type', '').split(';')[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'charset':
+                return value.strip('"') or None
+        return None
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self, encoding: Optional[str] = None, errors: str = 'strict') -> str:
+        return self._body.decode(encoding or self.charset or 'utf-8', errors)
+
+    async def json(self, *, encoding: Optional[str] = None, loads=json.loads, content_type=None):
+        return loads(await self.text(encoding))
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(None, (), status=self.status, message=self.reason)
+
+    def release(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
+class _TeeContent:
+    def __init__(self, content, on_complete):
+        self._content = content
+        self._on_complete = on_complete
+
+    async def iter_chunked(self, n: int):
+        chunks = []
+        async for chunk in self._content.iter_chunked(n):
+            chunks.append(chunk)
+            yield chunk
+        self._on_complete(b''.join(chunks))
+
+    def __getattr__(self, name):
+        return getattr(self._content, name)
+
+
+class _TeeResponse:
+    """包装 aiohttp 响应：read/text/json 或 iter_chunked 读完响应体后写入缓存"""
+
+    def __init__(self, response: aiohttp.ClientResponse, on_complete):
+        self._response = response
+        self._on_complete = on_complete
+        self._stored = False
+        self.content = _TeeContent(response.content, self._complete)
+
+    def _complete(self, body: bytes):
+        if not self._stored:
+            self._stored = True
+            self._on_complete(body)
+
+    async def read(self) -> bytes:
+        body = await self._response.read()
+        self._complete(body)
+        return body
+
+    async def text(self, encoding: Optional[str] = None, errors: str = 'strict') -> str:
+        await self.read()
+        return await self._response.text(encoding, errors)
+
+    async def json(self, **kwargs):
+        await self.read()
+        return await self._response.json(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class _CachingRequest:
+    """session.get() 的返回值，和 aiohttp 一样既可以 async with 也可以 await"""
+
+    def __init__(self, client: 'CachingClientSession', url, kwargs):
+        self._client = client
+        self._url = url
+        self._kwargs = kwargs
+        self._request = None
+
+    async def _send(self):
+        session, cache = self._client.session, self._client.cache
+        kwargs = dict(self._kwargs)
+        headers = dict(kwargs.pop('headers', None) or {})
+        url = URL(str(self._url))
+        params = kwargs.pop('params', None)
+        if params:
+            url = url.extend_query(params)
+
+        cassette = get_cassette()
+        if cassette is not None:
+            return await self._send_cassette(cassette, session, url, headers, kwargs)
+        if cache is None:
+            return await self._open(session, url, headers, kwargs)
+
+        conditional = _is_conditional(headers)
+        request_headers = {**session.headers, **headers}
+        entry = None if conditional else cache.lookup(str(url), request_headers)
+        if entry is not None and entry.is_fresh():
+            body = cache.body(entry)
+            if body is not None:
+                return CachedResponse(url, entry.status, entry.headers, body)
+        if entry is not None:
+            headers.update(entry.validators())
+
+        response = await self._open(session, url, headers, kwargs)
+        if response.status == 304 and entry is not None:
+            body = cache.body(entry)
+            if body is not None:
+                response.release()
+                entry = cache.refresh(entry, response.headers)
+                return CachedResponse(url, entry.status, entry.headers, body)
+        elif not conditional and cache.storable('GET', response.status, response.headers):
+            status, response_headers = response.status, response.headers
+            return _TeeResponse(response, lambda body: cache.store(
+                str(url), status, response_headers, body, request_headers))
+        return response
+
+    async def _open(self, session, url: URL, headers, kwargs) -> aiohttp.ClientResponse:
+        """真正发出请求；启用代理池时经由该站点的代理，并把结果报告给代理池"""
+        router = self._client.proxy_router
+        proxy = await router.acquire(str(url)) if router is not None and 'proxy' not in kwargs else None
+        if proxy is None:
+            self._request = session.get(url, headers=headers, **kwargs)
+            return await self._request.__aenter__()
+        proxied = ProxiedRequest(router, proxy, str(url))
+        self._request = session.get(url, headers=headers, proxy=proxy.url, **kwargs)
+        try:
+            response = await self._request.__aenter__()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._request = None
+            await proxied.failed(e)
+            raise
+        await proxied.done(response.status)
+        # 让爬虫在响应体里发现风控时能把结果报告给服务这次请求的出口
+        response.proxy_exit = proxy
+        return response
+
+    async def _send_cassette(self, cassette: Cassette, session, url: URL, headers, kwargs) -> CachedResponse:
+        if cassette.replaying:
+            interaction = cassette.replay_http('GET', str(url))
+            await asyncio.sleep(cassette.delay(interaction))
+            return CachedResponse(url, interaction['status'], interaction['headers'], interaction['content'])
+        started = time.monotonic()
+        async with session.get(url, headers=headers, **kwargs) as response:
+            content = await response.read()
+            status, response_headers = response.status, clean_headers(response.headers)
+        cassette.record_http('GET', str(url), None, status, response_headers, content,
+                             started, time.monotonic() - started)
+        # 录制时已读完响应体，用内存里的内容回给调用方，流式读取也能照常工作
+        return CachedResponse(url, status, response_headers, content)
+
+    def __await__(self):
+        return self._send().__await__()
+
+    async def __aenter__(self):
+        return await self._send()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._request is not None:
+            await self._request.__aexit__(exc_type, exc, tb)
+
+
+class CachingClientSession:
+    """给 aiohttp 会话的 GET 请求加上 HTTPCache、录制带和代理池，其余属性和方法直接转给原会话"""
+
+    def __init__(self, session: aiohttp.ClientSession, cache: Optional[HTTPCache],
+                 proxy_router: Optional[ProxyRouter] = None):
+        self.session = session
+        self.cache = cache
+        self.proxy_router = proxy_router
+
+    def get(self, url, **kwargs) -> _CachingRequest:
+        return _CachingRequest(self, url, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+class AsyncSessionHolder:
+    """每个事件循环复用一个 aiohttp 会话
+
+    同步入口通过 asyncio.run 调用异步代码时每次都是新的事件循环，
+    旧循环上的会话无法继续使用，这里会自动换成新的会话。
+    """
+
+    def __init__(self, http_cache: Optional[HTTPCache] = None, use_http_cache: bool = True,
+                 proxy_router: Optional[ProxyRouter] = None, use_proxy_pool: bool = True,
+                 **session_kwargs):
+        """
+        http_cache: 默认使用进程内共享的 HTTPCache，use_http_cache=False 时不缓存
+        proxy_router: 默认在设置了 PROXY_POOL 时使用共享的 ProxyRouter，use_proxy_pool=False 时直连
+        """
+        self.session_kwargs = session_kwargs
+        self.http_cache = http_cache if http_cache is not None else (
+            get_http_cache() if use_http_cache else None)
+        self.proxy_router = proxy_router if proxy_router is not None else (
+            get_proxy_router() if use_proxy_pool else None)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._client = None
+        self._loop = None
+
+    def get(self) -> CachingClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            if self._session is not None and not self._session.closed:
+                # 旧循环已结束，连接不能再用，只需丢弃
+                self._session.detach()
+            self._session = create_async_session(**self.session_kwargs)
+            self._client = CachingClientSession(self._session, self.http_cache, self.proxy_router)
+            self._loop = loop
+        return self._client
+
+    async def close(self):
+        if self._session is not None and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+        self._client = None
+        self._loop = None
+
+
+def run_with_sessions(coro, *holders: AsyncSessionHolder):
+    """在新的事件循环中运行协程，结束时关闭这些会话（供同步入口使用）"""
+    async def runner():
+        try:
+            return await coro
+        finally:
+            for holder in holders:
+                await holder.close()
+    return asyncio.run(runner())
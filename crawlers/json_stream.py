@@ -0,0 +1,217 @@
+"""
+Incremental JSON extraction for crawler responses
+
+Crawlers usually need one array or object out of a large response. These
+helpers scan the body chunk by chunk, parse only the pieces that are asked
+for and let the caller stop reading as soon as it has enough.
+"""
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator, List, Optional
+
+_STRUCTURAL = re.compile(r'["{}\[\]]')
+_STRING_END = re.compile(r'["\\]')
+_SEPARATORS = ' \t\r\n,'
+# 页面内嵌的 JS 对象里常见的 undefined，只替换字符串以外的部分
+_JS_UNDEFINED = re.compile(r'(?<=[:\[,])\s*undefined(?=\s*[,}\]])')
+_JS_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_DECODER = json.JSONDecoder()
+
+
+def decode_chunks(chunks: Iterable[bytes], encoding: str = 'utf-8') -> Iterator[str]:
+    """把字节块解码为文本块，多字节字符可以跨块"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+class BracketMatcher:
+    """跨文本块跟踪 {} / [] 的嵌套深度，忽略字符串中的括号"""
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+
+    def feed(self, text: str, start: int = 0) -> int:
+        """从 start 开始扫描 text，返回最外层括号闭合后的位置；尚未闭合时返回 -1"""
+        pos = start
+        length = len(text)
+        while pos < length:
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                    pos += 1
+                    continue
+                match = _STRING_END.search(text, pos)
+                if not match:
+                    return -1
+                pos = match.end()
+                if match.group() == '\\':
+                    self.escape = True
+                else:
+                    self.in_string = False
+                continue
+            match = _STRUCTURAL.search(text, pos)
+            if not match:
+                return -1
+            pos = match.end()
+            ch = match.group()
+            if ch == '"':
+                self.in_string = True
+            elif ch in '{[':
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    return pos
+        return -1
+
+
+class ArrayItemParser:
+    """推送式解析：不断 feed 文本块，返回其中已完整的 `"key": [...]` 数组元素。
+
+    同步和异步读取响应体时共用；`done` 为 True 表示数组已经结束。
+    """
+
+    def __init__(self, key: str):
+        self.pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        # 保留足够的尾部，避免键名被切在两个块之间
+        self.keep = len(key) + 32
+        self.found = False
+        self.done = False
+        self.buf = ''
+        self.pos = 0
+        self.start = None
+        self.matcher = None
+
+    def feed(self, text: str) -> List[Any]:
+        if self.done:
+            return []
+        self.buf += text
+        if not self.found:
+            match = self.pattern.search(self.buf)
+            if not match:
+                self.buf = self.buf[-self.keep:]
+                return []
+            self.found = True
+            self.buf = self.buf[match.end():]
+        return self._scan()
+
+    def _scan(self) -> List[Any]:
+        items = []
+        buf, pos = self.buf, self.pos
+        while True:
+            if self.matcher is None:
+                while pos < len(buf) and buf[pos] in _SEPARATORS:
+                    pos += 1
+                if pos >= len(buf):
+                    buf, pos = '', 0
+                    break
+                ch = buf[pos]
+                if ch == ']':
+                    self.done = True
+                    buf, pos = '', 0
+                    break
+                if ch in '{[':
+                    self.matcher = BracketMatcher()
+                    self.start = pos
+                else:
+                    try:
+                        value, end = _DECODER.raw_decode(buf, pos)
+                    except ValueError:
+                        end = None
+                    # 数字可能还没读完，后面出现分隔符才算完整
+                    if end is not None and end < len(buf) and buf[end] in _SEPARATORS + ']':
+                        items.append(value)
+                        buf, pos = buf[end:], 0
+                        continue
+                    break
+            end = self.matcher.feed(buf, pos)
+            if end == -1:
+                pos = len(buf)
+                break
+            items.append(json.loads(buf[self.start:end]))
+            buf, pos = buf[end:], 0
+            self.matcher = None
+        self.buf, self.pos = buf, pos
+        return items
+
+
+def iter_array_items(texts: Iterable[str], key: str) -> Iterator[Any]:
+    """逐个产出第一个 `"key": [...]` 数组中的元素。
+
+    只在需要时从 texts 读取下一块；调用方停止迭代后不会再读取后续内容。
+    数组缺失或响应被截断时直接结束。
+    """
+    parser = ArrayItemParser(key)
+    for text in texts:
+        yield from parser.feed(text)
+        if parser.done:
+            return
+
+
+class ObjectExtractor:
+    """推送式查找 prefix 之后的 {...} 对象；对象闭合后 `result` 为其原文"""
+
+    def __init__(self, prefix: str, max_prefix_len: int = 256):
+        self.pattern = re.compile(prefix)
+        self.max_prefix_len = max_prefix_len
+        self.buf = ''
+        self.matcher: Optional[BracketMatcher] = None
+        self.parts: List[str] = []
+        self.result: Optional[str] = None
+
+    def feed(self, text: str) -> Optional[str]:
+        if self.result is not None:
+            return self.result
+        if self.matcher is None:
+            self.buf += text
+            match = self.pattern.search(self.buf)
+            if not match:
+                self.buf = self.buf[-self.max_prefix_len:]
+                return None
+            text = self.buf[match.end() - 1:]
+            self.buf = ''
+            self.matcher = BracketMatcher()
+        end = self.matcher.feed(text)
+        if end == -1:
+            # 已扫描过的部分不再重复扫描，只攒起来
+            self.parts.append(text)
+            return None
+        self.parts.append(text[:end])
+        self.result = ''.join(self.parts)
+        self.parts = []
+        return self.result
+
+
+def extract_object(texts: Iterable[str], prefix: str, max_prefix_len: int = 256) -> Optional[str]:
+    """返回第一个匹配 prefix 正则之后的 {...} 对象原文。
+
+    prefix 需要以 `\\{` 结尾，例如 `window\\.__INITIAL_STATE__\\s*=\\s*\\{`。
+    对象闭合后立即返回，不再读取后续内容；找不到或内容被截断时返回 None。
+    """
+    extractor = ObjectExtractor(prefix, max_prefix_len)
+    for text in texts:
+        result = extractor.feed(text)
+        if result is not None:
+            return result
+    return None
+
+
+def loads_js_object(text: str) -> Any:
+    """解析页面脚本里赋值的对象字面量（允许 undefined）"""
+    parts = []
+    pos = 0
+    for match in _JS_STRING.finditer(text):
+        parts.append(_JS_UNDEFINED.sub('null', text[pos:match.start()]))
+        parts.append(match.group())
+        pos = match.end()
+    parts.append(_JS_UNDEFINED.sub('null', text[pos:]))
+    return json.loads(''.join(parts))
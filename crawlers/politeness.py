@@ -0,0 +1,144 @@
+"""
+Per-host politeness scheduler shared by all crawlers
+
+Each host gets its own token bucket. Crawlers `await scheduler.wait(url)`
+(or call `wait_sync` from threads) before a request, then `report` the
+outcome: throttling signals widen the host's interval, successes slowly
+shrink it back towards the configured minimum. Waits are skipped while a
+cassette is being replayed, since no request reaches the host.
+"""
+import asyncio
+import random
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from .cassette import replaying
+
+logger = logging.getLogger(__name__)
+
+# HTTP 状态码和 Bilibili 业务码中表示被限流/风控的取值
+THROTTLE_STATUS = {429, 412}
+THROTTLE_CODES = {-799, -412}
+
+
+@dataclass
+class HostPolicy:
+    min_interval: float = 1.0
+    max_interval: float = 60.0
+    jitter: Tuple[float, float] = (0.0, 1.0)
+    burst: int = 1
+
+
+# 与原先各爬虫里的 sleep 区间保持同一量级
+DEFAULT_POLICIES = {
+    'news.ycombinator.com': HostPolicy(min_interval=1.0, jitter=(0.5, 2.0)),
+    # Bilibili 的UP主请求并发进行，允许小突发，被风控后按 -799/-412 自动退避
+    'api.bilibili.com': HostPolicy(min_interval=0.5, max_interval=120.0, jitter=(0.1, 0.5), burst=4),
+    'www.xiaohongshu.com': HostPolicy(min_interval=2.0, jitter=(1.0, 2.0)),
+    'm.weibo.cn': HostPolicy(min_interval=1.0, jitter=(0.0, 1.0)),
+}
+
+
+class _HostState:
+    def __init__(self, policy: HostPolicy):
+        self.policy = policy
+        self.interval = policy.min_interval
+        self.tokens = float(policy.burst)
+        self.updated = time.monotonic()
+
+
+def host_of(url_or_host: str) -> str:
+    if '//' in url_or_host:
+        return urlparse(url_or_host).hostname or url_or_host
+    return url_or_host
+
+
+def is_throttled(status: Optional[int] = None, code: Optional[int] = None) -> bool:
+    return status in THROTTLE_STATUS or code in THROTTLE_CODES
+
+
+class PolitenessScheduler:
+    def __init__(self, policies: Optional[Dict[str, HostPolicy]] = None,
+                 default_policy: Optional[HostPolicy] = None,
+                 backoff_factor: float = 2.0, recovery_factor: float = 0.8):
+        self.policies = dict(DEFAULT_POLICIES if policies is None else policies)
+        self.default_policy = default_policy or HostPolicy()
+        self.backoff_factor = backoff_factor
+        self.recovery_factor = recovery_factor
+        self._hosts: Dict[str, _HostState] = {}
+        # 只保护内存中的计数，不会在持锁时等待
+        self._lock = threading.Lock()
+
+    def configure(self, host: str, policy: HostPolicy):
+        with self._lock:
+            self.policies[host] = policy
+            self._hosts.pop(host, None)
+
+    def _state(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = _HostState(self.policies.get(host, self.default_policy))
+            self._hosts[host] = state
+        return state
+
+    def reserve(self, url_or_host: str) -> float:
+        """预约一个请求名额，返回调用方需要等待的秒数"""
+        host = host_of(url_or_host)
+        with self._lock:
+            state = self._state(host)
+            now = time.monotonic()
+            state.tokens = min(state.policy.burst, state.tokens + (now - state.updated) / state.interval)
+            state.updated = now
+            # 令牌可以透支，后来的请求依次排在更晚的时间点
+            state.tokens -= 1
+            if state.tokens >= 0:
+                return 0.0
+            return -state.tokens * state.interval + random.uniform(*state.policy.jitter)
+
+    async def wait(self, url_or_host: str):
+        delay = self.reserve(url_or_host)
+        if delay > 0 and not replaying():
+            logger.debug(f"Waiting {delay:.2f}s before requesting {host_of(url_or_host)}")
+            await asyncio.sleep(delay)
+
+    def wait_sync(self, url_or_host: str):
+        delay = self.reserve(url_or_host)
+        if delay > 0 and not replaying():
+            logger.debug(f"Waiting {delay:.2f}s before requesting {host_of(url_or_host)}")
+            time.sleep(delay)
+
+    def report(self, url_or_host: str, status: Optional[int] = None, code: Optional[int] = None,
+               throttled: Optional[bool] = None):
+        """根据响应调整该 host 的请求间隔"""
+        if throttled is None:
+            throttled = is_throttled(status, code)
+        host = host_of(url_or_host)
+        with self._lock:
+            state = self._state(host)
+            policy = state.policy
+            if throttled:
+                state.interval = min(policy.max_interval, state.interval * self.backoff_factor)
+                # 清空令牌，后续请求按新间隔排队
+                state.tokens = min(state.tokens, 0.0)
+                logger.warning(f"{host} is throttling requests, interval raised to {state.interval:.1f}s")
+            elif status is None or status < 400:
+                state.interval = max(policy.min_interval, state.interval * self.recovery_factor)
+
+    def interval(self, url_or_host: str) -> float:
+        with self._lock:
+            return self._state(host_of(url_or_host)).interval
+
+
+_scheduler: Optional[PolitenessScheduler] = None
+
+
+def get_scheduler() -> PolitenessScheduler:
+    """返回进程内共享的调度器"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = PolitenessScheduler()
+    return _scheduler
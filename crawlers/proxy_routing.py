@@ -0,0 +1,170 @@
+"""
+Route crawler requests through the proxy pool, with sticky exits per site
+
+Opt-in: `get_proxy_router()` returns None unless `PROXY_POOL` is set, to
+`1`/`all` for every site or to a comma separated list of sites such as
+`bilibili.com,xiaohongshu.com`. `AsyncSessionHolder` picks the router up
+automatically, so every crawler using the shared aiohttp client is covered.
+
+Each site keeps up to `exits_per_host` exits and spreads its requests over
+them round robin; an exit stays assigned (and its keep-alive connections in
+the shared connector stay warm) until a request through it fails or the site
+throttles it, then the next request asks `ProxyManager.get_proxy` for a
+replacement; the retired exit is not handed to that site again for
+`cooldown` seconds. Every outcome is reported to `ProxyManager.report_result` with
+the site and the time to response headers. When the pool has no usable exit
+for a site, its requests go direct. The synchronous `requests` fallbacks are not routed.
+"""
+import os
+import time
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from proxy_pool import Proxy, ProxyManager
+from proxy_pool.health import host_key
+
+from .politeness import is_throttled
+
+logger = logging.getLogger(__name__)
+
+# 代理自身出问题时常见的状态码，和 5xx 一样算作这个出口的失败
+PROXY_ERROR_STATUS = {407}
+# 换出口时最多向代理池要几次，跳过还在冷却中的出口
+ACQUIRE_ATTEMPTS = 3
+
+
+class ProxyRouter:
+    def __init__(self, manager: ProxyManager, hosts: Optional[Iterable[str]] = None,
+                 exits_per_host: int = 1, cooldown: float = 300.0):
+        """
+        hosts: 走代理的站点（URL、主机名或 weibo.cn 这样的站点名），None 表示全部
+        exits_per_host: 每个站点同时使用的出口数，请求在这些出口间轮流分配
+        cooldown: 出口因失败或限流被换下后，这么多秒内不再分配给同一站点
+        """
+        self.manager = manager
+        self.hosts = {host_key(host) for host in hosts} if hosts is not None else None
+        self.exits_per_host = max(1, exits_per_host)
+        self.cooldown = cooldown
+        self._exits: Dict[str, List[Proxy]] = {}
+        self._turn: Dict[str, int] = {}
+        self._retired: Dict[Tuple[str, tuple], float] = {}
+
+    def handles(self, url: str) -> bool:
+        return self.hosts is None or host_key(url) in self.hosts
+
+    async def acquire(self, url: str) -> Optional[Proxy]:
+        """返回访问 url 应该使用的代理；不走代理或池为空时返回 None"""
+        if not self.handles(url):
+            return None
+        # 同步入口每次都是新的事件循环，在当前循环上确保后台刷新和落盘任务在运行
+        await self.manager.start()
+        host = host_key(url)
+        exits = [p for p in self._exits.get(host, []) if p.is_active]
+        if len(exits) < self.exits_per_host:
+            proxy = await self._new_exit(host, exits)
+            if proxy is not None:
+                exits.append(proxy)
+                logger.debug(f"{host} 分配代理出口 {proxy.host}:{proxy.port}")
+        self._exits[host] = exits
+        if not exits:
+            return None
+        turn = self._turn.get(host, 0)
+        self._turn[host] = turn + 1
+        return exits[turn % len(exits)]
+
+    async def _new_exit(self, host: str, exits: List[Proxy]) -> Optional[Proxy]:
+        now = time.monotonic()
+
+        def usable(proxy: Proxy) -> bool:
+            return all(p.key != proxy.key for p in exits) and self._retired.get((host, proxy.key), 0) <= now
+
+        for _ in range(ACQUIRE_ATTEMPTS):
+            proxy = await self.manager.get_proxy(host)
+            if proxy is None:
+                return None
+            if usable(proxy):
+                return proxy
+        # 二选一总是抽到冷却中的出口时（池很小），按快照顺序找一个能用的
+        return next((p for p in self.manager.snapshot.proxies if usable(p)), None)
+
+    def rotate(self, url: str, proxy: Optional[Proxy] = None):
+        """不再让 url 所在站点使用这个出口（默认全部出口），下次请求换新的"""
+        host = host_key(url)
+        exits = self._exits.get(host, [])
+        now = time.monotonic()
+        until = now + self.cooldown
+        self._retired = {k: v for k, v in self._retired.items() if v > now}
+        for p in exits:
+            if proxy is None or p.key == proxy.key:
+                self._retired[(host, p.key)] = until
+        if proxy is not None:
+            self._retired[(host, proxy.key)] = until
+        self._exits[host] = [p for p in exits if proxy is not None and p.key != proxy.key]
+
+    async def report(self, proxy: Proxy, url: str, status: Optional[int] = None,
+                     error: Optional[BaseException] = None, latency_ms: Optional[float] = None,
+                     code: Optional[int] = None):
+        """报告一次经由 proxy 的请求结果；失败或被限流时只换掉这个出口
+
+        code: 响应体里的业务码，HTTP 200 但业务码表示风控（如 Bilibili 的 -412）时由爬虫传入
+        """
+        throttled = is_throttled(status, code)
+        failed = (error is not None or throttled or status is None
+                  or status >= 500 or status in PROXY_ERROR_STATUS)
+        if failed:
+            if error is not None:
+                reason = repr(error)
+            else:
+                reason = f"HTTP {status}" + (f" code {code}" if code is not None else "")
+            await self.manager.report_result(proxy, success=False, error_message=reason,
+                                             host=url, latency_ms=latency_ms)
+            self.rotate(url, proxy)
+            logger.info(f"{host_key(url)} 经由 {proxy.host}:{proxy.port} 的请求失败（{reason}），更换出口")
+        else:
+            await self.manager.report_result(proxy, success=True, host=url, latency_ms=latency_ms)
+
+
+class ProxiedRequest:
+    """记录一次经由代理的请求从发出到收到响应头的耗时"""
+
+    def __init__(self, router: ProxyRouter, proxy: Proxy, url: str):
+        self.router = router
+        self.proxy = proxy
+        self.url = url
+        self.started = time.monotonic()
+
+    async def done(self, status: int):
+        await self.router.report(self.proxy, self.url, status=status,
+                                 latency_ms=(time.monotonic() - self.started) * 1000)
+
+    async def failed(self, error: BaseException):
+        await self.router.report(self.proxy, self.url, error=error)
+
+
+_router: Optional[ProxyRouter] = None
+_router_lock = threading.Lock()
+
+
+def proxy_pool_hosts() -> Optional[List[str]]:
+    """解析 PROXY_POOL：未设置或为 0 时返回 None，1/all 返回空列表表示全部站点"""
+    value = os.getenv('PROXY_POOL', '').strip().lower()
+    if value in ('', '0', 'false', 'no', 'off'):
+        return None
+    if value in ('1', 'true', 'yes', 'on', 'all'):
+        return []
+    return [host.strip() for host in value.split(',') if host.strip()]
+
+
+def get_proxy_router() -> Optional[ProxyRouter]:
+    """返回进程内共享的 ProxyRouter；没有设置 PROXY_POOL 时返回 None"""
+    global _router
+    hosts = proxy_pool_hosts()
+    if hosts is None:
+        return None
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                exits = int(os.getenv('PROXY_POOL_EXITS', '1'))
+                _router = ProxyRouter(ProxyManager(), hosts=hosts or None, exits_per_host=exits)
+    return _router
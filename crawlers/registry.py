@@ -0,0 +1,253 @@
+"""
+Async crawler protocol and source registry
+
+Every source exposes `async def fetch(limit)` yielding items. Crawler classes
+register themselves with `@register_source(name)`; `discover()` imports every
+module under `crawlers/` so entry points only name the sources they want.
+Crawlers that only have a blocking `fetch_trending` are wrapped in
+`SyncCrawlerAdapter`, which runs them in a worker thread. Passing a
+`RunBudget` to `fetch_sources` replaces the fixed per-source timeout with
+learned per-source deadlines inside one overall run deadline.
+"""
+import asyncio
+import importlib
+import inspect
+import pkgutil
+import threading
+import time
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Protocol, Tuple, runtime_checkable
+
+from .deadlines import RunBudget
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 5
+DEFAULT_TIMEOUT = 30
+
+
+@runtime_checkable
+class AsyncCrawler(Protocol):
+    def fetch(self, limit: int) -> AsyncIterator[Dict[str, Any]]:
+        ...
+
+
+_sources: Dict[str, Callable[..., Any]] = {}
+_discovered = False
+
+
+def register_source(name: str):
+    """类装饰器：以 name 注册一个内容来源，创建时用配置里的 options 作为构造参数"""
+    def decorator(factory):
+        if name in _sources and _sources[name] is not factory:
+            raise ValueError(f"内容来源 {name} 重复注册")
+        _sources[name] = factory
+        return factory
+    return decorator
+
+
+def discover(package: str = 'crawlers') -> Dict[str, Callable[..., Any]]:
+    """导入 package 下的所有模块（只做一次），返回已注册的来源"""
+    global _discovered
+    if not _discovered:
+        pkg = importlib.import_module(package)
+        for module in pkgutil.iter_modules(pkg.__path__):
+            try:
+                importlib.import_module(f'{package}.{module.name}')
+            except Exception as e:
+                # 缺少可选依赖的来源不影响其它来源
+                logger.warning(f"加载爬虫模块 {module.name} 失败: {e}")
+        _discovered = True
+    return dict(_sources)
+
+
+class SyncCrawlerAdapter:
+    """把只有同步 fetch_trending 的爬虫包装成异步来源"""
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    async def fetch(self, limit: int = DEFAULT_LIMIT) -> AsyncIterator[Dict[str, Any]]:
+        items = await asyncio.to_thread(self.crawler.fetch_trending, limit)
+        for item in items or []:
+            yield item
+
+
+def as_async(crawler) -> AsyncCrawler:
+    if inspect.isasyncgenfunction(getattr(crawler, 'fetch', None)):
+        return crawler
+    if callable(getattr(crawler, 'fetch_trending', None)):
+        return SyncCrawlerAdapter(crawler)
+    raise TypeError(f"{type(crawler).__name__} 既没有异步 fetch 也没有 fetch_trending")
+
+
+def create_source(name: str, **options) -> AsyncCrawler:
+    sources = discover()
+    if name not in sources:
+        raise KeyError(f"未知的内容来源: {name}")
+    return as_async(sources[name](**options))
+
+
+async def aclose_source(crawler):
+    """释放来源持有的连接（例如当前事件循环上的 aiohttp 会话）"""
+    close = getattr(crawler, 'aclose', None)
+    if close is not None:
+        await close()
+
+
+async def collect(crawler: AsyncCrawler, limit: int = DEFAULT_LIMIT,
+                  timeout: Optional[float] = DEFAULT_TIMEOUT, name: str = '') -> List[Dict[str, Any]]:
+    """收集最多 limit 条结果；超时或出错时返回已经拿到的部分"""
+    return (await _collect(crawler, limit, timeout, name))[0]
+
+
+async def _collect(crawler: AsyncCrawler, limit: int, timeout: Optional[float],
+                   name: str) -> Tuple[List[Dict[str, Any]], bool, bool]:
+    """返回 (items, 是否超时, 是否出错)"""
+    items: List[Dict[str, Any]] = []
+
+    async def consume():
+        stream = crawler.fetch(limit)
+        try:
+            async for item in stream:
+                items.append(item)
+                if len(items) >= limit:
+                    break
+        finally:
+            await stream.aclose()
+
+    try:
+        await asyncio.wait_for(consume(), timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"Timeout fetching from {name or type(crawler).__name__}, keeping {len(items)} items")
+        return items, True, False
+    except Exception as e:
+        logger.error(f"Error fetching from {name or type(crawler).__name__}: {str(e)}")
+        return items, False, True
+    return items, False, False
+
+
+async def _fetch_uncached(specs: Dict[str, Dict[str, Any]], timeout: Optional[float],
+                          budget: Optional[RunBudget] = None) -> Dict[str, List[Dict[str, Any]]]:
+    crawlers = {}
+    for name, spec in specs.items():
+        try:
+            crawlers[name] = create_source(name, **spec.get('options', {}))
+        except Exception as e:
+            logger.error(f"Error creating source {name}: {str(e)}")
+
+    async def run(name, crawler):
+        deadline = budget.deadline_for(name, timeout) if budget else timeout
+        started = time.monotonic()
+        try:
+            items, timed_out, failed = await _collect(crawler, specs[name].get('limit', DEFAULT_LIMIT),
+                                                      deadline, name)
+        finally:
+            await aclose_source(crawler)
+        # 立即失败（DNS 错误、403 等）的耗时不代表来源的正常耗时，不计入历史
+        if budget is not None and not failed:
+            budget.record(name, time.monotonic() - started, timed_out, len(items))
+        return items
+
+    results = await asyncio.gather(*(run(name, crawler) for name, crawler in crawlers.items()))
+    return dict(zip(crawlers, results))
+
+
+def _store(cache, specs, results):
+    for name, items in results.items():
+        # 空结果多半是上游出错，保留上一次的好结果
+        if items:
+            cache.put(name, items, specs[name].get('limit', DEFAULT_LIMIT))
+    cache.save()
+
+
+def refresh_in_background(specs: Dict[str, Dict[str, Any]], cache,
+                          timeout: Optional[float] = DEFAULT_TIMEOUT) -> Optional[threading.Thread]:
+    """在后台线程自己的事件循环里刷新这些来源，同一来源同时只有一个刷新"""
+    names = cache.claim(specs)
+    if not names:
+        return None
+    specs = {name: specs[name] for name in names}
+
+    def worker():
+        try:
+            _store(cache, specs, asyncio.run(_fetch_uncached(specs, timeout)))
+            logger.info(f"Refreshed cached sources: {', '.join(names)}")
+        except Exception as e:
+            logger.error(f"Background refresh of {', '.join(names)} failed: {str(e)}")
+        finally:
+            cache.release(names)
+
+    # 非守护线程：进程退出前刷新会完成，下次运行能用上新结果
+    thread = threading.Thread(target=worker, name='source-refresh')
+    cache.track(thread)
+    thread.start()
+    return thread
+
+
+async def fetch_sources(specs: Dict[str, Dict[str, Any]], timeout: Optional[float] = DEFAULT_TIMEOUT,
+                        cache=None, budget: Optional[RunBudget] = None,
+                        serve_stale: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+    """在同一个事件循环上并发抓取多个来源。
+
+    specs: {来源名: {'limit': 条数, 'options': 构造参数}}，格式同 config.SOURCES
+    cache: SourceResultCache；新鲜的缓存直接返回，过期不久的缓存先返回再后台刷新
+    budget: RunBudget；按各来源的历史耗时分配截止时间（没有历史时用 timeout），
+        整体不超过预算。错过截止时间的来源保留已拿到的部分并记录在 budget.late 中
+        （调用方用 late_notice 在简报末尾说明），有 cache 时还会在后台补抓，供下一次使用
+    serve_stale: False 时过期不久的缓存不直接返回，而是和更旧的缓存一样当场抓取，
+        只在抓取失败或截止时间前一条也没拿到时退回缓存。每天只跑一次的简报用这个，
+        否则前一天的结果总是刚好落在 max_stale 之内
+    """
+    try:
+        if cache is None:
+            results = await _fetch_uncached(specs, timeout, budget)
+        else:
+            results = await _fetch_cached(specs, timeout, cache, budget, serve_stale)
+    finally:
+        if budget is not None:
+            budget.save()
+    return results
+
+
+async def _fetch_cached(specs, timeout, cache, budget, serve_stale=True) -> Dict[str, List[Dict[str, Any]]]:
+    results, fallback, to_fetch, to_refresh = {}, {}, {}, {}
+    for name, spec in specs.items():
+        items, state = cache.lookup(name, spec.get('limit', DEFAULT_LIMIT))
+        if state == 'fresh':
+            results[name] = items
+        elif state == 'stale' and serve_stale:
+            results[name] = items
+            to_refresh[name] = spec
+        else:
+            if items:
+                fallback[name] = items
+            to_fetch[name] = spec
+
+    if to_fetch:
+        fetched = await _fetch_uncached(to_fetch, timeout, budget)
+        late = [name for name in (budget.late if budget is not None else {}) if name in to_fetch]
+        # 超时拿到的部分结果不当作新鲜缓存，改为在后台用更宽的时限完整抓取一次
+        _store(cache, to_fetch, {name: items for name, items in fetched.items() if name not in late})
+        if late:
+            refresh_timeout = budget.latencies.max_deadline if budget.latencies else timeout
+            refresh_in_background({name: to_fetch[name] for name in late}, cache, refresh_timeout)
+        for name in to_fetch:
+            if fetched.get(name):
+                results[name] = fetched[name]
+            elif name in fallback:
+                logger.warning(f"Fetching {name} failed, falling back to cached results")
+                results[name] = fallback[name]
+            elif name in fetched:
+                results[name] = []
+    if to_refresh:
+        logger.info(f"Serving stale results for {', '.join(to_refresh)}, refreshing in background")
+        refresh_in_background(to_refresh, cache, timeout)
+    return {name: results[name] for name in specs if name in results}
+
+
+def run_sources(specs: Dict[str, Dict[str, Any]], timeout: Optional[float] = DEFAULT_TIMEOUT,
+                cache=None, budget: Optional[RunBudget] = None,
+                serve_stale: bool = True) -> Dict[str, List[Dict[str, Any]]]:
+    """同步入口（Flask 路由、GitHub Action 脚本）使用"""
+    return asyncio.run(fetch_sources(specs, timeout, cache, budget, serve_stale))
@@ -0,0 +1,118 @@
+"""
+Per-source result cache with stale-while-revalidate semantics
+"""
+import json
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / 'cache' / 'source_results.json'
+
+
+class SourceResultCache:
+    """按来源缓存最近一次成功抓取的结果。
+
+    - 未超过 `ttl` 的结果直接使用，不发请求
+    - 超过 `ttl` 但未超过 `max_stale` 的结果先返回给调用方，同时在后台刷新
+    - 更旧或没有缓存时才同步抓取；抓取失败仍可退回到更旧的结果
+    `meta()` 给出数据的抓取时间、已过去多久以及是否正在刷新。
+    """
+
+    def __init__(self, path: Optional[Path] = None, ttl: float = 900, max_stale: float = 24 * 3600,
+                 ttls: Optional[Dict[str, float]] = None):
+        """ttls: 按来源覆盖默认 ttl，例如 {'weibo': 300}"""
+        self.path = Path(path) if path else DEFAULT_CACHE_PATH
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.ttls = dict(ttls or {})
+        self.entries: Dict[str, Dict] = {}
+        self._refreshing: set = set()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取来源结果缓存失败，重新开始: {e}")
+            self.entries = {}
+
+    def save(self):
+        with self._lock:
+            entries = dict(self.entries)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False, separators=(',', ':'))
+            tmp_path.replace(self.path)
+        except Exception as e:
+            logger.warning(f"保存来源结果缓存失败: {e}")
+
+    def ttl_for(self, name: str) -> float:
+        return self.ttls.get(name, self.ttl)
+
+    def lookup(self, name: str, limit: int, now: Optional[float] = None):
+        """返回 (items, state)，state 为 'fresh' / 'stale' / 'expired' / 'miss'"""
+        with self._lock:
+            entry = self.entries.get(name)
+        if not entry:
+            return None, 'miss'
+        age = (now or time.time()) - entry['fetched_at']
+        items = entry['items'][:limit]
+        # 缓存时取的条数比现在要的少，只能当作过期数据先用着
+        enough = entry.get('limit', 0) >= limit or len(entry['items']) >= limit
+        if age < self.ttl_for(name) and enough:
+            return items, 'fresh'
+        if age < self.max_stale:
+            return items, 'stale'
+        return items, 'expired'
+
+    def put(self, name: str, items: List[Dict[str, Any]], limit: int, now: Optional[float] = None):
+        with self._lock:
+            self.entries[name] = {'items': items, 'limit': limit, 'fetched_at': now or time.time()}
+
+    def meta(self, name: str, now: Optional[float] = None) -> Dict[str, Any]:
+        with self._lock:
+            entry = self.entries.get(name)
+            refreshing = name in self._refreshing
+        if not entry:
+            return {'cached': False, 'refreshing': refreshing}
+        age = (now or time.time()) - entry['fetched_at']
+        return {
+            'cached': True,
+            'fetched_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['fetched_at'])),
+            'age_seconds': int(age),
+            'stale': age >= self.ttl_for(name),
+            'refreshing': refreshing,
+        }
+
+    def claim(self, names) -> List[str]:
+        """标记这些来源正在刷新，返回之前没有在刷新的那部分"""
+        with self._lock:
+            claimed = [name for name in names if name not in self._refreshing]
+            self._refreshing.update(claimed)
+            return claimed
+
+    def release(self, names):
+        with self._lock:
+            self._refreshing.difference_update(names)
+
+    def track(self, thread: threading.Thread):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()] + [thread]
+
+    def wait(self, timeout: Optional[float] = None):
+        """等待后台刷新结束（测试和进程退出前使用）"""
+        with self._lock:
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(timeout)
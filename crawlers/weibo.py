@@ -1,92 +1,219 @@
 """
 Weibo hot search crawler with enhanced error handling
 """
-import requests
+import asyncio
+import codecs
+import json
+import aiohttp
 from bs4 import BeautifulSoup
 from datetime import datetime
 import traceback
-import json
+from urllib.parse import quote
+from .http_client import ACCEPT_ENCODING, AsyncSessionHolder, run_with_sessions
+from .json_stream import ArrayItemParser
+from .politeness import get_scheduler
+from .registry import register_source
+from .weibo_history import HotValueStore
+
+API_BASE = "https://m.weibo.cn/api/container/getIndex"
+
+# 榜单名称到 containerid 的映射，也可以直接传入其它 containerid
+BOARDS = {
+    'realtime': '106003type=25&t=3&disable_hot=1&filter_type=realtimehot',
+    'society': '106003type=25&t=3&disable_hot=1&filter_type=socialevent',
+    'entertainment': '106003type=25&t=3&disable_hot=1&filter_type=entrank',
+}
+
 
+def board_url(board, api_base=API_BASE):
+    containerid = BOARDS.get(board, board)
+    return f"{api_base}?containerid={quote(containerid, safe='')}"
+
+
+def merge_topics(board_topics, limit=None):
+    """按标题去重（保留热度最高的一条），再按热度降序排列"""
+    merged = {}
+    for topics in board_topics:
+        for topic in topics:
+            existing = merged.get(topic['title'])
+            if existing is None or topic['hot_value'] > existing['hot_value']:
+                merged[topic['title']] = topic
+    ranked = sorted(merged.values(), key=lambda t: t['hot_value'], reverse=True)
+    return ranked[:limit] if limit is not None else ranked
+
+
+@register_source('weibo')
 class WeiboCrawler:
-    def __init__(self):
-        self.api_url = "https://m.weibo.cn/api/container/getIndex?containerid=106003type%3D25%26t%3D3%26disable_hot%3D1%26filter_type%3Drealtimehot"
+    def __init__(self, boards=None, stream=True, debug_dump=False, chunk_size=8192,
+                 history=None, use_history=False, rising_threshold=2.0, scheduler=None):
+        """
+        boards: 要抓取的榜单（BOARDS 中的名称或 containerid），默认只抓实时热搜
+        stream: 边下载边解析 card_group，拿到 limit 条话题后停止读取响应
+        debug_dump: 响应格式不符时打印原始响应，默认关闭
+        history: HotValueStore，记录每次抓到的热度并标注增速；z-score 不低于
+            rising_threshold 的话题排到最前面。use_history=True 时使用默认位置的存储
+        """
+        self.boards = list(boards or ['realtime'])
+        self.api_base = API_BASE
+        self.api_url = board_url(self.boards[0])
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'application/json, text/plain, */*',
             'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
+            'Accept-Encoding': ACCEPT_ENCODING,
             'Referer': 'https://weibo.com/',
             'Origin': 'https://weibo.com',
             'Connection': 'keep-alive'
         }
-        
+        self.http = AsyncSessionHolder()
+        # 各榜单共用 m.weibo.cn 的请求节奏，被限流时自动拉长间隔
+        self.scheduler = scheduler or get_scheduler()
+        self.stream = stream
+        self.debug_dump = debug_dump
+        self.chunk_size = chunk_size
+        self.history = history if history is not None else (HotValueStore() if use_history else None)
+        self.rising_threshold = rising_threshold
+
+    async def _iter_cards_streaming(self, response, raw_chunks):
+        """增量读取响应体，逐个产出 cards[0].card_group 中的卡片"""
+        parser = ArrayItemParser('card_group')
+        decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            if raw_chunks is not None:
+                raw_chunks.append(chunk)
+            for card in parser.feed(decoder.decode(chunk)):
+                yield card
+            if parser.done:
+                return
+
+    async def _iter_cards_buffered(self, response, raw_chunks):
+        body = await response.read()
+        if raw_chunks is not None:
+            raw_chunks.append(body)
+        data = json.loads(body.decode(response.charset or 'utf-8'))
+        cards = data.get('data', {}).get('cards') or [{}]
+        for card in cards[0].get('card_group', []):
+            yield card
+
+    def _parse_topic(self, topic):
+        hot_value = topic.get('desc_extr', 0)
+        if isinstance(hot_value, str):
+            if hot_value == '正在热转':
+                hot_value = 0
+            else:
+                hot_value = int(''.join(filter(str.isdigit, hot_value)))
+
+        return {
+            'title': topic.get('desc', ''),
+            'url': topic.get('scheme', ''),
+            'hot_value': hot_value,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'source': 'Weibo'
+        }
+
     def fetch_trending(self, limit=5):
         """Fetch hot topics from Weibo"""
+        return run_with_sessions(self.fetch_trending_async(limit), self.http)
+
+    async def fetch_trending_async(self, limit=5):
+        # 各榜单并发请求，复用共享会话里同一个 host 的连接池
+        board_topics = await asyncio.gather(*(self._fetch_board(board, limit) for board in self.boards))
+        return self._combine(board_topics, limit)
+
+    async def fetch(self, limit=5):
+        """异步来源接口：各榜单并发请求，全部返回后按标题去重、按热度合并产出。
+
+        合并排名需要所有榜单的热度，所以不在单个榜单返回时提前产出；每个榜单请求
+        有 10 秒超时，失败的榜单不影响其它榜单。整个来源错过截止时间时由结果缓存兜底。
+        """
+        for topic in await self.fetch_trending_async(limit):
+            yield topic
+
+    async def aclose(self):
+        await self.http.close()
+
+    def _combine(self, board_topics, limit):
+        if len(board_topics) == 1:
+            topics = board_topics[0]
+        else:
+            topics = merge_topics(board_topics)
+            print(f"Merged {sum(len(t) for t in board_topics)} topics from {len(board_topics)} boards into {len(topics)}")
+
+        if self.history is not None:
+            topics = self._promote_rising(topics)
+        return topics[:limit]
+
+    def _promote_rising(self, topics):
+        """记录本次热度，标注增速和 z-score，快速上升的话题排到前面"""
+        self.history.record(topics)
+        trends = self.history.trends()
+        for topic in topics:
+            trend = trends.get(topic['title'], {})
+            topic['velocity'] = trend.get('velocity')
+            topic['zscore'] = trend.get('zscore')
+
+        def is_rising(topic):
+            return topic['zscore'] is not None and topic['zscore'] >= self.rising_threshold
+
+        rising = sorted((t for t in topics if is_rising(t)), key=lambda t: t['zscore'], reverse=True)
+        for topic in rising:
+            print(f"Rising topic: {topic['title']} (+{topic['velocity']:.0f}/h, z={topic['zscore']:.1f})")
+        return rising + [t for t in topics if not is_rising(t)]
+
+    async def _fetch_board(self, board, limit):
         try:
-            print(f"Fetching hot topics from Weibo API")
-            response = requests.get(
-                self.api_url, 
-                headers=self.headers, 
-                timeout=10
-            )
-            response.raise_for_status()
-            
-            print(f"Response status: {response.status_code}")
-            print(f"Response encoding: {response.encoding}")
-            
-            # Parse JSON response
-            data = response.json()
-            if 'data' not in data or 'cards' not in data['data'] or len(data['data']['cards']) == 0:
-                print("Invalid response format")
-                print(f"Response data: {json.dumps(data, ensure_ascii=False, indent=2)}")
-                return []
-            
-            topics = []
-            card_group = data['data']['cards'][0].get('card_group', [])
-            print(f"Found {len(card_group)} topics")
-            
-            for idx, topic in enumerate(card_group[:limit], 1):
-                try:
-                    # Skip non-topic cards
-                    if topic.get('card_type') != 4:
-                        continue
-                        
-                    # Extract topic details
-                    desc = topic.get('desc', '')
-                    scheme = topic.get('scheme', '')
-                    hot_value = topic.get('desc_extr', 0)
-                    
-                    if isinstance(hot_value, str):
-                        if hot_value == '正在热转':
-                            hot_value = 0
-                        else:
-                            hot_value = int(''.join(filter(str.isdigit, hot_value)))
-                    
-                    topic_info = {
-                        'title': desc,
-                        'url': scheme,
-                        'hot_value': hot_value,
-                        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'source': 'Weibo'
-                    }
-                    topics.append(topic_info)
-                    print(f"Added topic {idx}: {topic_info['title']} ({topic_info['hot_value']})")
-                    
+            print(f"Fetching hot topics from Weibo API ({board})")
+            await self.scheduler.wait(self.api_base)
+            session = self.http.get()
+            async with session.get(board_url(board, self.api_base), headers=self.headers,
+                                   timeout=aiohttp.ClientTimeout(total=10)) as response:
+                self.scheduler.report(self.api_base, status=response.status)
+                response.raise_for_status()
+                print(f"Response status: {response.status}")
+
+                raw_chunks = [] if self.debug_dump else None
+                iter_cards = self._iter_cards_streaming if self.stream else self._iter_cards_buffered
+                topics = []
+                seen_cards = 0
+                # 拿够 limit 条后退出 async with，未读完的连接直接关闭
+                async for card in iter_cards(response, raw_chunks):
+                    seen_cards += 1
+                    self._add_card(topics, card, board, seen_cards)
                     if len(topics) >= limit:
                         break
-                    
-                except Exception as e:
-                    print(f"Error processing topic {idx}: {str(e)}")
-                    continue
-            
+
+            if not seen_cards:
+                self._report_invalid(raw_chunks, response.charset)
+                return []
+
             print(f"Successfully fetched {len(topics)} topics")
             return topics
-            
-        except requests.RequestException as e:
+
+        except aiohttp.ClientError as e:
             print(f"Network error fetching Weibo topics: {str(e)}")
             print(f"Headers: {self.headers}")
             return []
         except Exception as e:
             print(f"Error fetching Weibo topics: {str(e)}")
             print(f"Traceback: {traceback.format_exc()}")
-            return []
\ No newline at end of file
+            return []
+
+    def _add_card(self, topics, card, board, idx):
+        try:
+            # Skip non-topic cards
+            if card.get('card_type') != 4:
+                return
+
+            topic_info = self._parse_topic(card)
+            topic_info['board'] = board
+            topics.append(topic_info)
+            print(f"Added topic {idx}: {topic_info['title']} ({topic_info['hot_value']})")
+
+        except Exception as e:
+            print(f"Error processing topic {idx}: {str(e)}")
+
+    def _report_invalid(self, raw_chunks, encoding):
+        print("Invalid response format")
+        if raw_chunks is not None:
+            raw = b''.join(raw_chunks).decode(encoding or 'utf-8', errors='replace')
+            print(f"Response data: {raw}")
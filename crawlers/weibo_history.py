@@ -0,0 +1,362 @@
+"""
+Columnar hot-value history for Weibo topics with rising-topic detection
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只有同一实例内的线程锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_DIR = Path(__file__).parent.parent / 'cache' / 'weibo_hot'
+
+# 每列一个只追加的二进制文件，查询时用 memmap 按时间范围切片
+COLUMNS = {
+    'ts': np.dtype('<i8'),
+    'topic': np.dtype('<i4'),
+    'hot': np.dtype('<i8'),
+}
+
+# 话题标题每行一个 JSON 字符串，行号即话题 ID，新话题只追加
+TITLES_FILE = 'topics.jsonl'
+LEGACY_TITLES_FILE = 'topics.json'
+
+
+class HotValueStore:
+    """按 (话题, 时间) 记录每次抓取到的微博热度。
+
+    - 观测值按时间顺序追加到 `ts` / `topic` / `hot` 三个列文件，话题标题映射为
+      整数 ID，新标题逐行追加到 `topics.jsonl`
+    - 查询只把所需时间窗口内的行从 memmap 中读出来，几个月的 5 分钟轮询数据
+      也不需要整体载入内存
+    - 超过 `retention` 的行大约每 `prune_every` 秒清理一次，只在这些行里出现过
+      的话题一并删掉，话题 ID 重新编号
+    - 多个实例或进程可以共用同一目录：写入和查询都在文件锁内先读入别人追加的
+      话题，再分配 ID、追加各列
+    - `trends()` 计算每个话题最近一小时的热度增速，以及相对于该话题自身历史
+      增速的 z-score，用来在话题冲顶之前发现它
+    """
+
+    def __init__(self, path: Optional[Path] = None, window: int = 3600, history: int = 7 * 86400,
+                 min_history: int = 3, std_floor: float = 1000.0, retention: int = 90 * 86400,
+                 prune_every: int = 86400):
+        """
+        window: 计算当前增速的时间窗口（秒）
+        history: 计算历史增速分布时回看的时长（秒）
+        min_history: 历史增速样本少于这个数时不给出 z-score
+        std_floor: 历史增速标准差的下限（热度/小时），避免平稳话题的微小波动被放大
+        retention: 观测值保留的时长（秒），至少为 history + window
+        prune_every: 最早的观测超出保留时长这么多秒后才清理一次，避免每次写入都重写列文件
+        """
+        self.path = Path(path) if path else DEFAULT_HISTORY_DIR
+        self.window = window
+        self.history = history
+        self.min_history = min_history
+        self.std_floor = std_floor
+        self.retention = max(retention, history + window)
+        self.prune_every = prune_every
+        self.topic_ids: Dict[str, int] = {}
+        self.titles: List[str] = []
+        self._first_ts = 0
+        self._last_ts = 0
+        # 已读到话题文件的哪个位置；文件被清理换掉后 inode 会变
+        self._titles_inode: Optional[int] = None
+        self._titles_size = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _column_path(self, name: str) -> Path:
+        return self.path / f'{name}.bin'
+
+    @contextmanager
+    def _locked(self):
+        """同一份历史可能同时被多个实例（后台刷新线程、另一个进程）写入，
+        分配话题 ID 和追加各列都要在文件锁内完成"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            lock_path = self.path.with_name(self.path.name + '.lock')
+            lock_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(lock_path, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _staging_paths(self) -> Tuple[Path, Path]:
+        return self.path.with_name(self.path.name + '.prune'), self.path.with_name(self.path.name + '.old')
+
+    def _recover(self):
+        """清理时在交换目录的中途退出：还没换上新目录就恢复旧的，已经换上就删掉旧的"""
+        staging, old = self._staging_paths()
+        if old.exists():
+            if self.path.exists():
+                shutil.rmtree(old)
+            else:
+                old.rename(self.path)
+        if staging.exists():
+            shutil.rmtree(staging)
+
+    def _load(self):
+        with self._locked():
+            self._recover()
+            try:
+                self._refresh()
+            except Exception as e:
+                logger.warning(f"读取微博热度话题表失败，重新开始: {e}")
+                self._reset_titles()
+            self._repair()
+            self._refresh_ts()
+
+    def _reset_titles(self, inode: Optional[int] = None):
+        self.titles, self.topic_ids = [], {}
+        self._titles_inode, self._titles_size = inode, 0
+
+    def _refresh(self):
+        """读入其它实例追加的话题和最新时间，调用方持有锁"""
+        path = self.path / TITLES_FILE
+        legacy = self.path / LEGACY_TITLES_FILE
+        if not path.exists() and legacy.exists():
+            # 旧版整表 JSON，转换成逐行格式
+            with open(legacy, 'r', encoding='utf-8') as f:
+                self._write_titles(path, json.load(f))
+            legacy.unlink()
+        try:
+            with open(path, 'r+b') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != self._titles_inode or stat.st_size < self._titles_size:
+                    # 第一次读取，或者其它实例清理后换了新文件，话题 ID 已重新编号
+                    self._reset_titles(stat.st_ino)
+                f.seek(self._titles_size)
+                data = f.read()
+                # 追加到一半退出留下的残行截掉，这个话题下次出现时会重新追加
+                complete = data.rfind(b'\n') + 1
+                if complete < len(data):
+                    f.truncate(self._titles_size + complete)
+        except FileNotFoundError:
+            self._reset_titles()
+            return
+        for line in data[:complete].decode('utf-8').splitlines():
+            title = json.loads(line)
+            self.topic_ids[title] = len(self.titles)
+            self.titles.append(title)
+        self._titles_size += complete
+        self._refresh_ts()
+
+    def _refresh_ts(self):
+        ts = self._column('ts')
+        self._first_ts, self._last_ts = (int(ts[0]), int(ts[-1])) if len(ts) else (0, 0)
+
+    @staticmethod
+    def _write_titles(path: Path, titles: List[str]):
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(title, ensure_ascii=False) + '\n' for title in titles)
+        tmp_path.replace(path)
+
+    def _repair(self):
+        """写入中途退出时各列长度可能不一致，截断到最短的一列"""
+        rows = self._rows()
+        for name, dtype in COLUMNS.items():
+            path = self._column_path(name)
+            if path.exists() and path.stat().st_size != rows * dtype.itemsize:
+                logger.warning(f"微博热度列 {name} 长度不一致，截断到 {rows} 行")
+                with open(path, 'r+b') as f:
+                    f.truncate(rows * dtype.itemsize)
+        # 话题表写在列文件之前，不会缺少列里引用的话题；多出来的话题无害
+
+    def _rows(self) -> int:
+        sizes = []
+        for name, dtype in COLUMNS.items():
+            path = self._column_path(name)
+            sizes.append(path.stat().st_size // dtype.itemsize if path.exists() else 0)
+        return min(sizes)
+
+    def _column(self, name: str, rows: Optional[int] = None) -> np.ndarray:
+        rows = self._rows() if rows is None else rows
+        if rows == 0:
+            return np.empty(0, dtype=COLUMNS[name])
+        return np.memmap(self._column_path(name), dtype=COLUMNS[name], mode='r', shape=(rows,))
+
+    def __len__(self) -> int:
+        return self._rows()
+
+    def _append_titles(self, titles: List[str]):
+        with open(self.path / TITLES_FILE, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(title, ensure_ascii=False) + '\n' for title in titles)
+
+    def record(self, topics: Iterable[Dict], now: Optional[float] = None) -> int:
+        """追加一次抓取的观测值（需要 title 和 hot_value），返回写入的行数"""
+        observations = [(t['title'], int(t.get('hot_value') or 0)) for t in topics if t.get('title')]
+        if not observations:
+            return 0
+        with self._locked():
+            try:
+                self._refresh()
+            except Exception as e:
+                logger.warning(f"读取微博热度话题表失败: {e}")
+                return 0
+            # 时间列保持非递减，查询才能用二分定位窗口
+            ts = max(int(now if now is not None else time.time()), self._last_ts)
+            new_titles = []
+            for title, _ in observations:
+                if title not in self.topic_ids:
+                    self.topic_ids[title] = len(self.titles)
+                    self.titles.append(title)
+                    new_titles.append(title)
+            try:
+                self.path.mkdir(parents=True, exist_ok=True)
+                if new_titles:
+                    self._append_titles(new_titles)
+                values = {
+                    'ts': np.full(len(observations), ts, dtype=COLUMNS['ts']),
+                    'topic': np.array([self.topic_ids[title] for title, _ in observations], dtype=COLUMNS['topic']),
+                    'hot': np.array([hot for _, hot in observations], dtype=COLUMNS['hot']),
+                }
+                for name, column in values.items():
+                    with open(self._column_path(name), 'ab') as f:
+                        column.tofile(f)
+                stat = (self.path / TITLES_FILE).stat()
+                self._titles_inode, self._titles_size = stat.st_ino, stat.st_size
+                self._first_ts = self._first_ts or ts
+                self._last_ts = ts
+            except Exception as e:
+                logger.warning(f"写入微博热度历史失败: {e}")
+                return 0
+            if ts - self._first_ts > self.retention + self.prune_every:
+                try:
+                    self._prune(ts - self.retention)
+                except Exception as e:
+                    logger.warning(f"清理过期的微博热度历史失败: {e}")
+        return len(observations)
+
+    def _prune(self, cutoff: float):
+        """删掉 ts < cutoff 的行和只在这些行里出现过的话题。
+
+        新的列文件和话题表先写到旁边的目录，再整体换掉原目录。
+        """
+        rows = self._rows()
+        lo = int(np.searchsorted(self._column('ts', rows), cutoff, side='left'))
+        if lo == 0:
+            return
+        kept = {name: np.array(self._column(name, rows)[lo:]) for name in COLUMNS}
+        used = np.unique(kept['topic'])
+        remap = np.full(len(self.titles), -1, dtype=COLUMNS['topic'])
+        remap[used] = np.arange(len(used), dtype=COLUMNS['topic'])
+        kept['topic'] = remap[kept['topic']]
+        titles = [self.titles[idx] for idx in used]
+
+        staging, old = self._staging_paths()
+        if staging.exists():
+            shutil.rmtree(staging)
+        staging.mkdir(parents=True)
+        self._write_titles(staging / TITLES_FILE, titles)
+        for name, column in kept.items():
+            column.tofile(str(staging / f'{name}.bin'))
+        self.path.rename(old)
+        staging.rename(self.path)
+        shutil.rmtree(old)
+
+        self.titles = titles
+        self.topic_ids = {title: idx for idx, title in enumerate(titles)}
+        path = self.path / TITLES_FILE
+        self._titles_inode, self._titles_size = path.stat().st_ino, path.stat().st_size
+        self._first_ts = int(kept['ts'][0]) if len(kept['ts']) else 0
+        logger.info(f"清理了 {lo} 行过期的微博热度历史，保留 {len(titles)} 个话题")
+
+    def window_rows(self, since: float, until: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """返回 since <= ts <= until 的 (ts, topic, hot)，只读取这一段"""
+        with self._locked():
+            return self._window_rows(since, until)
+
+    def _window_rows(self, since: float, until: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rows = self._rows()
+        ts = self._column('ts', rows)
+        lo = int(np.searchsorted(ts, since, side='left'))
+        hi = int(np.searchsorted(ts, until, side='right'))
+        return (
+            np.array(ts[lo:hi]),
+            np.array(self._column('topic', rows)[lo:hi]),
+            np.array(self._column('hot', rows)[lo:hi]),
+        )
+
+    def trends(self, now: Optional[float] = None) -> Dict[str, Dict]:
+        """计算窗口内每个话题的增速和 z-score。
+
+        相邻两次观测的热度差除以时间差得到一段增速；落在最近 `window` 内的各段
+        按时间加权得到当前增速，更早的各段构成该话题自己的历史分布。
+        """
+        now = now if now is not None else time.time()
+        with self._locked():
+            # 窗口里可能有其它实例新写入的话题，先把话题表读全
+            self._refresh()
+            titles = list(self.titles)
+            ts, topic, hot = self._window_rows(now - self.history - self.window, now)
+        if len(ts) == 0:
+            return {}
+
+        order = np.lexsort((ts, topic))
+        ts, topic, hot = ts[order], topic[order], hot[order].astype(np.float64)
+
+        same = topic[1:] == topic[:-1]
+        dt = (ts[1:] - ts[:-1]) / 3600.0
+        valid = same & (dt > 0)
+        delta = hot[1:] - hot[:-1]
+        rate = np.zeros(len(dt))
+        rate[valid] = delta[valid] / dt[valid]
+        seg_topic = topic[1:]
+        recent = valid & (ts[1:] > now - self.window)
+        past = valid & ~recent
+
+        size = int(topic.max()) + 1
+        cur_delta = np.bincount(seg_topic[recent], weights=delta[recent], minlength=size)
+        cur_dt = np.bincount(seg_topic[recent], weights=dt[recent], minlength=size)
+        has_velocity = cur_dt > 0
+        velocity = np.zeros(size)
+        velocity[has_velocity] = cur_delta[has_velocity] / cur_dt[has_velocity]
+
+        count = np.bincount(seg_topic[past], minlength=size)
+        total = np.bincount(seg_topic[past], weights=rate[past], minlength=size)
+        total_sq = np.bincount(seg_topic[past], weights=rate[past] ** 2, minlength=size)
+        has_history = count >= self.min_history
+        mean = np.zeros(size)
+        mean[has_history] = total[has_history] / count[has_history]
+        var = np.zeros(size)
+        var[has_history] = total_sq[has_history] / count[has_history] - mean[has_history] ** 2
+        std = np.maximum(np.sqrt(np.maximum(var, 0)), self.std_floor)
+        zscore = np.full(size, np.nan)
+        scored = has_history & has_velocity
+        zscore[scored] = (velocity[scored] - mean[scored]) / std[scored]
+
+        # 每个话题排序后的最后一行就是最新观测
+        last = np.flatnonzero(np.r_[topic[1:] != topic[:-1], True])
+        result = {}
+        for idx in last:
+            topic_id = int(topic[idx])
+            result[titles[topic_id]] = {
+                'hot_value': int(hot[idx]),
+                'velocity': float(velocity[topic_id]) if has_velocity[topic_id] else None,
+                'zscore': float(zscore[topic_id]) if scored[topic_id] else None,
+                'observations': int(count[topic_id]),
+            }
+        return result
+
+    def rising(self, threshold: float = 2.0, now: Optional[float] = None) -> List[Tuple[str, Dict]]:
+        """z-score 不低于 threshold 的话题，按 z-score 降序"""
+        trends = self.trends(now)
+        rising = [(title, t) for title, t in trends.items() if t['zscore'] is not None and t['zscore'] >= threshold]
+        return sorted(rising, key=lambda item: item[1]['zscore'], reverse=True)
@@ -1,20 +1,59 @@
 """
 Xiaohongshu trending topics crawler (Web Search Version)
 """
-import requests
 from datetime import datetime
 import random
-import time
 import json
-import re
+import asyncio
+import codecs
+import aiohttp
 from bs4 import BeautifulSoup
 from urllib.parse import urlencode
+from .politeness import get_scheduler
+from .http_client import AsyncSessionHolder, run_with_sessions
+from .json_stream import ObjectExtractor, loads_js_object
+from .registry import register_source
+from .xiaohongshu_cache import SearchResultCache
 
+INITIAL_STATE_PREFIX = r'window\.__INITIAL_STATE__\s*=\s*\{'
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+DEFAULT_KEYWORDS = ['穿搭', '美食', '旅行', '护肤', '数码']
+
+
+def parse_liked_count(value):
+    """点赞数可能是数字，也可能是 "1.2万"、"10w+" 这样的字符串"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value or '').strip().lower().rstrip('+')
+    multiplier = 1
+    if text.endswith(('万', 'w')):
+        multiplier, text = 10000, text[:-1]
+    elif text.endswith('亿'):
+        multiplier, text = 100000000, text[:-1]
+    try:
+        return int(float(text) * multiplier)
+    except ValueError:
+        return 0
+
+
+@register_source('xiaohongshu')
 class XiaohongshuCrawler:
-    def __init__(self):
+    def __init__(self, scheduler=None, max_page_bytes=MAX_PAGE_BYTES, chunk_size=16384,
+                 keywords=None, fan_out=True, cache=None, use_cache=True):
+        """
+        max_page_bytes: 搜索页最多下载的字节数，超过仍未找到完整的初始数据就放弃
+        fan_out: 并发搜索全部关键词并按点赞数合并；False 时沿用随机挑一个关键词
+        cache: 按关键词缓存搜索结果的 SearchResultCache，TTL 内不重复搜索
+        """
         self.search_url = "https://www.xiaohongshu.com/search_result"
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.scheduler = scheduler or get_scheduler()
+        self.http = AsyncSessionHolder()
+        self.max_page_bytes = max_page_bytes
+        self.chunk_size = chunk_size
+        self.keywords = list(keywords or DEFAULT_KEYWORDS)
+        self.fan_out = fan_out
+        self.cache = cache if cache is not None else (SearchResultCache() if use_cache else None)
+        self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
             'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
@@ -27,10 +66,103 @@ class XiaohongshuCrawler:
             'Sec-Fetch-Site': 'none',
             'Sec-Fetch-User': '?1',
             'Upgrade-Insecure-Requests': '1'
-        })
+        }
         
     def get_search_results(self, keyword, limit=5):
         """获取搜索结果"""
+        return run_with_sessions(self.get_search_results_async(keyword, limit), self.http)
+
+    async def _search_cached(self, keyword, limit):
+        if self.cache is not None:
+            items = self.cache.get(keyword, limit)
+            if items is not None:
+                print(f"使用缓存的搜索结果: {keyword}")
+                return items
+        items = await self.get_search_results_async(keyword, limit)
+        # 空结果可能是被风控，不缓存
+        if self.cache is not None and items:
+            self.cache.put(keyword, items, limit)
+        return items
+
+    def _build_trend(self, item, keyword):
+        note_data = item.get('note', {})
+        if not note_data:
+            return None
+
+        trend = {
+            'title': note_data.get('title', '').strip() or note_data.get('desc', '').strip(),
+            'url': f"https://www.xiaohongshu.com/discovery/item/{note_data.get('id', '')}",
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'source': 'Xiaohongshu',
+            'keyword': keyword,
+            'likes': parse_liked_count(note_data.get('interactInfo', {}).get('likedCount', 0))
+        }
+        return trend if trend['title'] else None
+
+    def fetch_trending(self, limit=5):
+        """获取热门内容"""
+        return run_with_sessions(self.fetch_trending_async(limit), self.http)
+
+    async def fetch_trending_async(self, limit=5):
+        try:
+            print("开始获取小红书热门...")
+            keywords = self._pick_keywords()
+
+            # 各关键词并发搜索，请求间隔仍由调度器按 host 控制
+            results = await asyncio.gather(*(self._search_cached(kw, limit) for kw in keywords))
+            if self.cache is not None:
+                self.cache.save()
+
+            return self._rank(keywords, results, limit)
+
+        except Exception as e:
+            print(f"获取热门内容出错: {str(e)}")
+            return []
+
+    async def fetch(self, limit=5):
+        """异步来源接口：各关键词在调用方的事件循环上并发搜索"""
+        for trend in await self.fetch_trending_async(limit):
+            yield trend
+
+    async def aclose(self):
+        await self.http.close()
+
+    def _pick_keywords(self):
+        if self.fan_out:
+            keywords = self.keywords
+        else:
+            keywords = [random.choice(self.keywords)]
+        print(f"使用关键词: {', '.join(keywords)}")
+        return keywords
+
+    def _rank(self, keywords, results, limit):
+        """按笔记 ID 去重，再按点赞数排序"""
+        trends = {}
+        for keyword, items in zip(keywords, results):
+            for item in items[:limit]:
+                try:
+                    trend = self._build_trend(item, keyword)
+                    if not trend:
+                        continue
+                    # 同一篇笔记出现在多个关键词下时只保留一条
+                    note_id = item['note'].get('id') or trend['url']
+                    if note_id not in trends or trend['likes'] > trends[note_id]['likes']:
+                        trends[note_id] = trend
+                except Exception as e:
+                    print(f"处理单条内容时出错: {str(e)}")
+                    continue
+
+        if not trends:
+            print("没有找到相关内容")
+            return []
+
+        ranked = sorted(trends.values(), key=lambda t: t['likes'], reverse=True)[:limit]
+        for trend in ranked:
+            print(f"找到内容: {json.dumps(trend, indent=2, ensure_ascii=False)}")
+        print(f"成功获取 {len(ranked)} 条内容")
+        return ranked
+
+    async def get_search_results_async(self, keyword, limit=5):
         try:
             params = {
                 'keyword': keyword,
@@ -38,77 +170,34 @@ class XiaohongshuCrawler:
                 'page': 1,
                 'page_size': limit
             }
-            
             search_url = f"{self.search_url}?{urlencode(params)}"
             print(f"请求URL: {search_url}")
-            
-            response = self.session.get(search_url, timeout=10)
-            print(f"响应状态码: {response.status_code}")
-            
-            if response.status_code == 200:
-                # 提取script标签中的初始数据
-                pattern = r'window\.__INITIAL_STATE__\s*=\s*({[^<]+});?'
-                match = re.search(pattern, response.text)
-                
-                if match:
-                    data = json.loads(match.group(1))
-                    return data.get('searchResult', {}).get('items', [])
+
+            await self.scheduler.wait(self.search_url)
+            session = self.http.get()
+            async with session.get(search_url, headers=self.headers,
+                                   timeout=aiohttp.ClientTimeout(total=10)) as response:
+                self.scheduler.report(self.search_url, status=response.status)
+                print(f"响应状态码: {response.status}")
+                if response.status != 200:
+                    return []
+
+                # 边下载边查找 script 中的初始数据，对象闭合后就不再读取页面剩余部分
+                extractor = ObjectExtractor(INITIAL_STATE_PREFIX)
+                decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+                received = 0
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    received += len(chunk)
+                    if received > self.max_page_bytes:
+                        print(f"页面超过 {self.max_page_bytes} 字节，停止下载")
+                        break
+                    raw_state = extractor.feed(decoder.decode(chunk))
+                    if raw_state:
+                        data = loads_js_object(raw_state)
+                        return data.get('searchResult', {}).get('items', [])
+            print("未找到页面初始数据")
             return []
-            
+
         except Exception as e:
             print(f"获取搜索结果出错: {str(e)}")
             return []
-    
-    def fetch_trending(self, limit=5):
-        """获取热门内容"""
-        try:
-            print("开始获取小红书热门...")
-            
-            # 随机休眠
-            delay = random.uniform(1, 3)
-            print(f"等待 {delay:.2f} 秒...")
-            time.sleep(delay)
-            
-            # 使用热门关键词搜索
-            keywords = ['穿搭', '美食', '旅行', '护肤', '数码']
-            keyword = random.choice(keywords)
-            print(f"使用关键词: {keyword}")
-            
-            items = self.get_search_results(keyword, limit)
-            
-            if not items:
-                print("没有找到相关内容")
-                return []
-                
-            trends = []
-            for item in items[:limit]:
-                try:
-                    note_data = item.get('note', {})
-                    if not note_data:
-                        continue
-                        
-                    trend = {
-                        'title': note_data.get('title', '').strip() or note_data.get('desc', '').strip(),
-                        'url': f"https://www.xiaohongshu.com/discovery/item/{note_data.get('id', '')}",
-                        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'source': 'Xiaohongshu',
-                        'keyword': keyword,
-                        'likes': note_data.get('interactInfo', {}).get('likedCount', 0)
-                    }
-                    
-                    if not trend['title']:
-                        continue
-                        
-                    print(f"找到内容: {json.dumps(trend, indent=2, ensure_ascii=False)}")
-                    trends.append(trend)
-                    
-                except Exception as e:
-                    print(f"处理单条内容时出错: {str(e)}")
-                    continue
-            
-            print(f"成功获取 {len(trends)} 条内容")
-            return trends
-            
-        except Exception as e:
-            print(f"获取热门内容出错: {str(e)}")
-            return []
\ No newline at end of file
@@ -0,0 +1,68 @@
+"""
+Per-keyword TTL cache for Xiaohongshu search results
+"""
+import json
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / 'cache' / 'xiaohongshu_search.json'
+
+
+class SearchResultCache:
+    """按关键词缓存搜索页里的笔记列表，TTL 内重复搜索直接返回缓存。
+
+    写在磁盘上，Flask 测试面板每次新建爬虫、以及定时任务在另一个进程里运行时
+    也能命中同一份缓存。
+    """
+
+    def __init__(self, path: Optional[Path] = None, ttl: int = 1800):
+        self.path = Path(path) if path else DEFAULT_CACHE_PATH
+        self.ttl = ttl
+        self.entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取小红书搜索缓存失败，重新开始: {e}")
+            self.entries = {}
+
+    def get(self, keyword: str, limit: int, now: Optional[float] = None) -> Optional[List[Dict]]:
+        """未过期且当时至少搜索了 limit 条时返回缓存的结果，否则返回 None"""
+        with self._lock:
+            entry = self.entries.get(keyword)
+        if not entry or (now or time.time()) - entry['fetched_at'] >= self.ttl:
+            return None
+        # 缓存时搜索的条数比现在要的少，结果可能不全，重新搜索
+        if entry.get('limit', 0) < limit and len(entry['items']) < limit:
+            return None
+        return entry['items'][:limit]
+
+    def put(self, keyword: str, items: List[Dict], limit: int, now: Optional[float] = None):
+        with self._lock:
+            self.entries[keyword] = {'items': items, 'limit': limit, 'fetched_at': now or time.time()}
+
+    def save(self):
+        """丢弃过期条目并写回磁盘"""
+        now = time.time()
+        with self._lock:
+            self.entries = {k: v for k, v in self.entries.items() if now - v['fetched_at'] < self.ttl}
+            entries = dict(self.entries)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False, separators=(',', ':'))
+            tmp_path.replace(self.path)
+        except Exception as e:
+            logger.warning(f"保存小红书搜索缓存失败: {e}")
@@ -4,8 +4,9 @@ Daily Brief Bot - GitHub Actions Script
 """
 import os
 import logging
-from crawlers.hacker_news import HackerNewsCrawler
-from crawlers.weibo import WeiboCrawler
+from crawlers.deadlines import LatencyHistory, RunBudget, late_notice
+from config import CONTENT_CONFIG, SOURCES
+from crawlers.registry import run_sources
 from utils.content_filter import ContentFilterManager
 from datetime import datetime
 import smtplib
@@ -100,6 +101,10 @@ def format_html_content(content):
                     margin-top: 8px;
                     font-size: 14px;
                 }}
+                .incomplete {{
+                    color: #6c757d;
+                    font-size: 13px;
+                }}
             </style>
         </head>
         <body>
@@ -134,6 +139,10 @@ def format_html_content(content):
                 </div>
             """
         html += "</div>"
+
+    notice = late_notice(content.get('late'))
+    if notice:
+        html += f'<p class="incomplete">{notice}</p>'
     
     html += """
         </body>
@@ -173,10 +182,10 @@ def main():
         
         # 1. 收集内容
         logger.info("开始收集内容...")
-        raw_content = {
-            'hackernews': HackerNewsCrawler().fetch_trending(5),
-            'weibo': WeiboCrawler().fetch_trending(5)
-        }
+        budget = RunBudget(CONTENT_CONFIG['FETCH_BUDGET'], LatencyHistory())
+        raw_content = run_sources(SOURCES, budget=budget)
+        if budget.late:
+            logger.warning(f"以下来源未能按时返回全部内容: {', '.join(budget.late)}")
         
         # 2. AI 筛选
         logger.info("开始 AI 内容筛选...")
@@ -190,7 +199,7 @@ def main():
         # 3. 发送邮件
         logger.info(f"开始发送邮件，共 {len(filtered_content)} 条内容...")
         success, message = send_email(
-            {'filtered_content': filtered_content},
+            {'filtered_content': filtered_content, 'late': budget.late},
             EMAIL_CONFIG['SENDER_EMAIL']  # 在实际使用时替换为你的目标邮箱
         )
         
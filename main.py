@@ -6,15 +6,17 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 import aiosmtplib
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 import logging
 import os
+import time
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-from config import EMAIL_CONFIG, CONTENT_CONFIG, SUBSCRIBERS
-from crawlers.hacker_news import HackerNewsCrawler
-from crawlers.weibo import WeiboCrawler
-from crawlers.xiaohongshu import XiaohongshuCrawler
+from config import CONTENT_CONFIG, EMAIL_CONFIG, SOURCES, SUBSCRIBERS
+from crawlers.cassette import deterministic_specs, get_cassette
+from crawlers.deadlines import LatencyHistory, RunBudget, late_notice
+from crawlers.registry import fetch_sources
+from crawlers.result_cache import SourceResultCache
 from utils.content_filter import ContentFilterManager
 
 # 设置更详细的日志格式
@@ -24,43 +26,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def fetch_source_content(crawler, limit: int, source_name: str) -> List[Dict[str, Any]]:
-    """Fetch content from a single source with timeout"""
-    try:
-        content = await asyncio.wait_for(
-            asyncio.to_thread(crawler.fetch_trending, limit),
-            timeout=30
-        )
-        return [{**item, 'source': source_name} for item in content]
-    except asyncio.TimeoutError:
-        logger.error(f"Timeout fetching from {source_name}")
-        return []
-    except Exception as e:
-        logger.error(f"Error fetching from {source_name}: {str(e)}")
-        return []
+async def fetch_all_content() -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, int]]:
+    """Fetch content from all configured sources concurrently on one event loop.
 
-async def fetch_all_content() -> Dict[str, List[Dict[str, Any]]]:
-    """Fetch content from all sources in parallel"""
-    sources = {
-        'hacker_news': (HackerNewsCrawler(), CONTENT_CONFIG['HACKER_NEWS_LIMIT']),
-        'weibo': (WeiboCrawler(), CONTENT_CONFIG['WEIBO_LIMIT']),
-    }
-    
-    tasks = [
-        fetch_source_content(crawler, limit, source)
-        for source, (crawler, limit) in sources.items()
-    ]
-    
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    
-    return {
-        source: content
-        for source, content in zip(sources.keys(), results)
-        if isinstance(content, list)
+    Sources are fetched inline; cached results only stand in for sources that fail or return nothing in time.
+    Each source gets a deadline learned from its past latencies, all within FETCH_BUDGET.
+    With a cassette active, caches are bypassed so recording and replay issue the same requests.
+    Returns the content by source and the sources that missed their deadline.
+    """
+    if get_cassette() is not None:
+        cache, specs, latencies = None, deterministic_specs(SOURCES), None
+    else:
+        cache, specs, latencies = SourceResultCache(), SOURCES, LatencyHistory()
+    budget = RunBudget(CONTENT_CONFIG['FETCH_BUDGET'], latencies)
+    results = await fetch_sources(specs, timeout=30, cache=cache, budget=budget, serve_stale=False)
+    if budget.late:
+        logger.warning(f"Sending without the rest of: {', '.join(budget.late)}")
+    for source in results:
+        meta = cache.meta(source) if cache else {}
+        if meta.get('stale'):
+            logger.warning(f"Using {source} results fetched {meta['age_seconds']}s ago")
+    by_source = {
+        source: [{**item, 'source': source} for item in content]
+        for source, content in results.items()
     }
+    return by_source, dict(budget.late)
 
-def format_email_content(content: List[Dict[str, Any]]) -> tuple[str, str]:
-    """Format content into plain text and HTML email bodies"""
+def format_email_content(content: List[Dict[str, Any]], late: Optional[Dict[str, int]] = None) -> tuple[str, str]:
+    """Format content into plain text and HTML email bodies, noting sources that missed their deadline"""
     date = datetime.now().strftime('%Y-%m-%d')
     
     # Plain text version
@@ -74,6 +67,7 @@ def format_email_content(content: List[Dict[str, Any]]) -> tuple[str, str]:
             body {{ font-family: Arial, sans-serif; max-width: 800px; margin: auto; }}
             .item {{ margin-bottom: 20px; padding: 10px; border-bottom: 1px solid #eee; }}
             .value {{ color: #666; font-style: italic; }}
+            .incomplete {{ color: #999; font-size: 13px; }}
         </style>
     </head>
     <body>
@@ -98,12 +92,24 @@ def format_email_content(content: List[Dict[str, Any]]) -> tuple[str, str]:
         </div>
         """
     
+    notice = late_notice(late)
+    if notice:
+        text += f"\n{notice}\n"
+        html += f'<p class="incomplete">{notice}</p>'
+
     html += "</body></html>"
     return text, html
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
 async def send_email_async(subscriber: str, text_content: str, html_content: str):
     """Send email using aiosmtplib"""
+    cassette = get_cassette()
+    if cassette is not None and cassette.replaying:
+        interaction = cassette.replay_smtp(subscriber)
+        await asyncio.sleep(cassette.delay(interaction))
+        logger.info(f"Replayed email to {subscriber} from cassette")
+        return
+    started = time.monotonic()
     try:
         # 打印邮件配置信息（注意不要打印密码）
         logger.info(f"Email Configuration:")
@@ -143,6 +149,8 @@ async def send_email_async(subscriber: str, text_content: str, html_content: str
         await server.quit()
         
         logger.info(f"Email successfully sent to {subscriber}")
+        if cassette is not None:
+            cassette.record_smtp(subscriber, msg['Subject'], started, time.monotonic() - started)
         
     except aiosmtplib.SMTPException as e:
         logger.error(f"SMTP Error: {str(e)}")
@@ -173,7 +181,7 @@ async def main():
             logger.info(f"{var} is {'set' if var in EMAIL_CONFIG else 'not set'}")
         
         # Fetch content
-        content_dict = await fetch_all_content()
+        content_dict, late = await fetch_all_content()
         if not content_dict:
             logger.error("No content fetched")
             return
@@ -186,7 +194,7 @@ async def main():
             return
             
         # Format email
-        text_content, html_content = format_email_content(filtered_content)
+        text_content, html_content = format_email_content(filtered_content, late)
         
         # Send emails
         logger.info(f"Attempting to send emails to {len(SUBSCRIBERS)} subscribers")
@@ -199,4 +207,9 @@ async def main():
         raise
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    finally:
+        cassette = get_cassette()
+        if cassette is not None:
+            cassette.save()
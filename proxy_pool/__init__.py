@@ -1,4 +1,5 @@
 from .manager import ProxyManager
 from .proxy import Proxy
+from .snapshot import ProxySnapshot
 
-__all__ = ['ProxyManager', 'Proxy']
\ No newline at end of file
+__all__ = ['ProxyManager', 'Proxy', 'ProxySnapshot']
\ No newline at end of file
@@ -0,0 +1,51 @@
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+# 成功率很低时成本按这个下限计算，避免除以零
+MIN_SUCCESS_RATE = 0.05
+# 既没有请求记录也没有验证耗时的代理按这个延迟估计
+DEFAULT_LATENCY_MS = 1000.0
+
+
+def host_key(value: str) -> str:
+    """把 URL 或主机名归到目标站点，例如 m.weibo.cn、api.bilibili.com 分别归到 weibo.cn、bilibili.com"""
+    host = urlsplit(value).hostname if '://' in value else value.split(':', 1)[0]
+    host = (host or '').lower().rstrip('.')
+    labels = host.split('.')
+    if len(labels) <= 2 or all(label.isdigit() for label in labels):
+        return host
+    return '.'.join(labels[-2:])
+
+
+@dataclass
+class HostHealth:
+    """代理访问某个目标站点的指数加权平均延迟和成功率"""
+    latency_ms: Optional[float] = None
+    success_rate: float = 1.0
+    samples: int = 0
+
+    def record(self, success: bool, latency_ms: Optional[float], alpha: float):
+        if latency_ms is not None:
+            if self.latency_ms is None:
+                self.latency_ms = float(latency_ms)
+            else:
+                self.latency_ms = alpha * latency_ms + (1 - alpha) * self.latency_ms
+        self.success_rate = alpha * (1.0 if success else 0.0) + (1 - alpha) * self.success_rate
+        self.samples += 1
+
+    def cost(self, fallback_ms: float) -> float:
+        """期望成本：延迟除以成功率，越小越好"""
+        latency = self.latency_ms if self.latency_ms is not None else fallback_ms
+        return latency / max(self.success_rate, MIN_SUCCESS_RATE)
+
+    def to_dict(self) -> dict:
+        return {
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "success_rate": round(self.success_rate, 4),
+            "samples": self.samples,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'HostHealth':
+        return cls(**data)
@@ -0,0 +1,75 @@
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable
+
+from .proxy import Proxy
+
+logger = logging.getLogger(__name__)
+
+
+class HealthJournal:
+    """代理健康状态的追加式日志
+
+    每行是一个代理在某次 flush 时的健康字段，带递增的 seq。基准文件
+    （proxy_data.json）记录压缩时的 seq，加载时只重放比它新的行；
+    进程在写到一半时退出留下的残行在重放时被截掉。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.seq = 0
+        self.lines = 0
+
+    def replay(self, proxies: Dict[tuple, Proxy], after_seq: int = 0) -> int:
+        """把日志里比 after_seq 新的记录应用到 proxies 上，返回应用的行数"""
+        self.seq = after_seq
+        self.lines = 0
+        applied = 0
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return applied
+        # 写到一半退出留下的残行截掉，否则下一次追加会接在它后面一起损坏
+        complete = data.rfind(b'\n') + 1
+        if complete < len(data):
+            logger.warning(f"截掉代理健康日志末尾不完整的一行: {data[complete:complete + 80]!r}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(complete)
+        for line in data[:complete].decode('utf-8', errors='replace').splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning(f"跳过代理健康日志中损坏的一行: {line[:80]!r}")
+                continue
+            self.lines += 1
+            self.seq = max(self.seq, entry['seq'])
+            proxy = proxies.get(tuple(entry['key']))
+            if entry['seq'] > after_seq and proxy is not None:
+                proxy.update_health(entry)
+                applied += 1
+        return applied
+
+    def append(self, proxies: Iterable[Proxy]) -> int:
+        """追加这些代理当前的健康字段，返回写入的行数"""
+        lines = []
+        for proxy in proxies:
+            self.seq += 1
+            lines.append(json.dumps({'seq': self.seq, 'key': list(proxy.key), **proxy.health_dict()},
+                                    ensure_ascii=False, separators=(',', ':')))
+        if not lines:
+            return 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        self.lines += len(lines)
+        return len(lines)
+
+    def reset(self):
+        """压缩后清空日志，seq 继续递增"""
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+        self.lines = 0
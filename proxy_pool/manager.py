@@ -1,4 +1,6 @@
 import json
+import time
+import random
 import asyncio
 import aiohttp
 from datetime import datetime, timedelta
@@ -6,6 +8,9 @@ from typing import List, Optional, Dict
 import os
 from pathlib import Path
 from .proxy import Proxy
+from .snapshot import ProxySnapshot
+from .journal import HealthJournal
+from .health import host_key
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,11 +27,20 @@ class ProxyManager:
         self.data_path = self.config_dir / 'proxy_data.json'
         
         self.config = self._load_config()
+        # 健康状态先记在内存里，定期追加到日志，日志过长时压缩回 proxy_data.json
+        self.journal = HealthJournal(self.data_path.with_suffix('.journal'))
+        self._dirty: Dict[tuple, Proxy] = {}
         self.proxies: List[Proxy] = self._load_proxy_data()
-        self._lock = asyncio.Lock()
+        # get_proxy 只读这个快照，刷新和禁用代理时整体替换
+        self.snapshot = ProxySnapshot()
+        self._publish()
         
-        # 设置自动刷新任务
+        # 设置自动刷新任务；池空时 get_proxy 通过 _wakeup 让它提前刷新
         self.refresh_task = None
+        self.flush_task = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_refresh = 0.0
+        self._random = random.Random()
         
     def _load_config(self) -> dict:
         """加载代理配置"""
@@ -40,6 +54,12 @@ class ProxyManager:
                 "test_timeout": 5,
                 "refresh_interval": 600,  # 10分钟
                 "max_fail_count": 3,
+                "validate_concurrency": 50,  # 同时验证的代理数
+                "validate_target": 50,  # 验证出这么多可用代理后停止，0 表示全部验证
+                "min_refresh_gap": 30,  # 池空时提前刷新的最小间隔（秒）
+                "flush_interval": 30,  # 健康状态写入日志的间隔（秒）
+                "journal_compact_lines": 1000,  # 日志超过这么多行时压缩
+                "health_alpha": 0.3,  # 按站点统计延迟和成功率的指数加权系数
                 "proxy_sources": [
                     {
                         "name": "default",
@@ -54,30 +74,72 @@ class ProxyManager:
             return default_config
 
     def _load_proxy_data(self) -> List[Proxy]:
-        """加载代理数据"""
+        """加载代理数据，再重放基准之后的健康日志"""
         try:
             with open(self.data_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                return [Proxy.from_dict(item) for item in data]
         except FileNotFoundError:
-            return []
+            data = []
+        # 旧格式是代理列表，没有 seq
+        if isinstance(data, list):
+            data = {"seq": 0, "proxies": data}
+        proxies = [Proxy.from_dict(item) for item in data["proxies"]]
+        applied = self.journal.replay({p.key: p for p in proxies}, after_seq=data.get("seq", 0))
+        if applied:
+            logger.info(f"从代理健康日志恢复了 {applied} 条记录")
+        return proxies
 
-    async def _save_proxy_data(self):
-        """保存代理数据"""
-        async with self._lock:
-            self.data_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.data_path, 'w', encoding='utf-8') as f:
-                data = [proxy.to_dict() for proxy in self.proxies]
-                json.dump(data, f, indent=2, ensure_ascii=False)
+    def _save_proxy_data(self):
+        """压缩：把完整代理列表写成新的基准文件，然后清空健康日志
+
+        基准文件先写临时文件再替换；替换完成前退出时旧基准加日志仍然完整。
+        """
+        self.data_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.data_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            data = {
+                "version": 2,
+                "seq": self.journal.seq,
+                "proxies": [proxy.to_dict() for proxy in self.proxies],
+            }
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        tmp_path.replace(self.data_path)
+        self.journal.reset()
+        self._dirty.clear()
+
+    def flush(self):
+        """把有变化的代理健康状态追加到日志，日志过长时压缩"""
+        if self._dirty:
+            dirty, self._dirty = self._dirty, {}
+            self.journal.append(dirty.values())
+        if self.journal.lines >= self.config.get("journal_compact_lines", 1000):
+            logger.info(f"代理健康日志达到 {self.journal.lines} 行，压缩到 {self.data_path.name}")
+            self._save_proxy_data()
+
+    def _is_healthy(self, proxy: Proxy) -> bool:
+        return proxy.is_active and proxy.fail_count < self.config['max_fail_count']
+
+    def _publish(self):
+        """用当前代理列表构建新快照并替换"""
+        self.snapshot = ProxySnapshot(p for p in self.proxies if self._is_healthy(p))
+
+    def _request_refresh(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
 
     async def start(self):
         """启动代理管理器"""
-        if self.refresh_task is None:
+        # 上一个事件循环结束时任务已被取消，换到新循环上重新启动
+        if self.refresh_task is None or self.refresh_task.done():
+            # 在运行中的事件循环里创建，Python 3.9 的 Event 会绑定创建时的循环
+            self._wakeup = asyncio.Event()
             self.refresh_task = asyncio.create_task(self._auto_refresh())
             logger.info("代理池自动刷新任务已启动")
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._auto_flush())
 
     async def stop(self):
-        """停止代理管理器"""
+        """停止代理管理器，并把还没写入的健康状态落盘"""
         if self.refresh_task:
             self.refresh_task.cancel()
             try:
@@ -86,60 +148,133 @@ class ProxyManager:
                 pass
             self.refresh_task = None
             logger.info("代理池自动刷新任务已停止")
+        if self.flush_task:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        self.flush()
+
+    async def _auto_flush(self):
+        """定期把健康状态写入日志"""
+        while True:
+            try:
+                await asyncio.sleep(self.config.get("flush_interval", 30))
+                self.flush()
+            except asyncio.CancelledError:
+                # 事件循环结束（asyncio.run 返回）时也会走到这里，先把积累的状态落盘
+                self.flush()
+                break
+            except Exception as e:
+                logger.error(f"写入代理健康日志失败: {str(e)}")
 
     async def _auto_refresh(self):
         """自动刷新代理池"""
         while True:
             try:
-                await self.refresh_proxies()
-                await asyncio.sleep(self.config["refresh_interval"])
+                if self._refresh_due():
+                    await self.refresh_proxies()
+                await self._wait_for_next_refresh()
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"代理池刷新失败: {str(e)}")
                 await asyncio.sleep(60)  # 出错后等待1分钟再试
 
+    def _refresh_due(self) -> bool:
+        """在新的事件循环上重新启动时，池不空且刚刷新过就不立即刷新"""
+        if not self._last_refresh or not self.snapshot:
+            return True
+        return time.monotonic() - self._last_refresh >= self.config["refresh_interval"]
+
+    async def _wait_for_next_refresh(self):
+        """等到刷新间隔结束，或者池空被提前唤醒（但两次刷新至少间隔 min_refresh_gap）"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.config["refresh_interval"])
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+        gap = self.config.get("min_refresh_gap", 30) - (time.monotonic() - self._last_refresh)
+        if gap > 0:
+            await asyncio.sleep(gap)
+
     async def refresh_proxies(self):
-        """刷新代理池"""
+        """刷新代理池，由后台任务调用
+
+        获取和验证代理期间不持有任何锁，完成后一次性替换代理列表和快照。
+        """
         logger.info("开始刷新代理池")
-        async with self._lock:
-            new_proxies = await self._fetch_proxies()
-            valid_proxies = await self._validate_proxies(new_proxies)
-            
-            # 更新代理列表
-            self.proxies = [p for p in self.proxies if p.is_active] + valid_proxies
-            await self._save_proxy_data()
-            
-        logger.info(f"代理池刷新完成，当前有效代理数量: {len(self.proxies)}")
+        self._last_refresh = time.monotonic()
+        new_proxies = await self._fetch_proxies()
+        valid_proxies = await self._validate_proxies(new_proxies)
+
+        # 已知的出口原地更新验证结果，保留按站点的健康度和使用计数；
+        # 粘住这些出口的调用方继续报告到同一个对象上
+        merged = {p.key: p for p in self.proxies}
+        for fresh in valid_proxies:
+            known = merged.get(fresh.key)
+            if known is None:
+                merged[fresh.key] = fresh
+                continue
+            known.response_time_ms = fresh.response_time_ms
+            known.last_checked = fresh.last_checked
+            known.fail_count = fresh.fail_count
+            known.is_active = fresh.is_active
+        self.proxies = [p for p in merged.values() if p.is_active]
+        self._publish()
+        self._save_proxy_data()
+
+        logger.info(f"代理池刷新完成，当前有效代理数量: {len(self.snapshot)}")
 
     async def _validate_proxies(self, proxies: List[Proxy]) -> List[Proxy]:
-        """验证代理有效性"""
+        """并发验证代理有效性
+
+        所有验证共用一个连接器，同时进行的验证数由 validate_concurrency 限制；
+        可用代理达到 validate_target 个后取消其余验证。
+        """
         valid_proxies = []
         test_url = self.config["test_url"]
-        timeout = self.config["test_timeout"]
+        timeout = aiohttp.ClientTimeout(total=self.config["test_timeout"])
+        concurrency = max(1, self.config.get("validate_concurrency", 50))
+        target = self.config.get("validate_target", 50)
+        if not proxies:
+            return valid_proxies
 
-        for proxy in proxies:
-            try:
-                start_time = datetime.now()
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(
-                        test_url,
-                        proxy=proxy.url,
-                        timeout=timeout
-                    ) as response:
-                        if response.status == 200:
-                            response_time = (datetime.now() - start_time).total_seconds() * 1000
-                            proxy.response_time_ms = int(response_time)
-                            proxy.last_checked = datetime.now()
-                            proxy.fail_count = 0
-                            proxy.is_active = True
-                            valid_proxies.append(proxy)
-                            logger.debug(f"代理验证成功: {proxy.url}")
-            except Exception as e:
-                logger.debug(f"代理验证失败: {proxy.url} - {str(e)}")
-                continue
+        semaphore = asyncio.Semaphore(concurrency)
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+            async def validate(proxy: Proxy):
+                async with semaphore:
+                    try:
+                        # 单调时钟不受系统时间调整影响
+                        start_time = time.monotonic()
+                        async with session.get(test_url, proxy=proxy.url) as response:
+                            if response.status != 200:
+                                logger.debug(f"代理验证失败: {proxy.url} - HTTP {response.status}")
+                                return
+                            proxy.response_time_ms = int((time.monotonic() - start_time) * 1000)
+                    except Exception as e:
+                        logger.debug(f"代理验证失败: {proxy.url} - {str(e)}")
+                        return
+                proxy.last_checked = datetime.now()
+                proxy.fail_count = 0
+                proxy.is_active = True
+                valid_proxies.append(proxy)
+                logger.debug(f"代理验证成功: {proxy.url}")
+                if target and len(valid_proxies) >= target:
+                    for task in tasks:
+                        if task is not asyncio.current_task():
+                            task.cancel()
 
-        return valid_proxies
+            tasks = [asyncio.create_task(validate(proxy)) for proxy in proxies]
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if target and len(valid_proxies) >= target:
+            logger.info(f"可用代理已达到 {target} 个，停止验证其余代理")
+        return valid_proxies[:target] if target else valid_proxies
 
     async def _fetch_proxies(self) -> List[Proxy]:
         """从配置的源获取代理列表"""
@@ -170,41 +305,45 @@ class ProxyManager:
 
         return all_proxies
 
-    async def get_proxy(self) -> Optional[Proxy]:
-        """获取一个可用代理"""
-        async with self._lock:
-            valid_proxies = [p for p in self.proxies 
-                           if p.is_active and p.fail_count < self.config['max_fail_count']]
-            
-            if not valid_proxies:
-                await self.refresh_proxies()
-                valid_proxies = [p for p in self.proxies 
-                               if p.is_active and p.fail_count < self.config['max_fail_count']]
-            
-            if not valid_proxies:
-                return None
-
-            # 选择响应时间最快的代理
-            proxy = min(valid_proxies, key=lambda p: p.response_time_ms or float('inf'))
-            proxy.last_used = datetime.now()
-            return proxy
-
-    async def report_result(self, proxy: Proxy, success: bool, error_message: str = None):
-        """报告代理使用结果"""
-        async with self._lock:
-            if success:
-                proxy.fail_count = 0
-                proxy.success_count += 1
-                logger.debug(f"代理使用成功: {proxy.url}")
+    async def get_proxy(self, host: Optional[str] = None) -> Optional[Proxy]:
+        """获取一个可用代理
+
+        只读取当前快照，不加锁也不发起网络请求；池空时返回 None，
+        并唤醒后台任务尽快刷新。host 是要访问的站点（URL 或主机名），
+        按各代理访问该站点的历史表现在随机抽出的两个中选较好的。
+        """
+        proxy = self.snapshot.pick(host_key(host) if host else None, self._random)
+        if proxy is None:
+            self._request_refresh()
+            return None
+        proxy.last_used = datetime.now()
+        return proxy
+
+    async def report_result(self, proxy: Proxy, success: bool, error_message: str = None,
+                            host: Optional[str] = None, latency_ms: Optional[float] = None):
+        """报告代理使用结果
+
+        带上 host（URL 或主机名）和 latency_ms 时同时更新该代理访问这个站点的健康度。
+        """
+        if host:
+            proxy.record(host_key(host), success, latency_ms, self.config.get("health_alpha", 0.3))
+        if success:
+            proxy.fail_count = 0
+            proxy.success_count += 1
+            logger.debug(f"代理使用成功: {proxy.url}")
+        else:
+            proxy.fail_count += 1
+            if proxy.fail_count >= self.config['max_fail_count']:
+                proxy.is_active = False
+                self.snapshot = self.snapshot.without(proxy)
+                logger.warning(f"代理已禁用: {proxy.url} - {error_message}")
+                if not self.snapshot:
+                    self._request_refresh()
             else:
-                proxy.fail_count += 1
-                if proxy.fail_count >= self.config['max_fail_count']:
-                    proxy.is_active = False
-                    logger.warning(f"代理已禁用: {proxy.url} - {error_message}")
-                else:
-                    logger.debug(f"代理使用失败: {proxy.url} - {error_message}")
-            
-            await self._save_proxy_data()
+                logger.debug(f"代理使用失败: {proxy.url} - {error_message}")
+
+        # 只标记，由 flush 批量写入
+        self._dirty[proxy.key] = proxy
 
     def get_stats(self) -> Dict:
         """获取代理池统计信息"""
@@ -217,6 +356,7 @@ class ProxyManager:
             "total_proxies": total_proxies,
             "active_proxies": active_proxies,
             "healthy_proxies": healthy_proxies,
+            "snapshot_proxies": len(self.snapshot),
             "average_response_time": sum(
                 (p.response_time_ms or 0) for p in self.proxies if p.response_time_ms
             ) / total_proxies if total_proxies > 0 else 0
@@ -1,6 +1,11 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional
+
+from .health import DEFAULT_LATENCY_MS, HostHealth
+
+HEALTH_FIELDS = ('last_used', 'last_checked', 'fail_count', 'success_count', 'response_time_ms', 'is_active',
+                 'health')
 
 @dataclass
 class Proxy:
@@ -15,7 +20,14 @@ class Proxy:
     success_count: int = 0
     response_time_ms: Optional[int] = None
     is_active: bool = True
+    # 按目标站点分别统计的真实请求健康度，键见 health.host_key
+    health: Dict[str, HostHealth] = field(default_factory=dict)
     
+    @property
+    def key(self) -> tuple:
+        """同一个出口的标识，刷新时用来去重"""
+        return (self.protocol, self.host, self.port, self.username)
+
     @property
     def url(self) -> str:
         """获取代理URL"""
@@ -36,9 +48,36 @@ class Proxy:
             "fail_count": self.fail_count,
             "success_count": self.success_count,
             "response_time_ms": self.response_time_ms,
-            "is_active": self.is_active
+            "is_active": self.is_active,
+            "health": {host: stats.to_dict() for host, stats in self.health.items()}
         }
     
+    def health_dict(self) -> dict:
+        """会随使用情况变化的字段，写入健康日志"""
+        data = self.to_dict()
+        return {name: data[name] for name in HEALTH_FIELDS}
+
+    def update_health(self, data: dict):
+        for name in HEALTH_FIELDS:
+            if name not in data:
+                continue
+            value = data[name]
+            if name in ('last_used', 'last_checked') and value:
+                value = datetime.fromisoformat(value)
+            if name == 'health':
+                value = {host: HostHealth.from_dict(stats) for host, stats in value.items()}
+            setattr(self, name, value)
+
+    def record(self, host: str, success: bool, latency_ms: Optional[float], alpha: float):
+        """记录一次访问 host 的结果"""
+        self.health.setdefault(host, HostHealth()).record(success, latency_ms, alpha)
+
+    def cost(self, host: Optional[str] = None) -> float:
+        """访问 host 的期望成本；没有该站点的记录时用验证耗时估计"""
+        fallback = self.response_time_ms if self.response_time_ms is not None else DEFAULT_LATENCY_MS
+        stats = self.health.get(host) if host else None
+        return stats.cost(fallback) if stats else fallback
+
     @classmethod
     def from_dict(cls, data: dict) -> 'Proxy':
         """从字典创建代理对象"""
@@ -46,4 +85,6 @@ class Proxy:
             data["last_used"] = datetime.fromisoformat(data["last_used"])
         if "last_checked" in data and data["last_checked"]:
             data["last_checked"] = datetime.fromisoformat(data["last_checked"])
+        if data.get("health"):
+            data["health"] = {host: HostHealth.from_dict(stats) for host, stats in data["health"].items()}
         return cls(**data)
\ No newline at end of file
@@ -0,0 +1,45 @@
+import random
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+from .proxy import Proxy
+
+
+def _score(proxy: Proxy) -> float:
+    return proxy.response_time_ms if proxy.response_time_ms is not None else float('inf')
+
+
+class ProxySnapshot:
+    """某一时刻可用代理的只读视图，按响应时间升序排好。
+
+    刷新或禁用代理时构建新的快照整体替换，读取方拿到的快照不会再被修改，
+    所以 get_proxy 不需要加锁。
+    """
+
+    __slots__ = ('proxies', 'built_at')
+
+    def __init__(self, proxies: Iterable[Proxy] = ()):
+        ordered = sorted(proxies, key=_score)
+        self.proxies: Tuple[Proxy, ...] = tuple(ordered)
+        self.built_at = datetime.now()
+
+    def __len__(self) -> int:
+        return len(self.proxies)
+
+    def best(self) -> Optional[Proxy]:
+        return self.proxies[0] if self.proxies else None
+
+    def pick(self, host: Optional[str] = None, rng: random.Random = random) -> Optional[Proxy]:
+        """二选一：随机抽两个代理，返回访问 host 成本较低的那个
+
+        比总是返回最快的代理更能分散负载，同时仍然偏向健康的代理，
+        最差的那个永远不会被选中。
+        """
+        if len(self.proxies) < 2:
+            return self.best()
+        first, second = rng.sample(self.proxies, 2)
+        return first if first.cost(host) <= second.cost(host) else second
+
+    def without(self, proxy: Proxy) -> 'ProxySnapshot':
+        """返回去掉某个代理后的新快照"""
+        return ProxySnapshot(p for p in self.proxies if p.key != proxy.key)
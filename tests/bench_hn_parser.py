@@ -0,0 +1,42 @@
+"""
+Benchmark HackerNews front-page parsers against recorded pages
+
+Usage: python tests/bench_hn_parser.py [limit] [rounds]
+"""
+import os
+import sys
+import time
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawlers.hn_parser import PARSERS, _is_available
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+
+def bench(parser, page, limit, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        parser(page, limit)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    for page_path in sorted(FIXTURES.glob('hn_*.html')):
+        page = page_path.read_text(encoding='utf-8')
+        print(f"\n{page_path.name} ({len(page) / 1024:.1f} KB), limit={limit}, rounds={rounds}")
+        baseline = None
+        for name in ('bs4', 'lxml', 'selectolax', 'scanner'):
+            if not _is_available(name):
+                print(f"  {name:<11} not installed")
+                continue
+            ms = bench(PARSERS[name], page, limit, rounds)
+            baseline = baseline or ms
+            print(f"  {name:<11} {ms:8.3f} ms/page  {baseline / ms:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
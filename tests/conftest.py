@@ -0,0 +1,5 @@
+import os
+
+# 爬虫默认的共享 HTTP 缓存写在工作区的 cache/http 下，测试不使用它：
+# 既不在仓库里留下文件，也不会让真实主机的缓存响应影响测试结果
+os.environ['HTTP_CACHE'] = '0'
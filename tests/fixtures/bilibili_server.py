@@ -0,0 +1,148 @@
+"""
+Local stand-in for the Bilibili web APIs used by BilibiliCrawler
+
+Serves canned responses for the followed-dynamics feed, the per-UP
+video/dynamic endpoints and the nav endpoint that hands out WBI keys, so the
+crawler can be exercised offline. WBI-signed endpoints check `w_rid`.
+
+Usage:
+    python tests/fixtures/bilibili_server.py [port]
+    # then point BilibiliCrawler.base_url at http://localhost:<port>
+"""
+import sys
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from crawlers.bilibili.wbi import get_mixin_key, sign_params
+
+SESSDATA = 'test-sessdata'
+IMG_KEY = '7cd084941338484aae1ad9425b84077c'
+SUB_KEY = '4932caff0ff746eab6f01bf08b70ac45'
+UP_USERS = {'1001': '测试UP主A', '1002': '测试UP主B', '1003': '未关注列表中的UP主'}
+PAGE_SIZE = 4
+BASE_TS = 1_700_000_000
+
+
+def build_feed(count: int = 12) -> List[Dict]:
+    """按时间倒序生成关注动态，视频和图文动态交替出现"""
+    items = []
+    uids = list(UP_USERS)
+    for idx in range(count):
+        uid = uids[idx % len(uids)]
+        pub_ts = BASE_TS - idx * 600
+        author = {'mid': int(uid), 'name': UP_USERS[uid], 'pub_ts': pub_ts}
+        if idx % 2 == 0:
+            dynamic = {
+                'desc': None,
+                'major': {
+                    'type': 'MAJOR_TYPE_ARCHIVE',
+                    'archive': {
+                        'bvid': f'BV1fixture{idx:03d}',
+                        'title': f'视频 {idx}',
+                        'desc': f'视频简介 {idx}',
+                        'duration_text': '10:00',
+                        'stat': {'play': str(1000 + idx), 'danmaku': str(idx)},
+                    },
+                },
+            }
+            item_type = 'DYNAMIC_TYPE_AV'
+        else:
+            dynamic = {'desc': {'text': f'动态 {idx}'}, 'major': None}
+            item_type = 'DYNAMIC_TYPE_WORD'
+        items.append({
+            'id_str': str(900000 + idx),
+            'type': item_type,
+            'modules': {'module_author': author, 'module_dynamic': dynamic},
+        })
+    return items
+
+
+class BilibiliStandIn:
+    def __init__(self, feed: Optional[List[Dict]] = None):
+        self.feed = build_feed() if feed is None else feed
+        self.requests: List[str] = []
+        self.runner = None
+
+    def _logged_in(self, request) -> bool:
+        return request.cookies.get('SESSDATA') == SESSDATA
+
+    async def feed_all(self, request):
+        self.requests.append('feed/all')
+        if not self._logged_in(request):
+            return web.json_response({'code': -101, 'message': '账号未登录', 'data': None})
+        start = int(request.query.get('offset') or 0)
+        page = self.feed[start:start + PAGE_SIZE]
+        next_offset = start + len(page)
+        return web.json_response({'code': 0, 'message': '0', 'data': {
+            'items': page,
+            'offset': str(next_offset),
+            'has_more': next_offset < len(self.feed),
+            'update_baseline': self.feed[0]['id_str'] if self.feed else '',
+        }})
+
+    async def nav(self, request):
+        self.requests.append('nav')
+        code = 0 if self._logged_in(request) else -101
+        return web.json_response({'code': code, 'data': {'wbi_img': {
+            'img_url': f'https://i0.hdslb.com/bfs/wbi/{IMG_KEY}.png',
+            'sub_url': f'https://i0.hdslb.com/bfs/wbi/{SUB_KEY}.png',
+        }}})
+
+    def _signature_ok(self, request) -> bool:
+        params = {key: value for key, value in request.query.items() if key not in ('w_rid', 'wts')}
+        if 'wts' not in request.query:
+            return False
+        expected = sign_params(params, get_mixin_key(IMG_KEY, SUB_KEY), int(request.query['wts']))
+        return request.query.get('w_rid') == expected['w_rid']
+
+    async def arc_search(self, request):
+        uid = request.query['mid']
+        self.requests.append(f'arc/search:{uid}')
+        if not self._signature_ok(request):
+            return web.json_response({'code': -352, 'message': '风控校验失败'})
+        videos = [
+            {
+                'title': item['modules']['module_dynamic']['major']['archive']['title'],
+                'description': '',
+                'bvid': item['modules']['module_dynamic']['major']['archive']['bvid'],
+                'author': item['modules']['module_author']['name'],
+                'created': item['modules']['module_author']['pub_ts'],
+            }
+            for item in self.feed
+            if str(item['modules']['module_author']['mid']) == uid and item['type'] == 'DYNAMIC_TYPE_AV'
+        ]
+        return web.json_response({'code': 0, 'data': {'list': {'vlist': videos}}})
+
+    async def feed_space(self, request):
+        uid = request.query['host_mid']
+        self.requests.append(f'feed/space:{uid}')
+        items = [item for item in self.feed if str(item['modules']['module_author']['mid']) == uid]
+        return web.json_response({'code': 0, 'data': {'items': items, 'offset': '', 'has_more': False}})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/x/polymer/web-dynamic/v1/feed/all', self.feed_all)
+        app.router.add_get('/x/polymer/web-dynamic/v1/feed/space', self.feed_space)
+        app.router.add_get('/x/space/wbi/arc/search', self.arc_search)
+        app.router.add_get('/x/web-interface/nav', self.nav)
+        return app
+
+    async def start(self, port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, 'localhost', port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        # 用 localhost 而不是 IP，aiohttp 不会给 IP 地址发送 cookie
+        return f'http://localhost:{port}'
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    print(f"Bilibili stand-in listening on http://localhost:{port} (SESSDATA={SESSDATA})")
+    web.run_app(BilibiliStandIn().app(), host='localhost', port=port)
@@ -0,0 +1,80 @@
+"""
+Local stand-in for a pool of HTTP forward proxies
+
+One aiohttp server plays every exit: proxies are told apart by the username
+in `Proxy-Authorization`, so `Proxy(host='localhost', port=port,
+username='p1', password='x')` and `username='p2'` look like two different
+exits. Each exit can be given a delay, a status code and extra JSON fields
+for its responses; requests per exit and the peak number of concurrent
+requests are recorded.
+
+Usage:
+    python tests/fixtures/proxy_server.py [port]
+"""
+import sys
+import base64
+import asyncio
+from typing import Dict, List
+
+from aiohttp import web
+
+from proxy_pool import Proxy
+
+
+class ProxyStandIn:
+    def __init__(self, delays: Dict[str, float] = None, statuses: Dict[str, int] = None,
+                 default_delay: float = 0.0, bodies: Dict[str, dict] = None):
+        self.delays = dict(delays or {})
+        self.statuses = dict(statuses or {})
+        self.bodies = dict(bodies or {})
+        self.default_delay = default_delay
+        self.hits: Dict[str, int] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.runner = None
+        self.port = None
+
+    @staticmethod
+    def exit_name(request: web.Request) -> str:
+        auth = request.headers.get('Proxy-Authorization', '')
+        if not auth.startswith('Basic '):
+            return 'direct'
+        return base64.b64decode(auth[6:]).decode('utf-8').split(':', 1)[0]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        name = self.exit_name(request)
+        self.hits[name] = self.hits.get(name, 0) + 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays.get(name, self.default_delay))
+        finally:
+            self.in_flight -= 1
+        body = {'via': name, 'host': request.host, 'path': request.path, **self.bodies.get(name, {})}
+        return web.json_response(body, status=self.statuses.get(name, 200))
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route('*', '/{tail:.*}', self.handle)
+        return app
+
+    async def start(self, port: int = 0) -> int:
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, 'localhost', port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def proxies(self, names: List[str]) -> List[Proxy]:
+        return [Proxy(host='localhost', port=self.port, username=name, password='x') for name in names]
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8899
+    web.run_app(ProxyStandIn().app(), host='localhost', port=port)
@@ -0,0 +1,228 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawlers.bilibili import BilibiliCrawler
+from crawlers.bilibili.watermark import WatermarkStore
+from crawlers.bilibili.wbi import WbiSigner, get_mixin_key, sign_params
+from crawlers.politeness import HostPolicy, PolitenessScheduler
+from tests.fixtures.bilibili_server import SESSDATA, BilibiliStandIn
+
+
+WBI_CACHE_DIR = None
+
+
+def setUpModule():
+    global WBI_CACHE_DIR
+    WBI_CACHE_DIR = tempfile.TemporaryDirectory()
+
+
+def tearDownModule():
+    WBI_CACHE_DIR.cleanup()
+
+
+def make_crawler(**kwargs):
+    with patch.object(BilibiliCrawler, '_load_or_create_session', return_value={}):
+        crawler = BilibiliCrawler(**kwargs)
+    crawler.wbi = WbiSigner(crawler._fetch_wbi_keys, path=Path(WBI_CACHE_DIR.name) / f'wbi_{id(crawler)}.json')
+    return crawler
+
+
+class TestBilibiliFetchTrending(unittest.TestCase):
+    def setUp(self):
+        self.crawler = make_crawler(incremental=False, fetch_mode='per_user')
+        self.up_users = [{'uid': str(uid), 'name': f'up{uid}'} for uid in range(1, 11)]
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        async def fake_videos(uid, **kwargs):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.05)
+            self.in_flight -= 1
+            if uid == '3':
+                raise RuntimeError('boom')
+            return [{'title': f'video {uid}', 'created': int(uid) * 10}]
+
+        async def fake_dynamics(uid, **kwargs):
+            await asyncio.sleep(0.05)
+            return [{'description': f'dynamic {uid}', 'timestamp': int(uid) * 10 + 5}]
+
+        self.crawler.get_up_videos = fake_videos
+        self.crawler.get_up_dynamics = fake_dynamics
+        self.crawler._load_up_users = lambda: self.up_users
+
+    def test_fetches_all_ups_concurrently(self):
+        start = time.monotonic()
+        updates = self.crawler.fetch_trending(limit=4)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertLessEqual(self.max_in_flight, self.crawler.max_concurrent_ups)
+        self.assertEqual(
+            [item.get('created') or item.get('timestamp') for item in updates],
+            [105, 100, 95, 90]
+        )
+
+    def test_failed_up_does_not_drop_others(self):
+        updates = self.crawler.fetch_trending(limit=100)
+        self.assertEqual(len(updates), 19)
+
+
+class TestBilibiliIncremental(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = WatermarkStore(Path(self.tmp_dir.name) / 'watermarks.json')
+        self.crawler = make_crawler(watermarks=self.store, fetch_mode='per_user')
+        self.crawler._load_up_users = lambda: [{'uid': '1'}]
+        # 视频按发布时间倒序，每页 5 条
+        self.videos = [{'title': f'v{ts}', 'url': f'u{ts}', 'created': ts} for ts in range(100, 0, -5)]
+        self.pages_requested = []
+
+        async def fake_videos_page(uid, page_size, page):
+            self.pages_requested.append(page)
+            return self.videos[(page - 1) * page_size:page * page_size]
+
+        async def fake_dynamics_page(uid, offset=''):
+            return [], '', False
+
+        self.crawler._get_videos_page = fake_videos_page
+        self.crawler._get_dynamics_page = fake_dynamics_page
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_stops_paginating_at_watermark(self):
+        first = self.crawler.fetch_trending(limit=3)
+        self.assertEqual([item['created'] for item in first], [100, 95, 90])
+        self.assertEqual(self.pages_requested, [1])
+        self.assertEqual(self.store.since('1')[0], 100)
+
+        # 新发布 7 个视频，翻两页后遇到已见内容就停止
+        self.videos = [{'title': f'v{ts}', 'url': f'u{ts}', 'created': ts} for ts in range(135, 100, -5)] + self.videos
+        self.pages_requested = []
+        self.store.entries['1']['last_checked'] = 0
+        second = self.crawler.fetch_trending(limit=3)
+        self.assertEqual([item['created'] for item in second], [135, 130, 125])
+        self.assertEqual(self.pages_requested, [1, 2])
+        self.assertEqual(self.store.since('1')[0], 135)
+
+    def test_skips_ups_unlikely_to_have_posted(self):
+        now = 1_000_000
+        # 平均每天发布一次，一小时前刚检查过
+        self.store.update('1', [{'url': f'u{day}', 'created': now - day * 86400} for day in range(1, 6)], [],
+                          now=now - 3600)
+        self.assertFalse(self.store.should_check('1', now=now))
+        self.assertTrue(self.store.should_check('1', now=now + 86400))
+        self.assertTrue(self.store.should_check('unknown', now=now))
+
+
+    def test_dynamics_without_url_deduped_by_id(self):
+        dynamics = [{'dynamic_id': f'd{idx}', 'description': f'动态 {idx}', 'timestamp': 50} for idx in range(3)]
+        self.store.update('1', [], dynamics, now=100)
+        self.store.update('1', [], dynamics[:1], now=200)
+        self.assertEqual(sorted(item['dynamic_id'] for item in self.store.recent('1')), ['d0', 'd1', 'd2'])
+
+    def test_pinned_flag_not_returned(self):
+        async def fake_dynamics_page(uid, offset=''):
+            return [
+                {'dynamic_id': 'd1', 'timestamp': 10, 'pinned': True},
+                {'dynamic_id': 'd2', 'timestamp': 90, 'pinned': False},
+                {'dynamic_id': 'd3', 'timestamp': 40, 'pinned': False},
+            ], '', False
+
+        self.crawler._get_dynamics_page = fake_dynamics_page
+        for since in (None, 50):
+            with self.subTest(since=since):
+                dynamics = asyncio.run(self.crawler.get_up_dynamics('1', since=since))
+                self.assertTrue(dynamics)
+                self.assertTrue(all('pinned' not in item for item in dynamics))
+
+
+class TestBilibiliFollowedFeed(unittest.TestCase):
+    def run_against_stand_in(self, sessdata, limit, up_users):
+        server = BilibiliStandIn()
+        scheduler = PolitenessScheduler(policies={}, default_policy=HostPolicy(min_interval=0.01, jitter=(0, 0)))
+        crawler = make_crawler(incremental=False, scheduler=scheduler)
+        crawler.sessdata = sessdata
+        crawler._load_up_users = lambda: up_users
+
+        async def scenario():
+            crawler.base_url = await server.start()
+            try:
+                return await crawler.fetch_trending_async(limit)
+            finally:
+                await crawler.http.close()
+                await server.stop()
+        return asyncio.run(scenario()), server
+
+    def test_feed_replaces_per_user_requests(self):
+        ups = [{'uid': '1001'}, {'uid': '1002'}]
+        updates, server = self.run_against_stand_in(SESSDATA, 5, ups)
+        self.assertEqual(len(updates), 5)
+        self.assertTrue(all(item['up_name'] != '未关注列表中的UP主' for item in updates))
+        self.assertEqual(updates[0]['title'], '视频 0')
+        self.assertEqual(updates[1]['description'], '动态 1')
+        # 每页 4 条，过滤掉第三个UP主后两页才攒够 5 条
+        self.assertEqual(server.requests, ['feed/all', 'feed/all'])
+
+    def test_falls_back_to_per_user_without_login(self):
+        ups = [{'uid': '1001'}, {'uid': '1002'}]
+        updates, server = self.run_against_stand_in('expired', 3, ups)
+        self.assertEqual(server.requests[0], 'feed/all')
+        # 两个UP主并发签名时只请求一次 nav
+        self.assertEqual(
+            sorted(server.requests[1:]),
+            ['arc/search:1001', 'arc/search:1002', 'feed/space:1001', 'feed/space:1002', 'nav']
+        )
+        self.assertEqual(len(updates), 3)
+        self.assertTrue(any(item.get('title') == '视频 0' for item in updates))
+
+
+class TestWbiSigner(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / 'wbi.json'
+        self.fetches = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def fetch_keys(self):
+        self.fetches += 1
+        await asyncio.sleep(0.01)
+        return '7cd084941338484aae1ad9425b84077c', '4932caff0ff746eab6f01bf08b70ac45'
+
+    def test_known_signature(self):
+        mixin_key = get_mixin_key('7cd084941338484aae1ad9425b84077c', '4932caff0ff746eab6f01bf08b70ac45')
+        self.assertEqual(mixin_key, 'ea1db124af3c7062474693fa704f4ff8')
+        signed = sign_params({'foo': '114', 'bar': '514', 'zab': 1919810}, mixin_key, wts=1702204169)
+        self.assertEqual(signed['w_rid'], '8f6f2b5b3d485fe1886cec6a0be8c5d4')
+
+    def test_concurrent_requests_share_one_refresh(self):
+        signer = WbiSigner(self.fetch_keys, path=self.path)
+
+        async def scenario():
+            return await asyncio.gather(*(signer.sign({'mid': uid}) for uid in range(10)))
+
+        self.assertEqual(len(asyncio.run(scenario())), 10)
+        self.assertEqual(self.fetches, 1)
+
+    def test_key_persists_across_runs(self):
+        asyncio.run(WbiSigner(self.fetch_keys, path=self.path).get_key())
+        warm = WbiSigner(self.fetch_keys, path=self.path)
+        self.assertTrue(warm.is_valid())
+        asyncio.run(warm.get_key())
+        self.assertEqual(self.fetches, 1)
+
+        warm.invalidate()
+        asyncio.run(warm.get_key())
+        self.assertEqual(self.fetches, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import sys
+import gzip
+import time
+import asyncio
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from aiohttp import web
+
+from crawlers.cassette import (Cassette, CassetteMiss, deterministic_specs, httpx_transport, match_key,
+                               use_cassette)
+from crawlers.http_client import AsyncSessionHolder, create_session, run_with_sessions
+
+SLOW_DELAY = 0.2
+
+
+class UpstreamServer:
+    """后台线程里的本地上游，记录收到的请求数"""
+
+    def __init__(self):
+        self.hits = 0
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+
+    async def slow(self, request):
+        self.hits += 1
+        await asyncio.sleep(SLOW_DELAY)
+        return web.json_response({'query': dict(request.query)}, headers={'Set-Cookie': 'sid=secret'})
+
+    async def echo(self, request):
+        self.hits += 1
+        return web.json_response({'echo': (await request.read()).decode('utf-8')})
+
+    def start(self) -> str:
+        app = web.Application()
+        app.router.add_get('/slow', self.slow)
+        app.router.add_post('/echo', self.echo)
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.runner = web.AppRunner(app)
+            self.loop.run_until_complete(self.runner.setup())
+            site = web.TCPSite(self.runner, 'localhost', 0)
+            self.loop.run_until_complete(site.start())
+            self.port = site._server.sockets[0].getsockname()[1]
+            self.ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        self.ready.wait(5)
+        return f'http://localhost:{self.port}'
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+
+class TestMatchKey(unittest.TestCase):
+    def test_ignores_signature_params_and_order(self):
+        self.assertEqual(match_key('get', 'https://API.bilibili.com/x?mid=1&wts=1&w_rid=a&b=2'),
+                         match_key('GET', 'https://api.bilibili.com/x?b=2&mid=1&wts=9&w_rid=z'))
+
+    def test_request_body_is_part_of_key(self):
+        self.assertNotEqual(match_key('POST', 'https://a.com/', b'one'), match_key('POST', 'https://a.com/', b'two'))
+
+    def test_deterministic_specs_disable_caches(self):
+        specs = deterministic_specs({'hackernews': {'limit': 5},
+                                     'weibo': {'limit': 5, 'options': {'boards': ['realtime'], 'use_history': True}}})
+        self.assertEqual(specs['hackernews']['options'], {'use_item_cache': False})
+        # 来源配置里打开的历史记录也会被关掉
+        self.assertEqual(specs['weibo']['options'], {'boards': ['realtime'], 'use_history': False})
+
+
+class TestRecordReplay(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / 'run.jsonl.gz'
+        self.server = UpstreamServer()
+        self.base_url = self.server.start()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def fetch_all(self):
+        """同一批请求分别走 requests、aiohttp 和 httpx"""
+        session = create_session(retries=0)
+        holder = AsyncSessionHolder(use_http_cache=False)
+        results = [session.get(f'{self.base_url}/slow', params={'via': 'requests', 'wts': str(time.time())}).json()]
+
+        async def fetch_async():
+            async with holder.get().get(f'{self.base_url}/slow', params={'via': 'aiohttp'}) as response:
+                response.raise_for_status()
+                return await response.json()
+
+        results.append(run_with_sessions(fetch_async(), holder))
+        with httpx.Client(transport=httpx_transport()) as client:
+            results.append(client.post(f'{self.base_url}/echo', content=b'prompt').json())
+        return results
+
+    def test_replay_returns_recorded_responses_offline(self):
+        with use_cassette(Cassette(self.path, mode='record')):
+            recorded = self.fetch_all()
+        self.assertEqual(self.server.hits, 3)
+        self.server.stop()
+
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            text = f.read()
+        self.assertNotIn('secret', text)
+
+        for latency, check in (('zero', self.assertLess), ('original', self.assertGreaterEqual)):
+            with use_cassette(Cassette(self.path, mode='replay', latency=latency)):
+                start = time.monotonic()
+                self.assertEqual(self.fetch_all(), recorded)
+                check(time.monotonic() - start, 2 * SLOW_DELAY)
+
+    def test_unrecorded_request_raises(self):
+        with use_cassette(Cassette(self.path, mode='record')):
+            create_session(retries=0).get(f'{self.base_url}/slow')
+        self.server.stop()
+
+        with use_cassette(Cassette(self.path, mode='replay')):
+            session = create_session(retries=0)
+            # 同一个请求重复出现时回放最后一条
+            self.assertEqual(session.get(f'{self.base_url}/slow').status_code, 200)
+            self.assertEqual(session.get(f'{self.base_url}/slow').status_code, 200)
+            with self.assertRaises(CassetteMiss):
+                session.get(f'{self.base_url}/slow', params={'other': '1'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+import os
+import sys
+import asyncio
+import unittest
+import tempfile
+import time
+from pathlib import Path
+from aiohttp import web
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawlers.hacker_news import HackerNewsCrawler
+from crawlers.http_client import create_session
+from crawlers.hn_item_cache import HNItemCache
+
+
+class FakeHNApi:
+    """本地模拟的 HackerNews Firebase API"""
+    def __init__(self, story_ids, delay=0.05):
+        self.story_ids = story_ids
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.item_requests = 0
+        self.updated_ids = []
+        self.max_item = None
+
+    async def topstories(self, request):
+        return web.json_response(self.story_ids)
+
+    async def updates(self, request):
+        return web.json_response({'items': self.updated_ids, 'profiles': []})
+
+    async def maxitem(self, request):
+        return web.json_response(self.max_item or max(self.story_ids))
+
+    async def item(self, request):
+        story_id = int(request.match_info['story_id'].split('.')[0])
+        self.item_requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # 倒序延迟，让先请求的 item 后返回
+            await asyncio.sleep(self.delay * (1 + story_id % 3))
+        finally:
+            self.in_flight -= 1
+        return web.json_response({
+            'id': story_id,
+            'title': f'Story {story_id}',
+            'url': f'https://example.com/{story_id}',
+            'score': story_id,
+        })
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/v0/topstories.json', self.topstories)
+        app.router.add_get('/v0/updates.json', self.updates)
+        app.router.add_get('/v0/maxitem.json', self.maxitem)
+        app.router.add_get('/v0/item/{story_id}', self.item)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f'http://127.0.0.1:{port}/v0'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class TestHackerNewsApiFanout(unittest.TestCase):
+    def run_with_api(self, api, crawler, limit):
+        async def scenario():
+            crawler.api_base_url = await api.start()
+            try:
+                return await crawler._fetch_from_api_async(limit)
+            finally:
+                await crawler.http.close()
+                await api.stop()
+        return asyncio.run(scenario())
+
+    def test_fanout_keeps_ranking_order(self):
+        """并发拉取后仍保持 topstories 的排名顺序"""
+        api = FakeHNApi([5, 4, 3, 2, 1, 9, 8, 7])
+        stories = self.run_with_api(api, HackerNewsCrawler(api_concurrency=4, use_item_cache=False), 6)
+        self.assertEqual(
+            [story['title'] for story in stories],
+            ['Story 5', 'Story 4', 'Story 3', 'Story 2', 'Story 1', 'Story 9']
+        )
+        self.assertEqual(stories[0]['score'], '5 points')
+        self.assertEqual(api.item_requests, 6)
+
+    def test_fanout_respects_concurrency_cap(self):
+        """同时进行的 item 请求数不超过并发上限"""
+        api = FakeHNApi(list(range(1, 21)))
+        stories = self.run_with_api(api, HackerNewsCrawler(api_concurrency=3, use_item_cache=False), 20)
+        self.assertEqual(len(stories), 20)
+        self.assertLessEqual(api.max_in_flight, 3)
+        self.assertGreater(api.max_in_flight, 1)
+
+
+class TestHackerNewsItemCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = Path(self.tmp_dir.name) / 'hn_items.json'
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def fetch(self, api, limit, sequential=False):
+        crawler = HackerNewsCrawler(item_cache=HNItemCache(self.cache_path))
+        crawler.session = create_session(retries=0)
+
+        async def scenario():
+            crawler.api_base_url = await api.start()
+            try:
+                if sequential:
+                    # 顺序路径用同步的 requests 会话，放到线程里避免阻塞模拟服务器
+                    return await asyncio.to_thread(crawler._fetch_from_api_sequential, limit)
+                return await crawler._fetch_from_api_async(limit)
+            finally:
+                await crawler.http.close()
+                await api.stop()
+        return asyncio.run(scenario())
+
+    def test_second_run_only_fetches_updated_items(self):
+        """第二次运行只重新拉取 updates.json 中变化的 item"""
+        api = FakeHNApi([1, 2, 3, 4], delay=0)
+        self.assertEqual(len(self.fetch(api, 4)), 4)
+        self.assertEqual(api.item_requests, 4)
+
+        api.item_requests = 0
+        api.updated_ids = [2, 99]
+        stories = self.fetch(api, 4)
+        self.assertEqual([story['title'] for story in stories], ['Story 1', 'Story 2', 'Story 3', 'Story 4'])
+        self.assertEqual(api.item_requests, 1)
+
+    def test_sequential_fetch_uses_item_cache(self):
+        """没法另起事件循环时的顺序路径同样只拉取变化的 item"""
+        api = FakeHNApi([1, 2, 3, 4], delay=0)
+        self.assertEqual(len(self.fetch(api, 4, sequential=True)), 4)
+        self.assertEqual(api.item_requests, 4)
+
+        api.item_requests = 0
+        api.updated_ids = [3]
+        stories = self.fetch(api, 4, sequential=True)
+        self.assertEqual([story['title'] for story in stories], ['Story 1', 'Story 2', 'Story 3', 'Story 4'])
+        self.assertEqual(api.item_requests, 1)
+
+    def test_large_max_item_gap_drops_cache(self):
+        """两次同步之间新增的 item 太多时，更新列表不可信，全部重新拉取"""
+        api = FakeHNApi([1, 2, 3, 4], delay=0)
+        self.fetch(api, 4)
+        self.assertEqual(HNItemCache(self.cache_path).max_item, 4)
+
+        api.item_requests = 0
+        api.max_item = 4 + HNItemCache(self.cache_path).max_item_gap + 1
+        self.fetch(api, 4)
+        self.assertEqual(api.item_requests, 4)
+
+    def test_expired_entries_are_refetched(self):
+        """超过 max_age 的缓存条目会被视为缺失"""
+        cache = HNItemCache(self.cache_path, max_age=0)
+        cache.put({'id': 1, 'title': 'Old'})
+        cache.items[1]['_fetched_at'] -= 10
+        self.assertEqual(cache.missing([1]), [1])
+
+
+class TestHackerNewsHedging(unittest.TestCase):
+    def make_crawler(self, website, api, hedge_delay):
+        crawler = HackerNewsCrawler(use_item_cache=False, hedge_delay=hedge_delay)
+        self.cancelled = []
+
+        def path(name, delay, result):
+            async def fetch(limit):
+                try:
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    self.cancelled.append(name)
+                    raise
+                return result
+            return fetch
+
+        crawler._fetch_from_website_async = path('website', *website)
+        crawler._fetch_from_api_async = path('api', *api)
+        return crawler
+
+    def test_fast_primary_skips_secondary(self):
+        crawler = self.make_crawler((0.01, [{'title': 'web'}]), (0.01, [{'title': 'api'}]), 0.5)
+        self.assertEqual(crawler.fetch_trending(5), [{'title': 'web'}])
+        self.assertEqual(self.cancelled, [])
+
+    def test_slow_primary_loses_and_is_cancelled(self):
+        crawler = self.make_crawler((5, [{'title': 'web'}]), (0.01, [{'title': 'api'}]), 0.05)
+        start = time.monotonic()
+        self.assertEqual(crawler.fetch_trending(5), [{'title': 'api'}])
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.cancelled, ['website'])
+
+    def test_empty_result_waits_for_other_path(self):
+        crawler = self.make_crawler((0.01, []), (0.1, [{'title': 'api'}]), 0)
+        self.assertEqual(crawler.fetch_trending(5), [{'title': 'api'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawlers.hn_parser import PARSERS, _is_available, get_parser, parse_with_scanner
+
+FRONT_PAGE = (Path(__file__).parent / 'fixtures' / 'hn_front_page.html').read_text(encoding='utf-8')
+
+
+class TestHNParser(unittest.TestCase):
+    def test_backends_agree_with_bs4(self):
+        """所有已安装的后端与原 BeautifulSoup 解析结果一致"""
+        if not _is_available('bs4'):
+            self.skipTest('bs4 not installed')
+        expected = PARSERS['bs4'](FRONT_PAGE, 30)
+        for name, parser in PARSERS.items():
+            if _is_available(name):
+                with self.subTest(parser=name):
+                    self.assertEqual(parser(FRONT_PAGE, 30), expected)
+
+    def test_scanner_fields(self):
+        stories = parse_with_scanner(FRONT_PAGE, 30)
+        self.assertEqual(len(stories), 30)
+        # 站内帖子、HTML 实体和没有分数的招聘帖
+        self.assertTrue(stories[4]['url'].startswith('item?id='))
+        self.assertIn('& "more"', stories[6]['title'])
+        self.assertEqual(stories[16]['score'], 'No score')
+        self.assertTrue(stories[0]['score'].endswith('points'))
+
+    def test_limit_stops_early(self):
+        self.assertEqual(len(parse_with_scanner(FRONT_PAGE, 3)), 3)
+        self.assertEqual(parse_with_scanner('<html></html>', 5), [])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_parser('html5lib')
+
+
+if __name__ == '__main__':
+    unittest.main()
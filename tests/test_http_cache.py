@@ -0,0 +1,233 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+import unittest
+from email.utils import formatdate
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+
+from crawlers.http_cache import HTTPCache
+from crawlers.http_client import AsyncSessionHolder, create_session, run_with_sessions
+
+
+class CacheServer:
+    """在后台线程里运行的本地服务，记录每个路径收到的请求数和 304 次数"""
+
+    ETAG = '"v1"'
+
+    def __init__(self):
+        self.hits = {}
+        self.not_modified = 0
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+
+    def _count(self, request):
+        self.hits[request.path] = self.hits.get(request.path, 0) + 1
+
+    async def max_age(self, request):
+        self._count(request)
+        return web.json_response({'path': 'max-age'}, headers={'Cache-Control': 'max-age=60'})
+
+    async def etag(self, request):
+        self._count(request)
+        if request.headers.get('If-None-Match') == self.ETAG:
+            self.not_modified += 1
+            return web.Response(status=304, headers={'ETag': self.ETAG})
+        return web.json_response({'path': 'etag'}, headers={'ETag': self.ETAG, 'Cache-Control': 'no-cache'})
+
+    async def no_store(self, request):
+        self._count(request)
+        return web.json_response({'path': 'no-store'}, headers={'Cache-Control': 'no-store'})
+
+    async def large(self, request):
+        self._count(request)
+        return web.Response(body=b'x' * 100000, headers={'Cache-Control': 'max-age=60'})
+
+    def start(self) -> str:
+        app = web.Application()
+        app.router.add_get('/max-age', self.max_age)
+        app.router.add_get('/etag', self.etag)
+        app.router.add_get('/no-store', self.no_store)
+        app.router.add_get('/large', self.large)
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.runner = web.AppRunner(app)
+            self.loop.run_until_complete(self.runner.setup())
+            site = web.TCPSite(self.runner, 'localhost', 0)
+            self.loop.run_until_complete(site.start())
+            self.port = site._server.sockets[0].getsockname()[1]
+            self.ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        self.ready.wait(5)
+        return f'http://localhost:{self.port}'
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+
+class TestFreshness(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = HTTPCache(Path(self.tmp_dir.name), host_ttls={'api.example.com': 120})
+        self.now = 1_700_000_000
+        self.date = formatdate(self.now, usegmt=True)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def lifetime(self, url, headers):
+        return self.cache.freshness_lifetime(url, headers, now=self.now)
+
+    def test_max_age_minus_age(self):
+        self.assertEqual(self.lifetime('https://a.com/', {'cache-control': 'max-age=60', 'age': '20',
+                                                          'date': self.date}), 40)
+
+    def test_expires_relative_to_date(self):
+        expires = formatdate(self.now + 300, usegmt=True)
+        self.assertEqual(self.lifetime('https://a.com/', {'expires': expires, 'date': self.date}), 300)
+        self.assertEqual(self.lifetime('https://a.com/', {'expires': '0', 'date': self.date}), 0)
+
+    def test_last_modified_heuristic(self):
+        last_modified = formatdate(self.now - 1000, usegmt=True)
+        self.assertEqual(self.lifetime('https://a.com/', {'last-modified': last_modified, 'date': self.date}), 100)
+
+    def test_host_ttl_only_without_explicit_freshness(self):
+        self.assertEqual(self.lifetime('https://api.example.com/x', {'date': self.date}), 120)
+        self.assertEqual(self.lifetime('https://api.example.com/x', {'cache-control': 'no-cache',
+                                                                     'date': self.date}), 0)
+        self.assertEqual(self.lifetime('https://other.com/x', {'date': self.date}), 0)
+
+    def test_not_storable(self):
+        self.assertFalse(self.cache.storable('GET', 200, {'Cache-Control': 'no-store'}))
+        self.assertFalse(self.cache.storable('GET', 200, {'Vary': '*'}))
+        self.assertFalse(self.cache.storable('POST', 200, {}))
+        self.assertFalse(self.cache.storable('GET', 404, {}))
+        # 既没有新鲜期也没有验证器
+        self.assertIsNone(self.cache.store('https://other.com/x', 200, {}, b'body'))
+
+    def test_vary_mismatch_is_a_miss(self):
+        self.cache.store('https://a.com/v', 200, {'Cache-Control': 'max-age=60', 'Vary': 'Accept-Language'},
+                         b'zh', request_headers={'Accept-Language': 'zh-CN'})
+        self.assertIsNotNone(self.cache.lookup('https://a.com/v', {'Accept-Language': 'zh-CN'}))
+        self.assertIsNone(self.cache.lookup('https://a.com/v', {'Accept-Language': 'en'}))
+
+
+class TestEviction(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = HTTPCache(Path(self.tmp_dir.name), max_bytes=25)
+        self.headers = {'Cache-Control': 'max-age=60'}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_identical_bodies_stored_once(self):
+        self.cache.store('https://a.com/1', 200, self.headers, b'0123456789')
+        self.cache.store('https://a.com/2', 200, self.headers, b'0123456789')
+        self.assertEqual(len(list(self.cache.bodies.rglob('*'))), 2)  # 一个子目录加一个文件
+
+    def test_least_recently_used_evicted(self):
+        self.cache.store('https://a.com/1', 200, self.headers, b'1' * 10)
+        time.sleep(0.01)
+        self.cache.store('https://a.com/2', 200, self.headers, b'2' * 10)
+        time.sleep(0.01)
+        self.assertIsNotNone(self.cache.lookup('https://a.com/1'))
+        time.sleep(0.01)
+        self.cache.store('https://a.com/3', 200, self.headers, b'3' * 10)
+
+        self.assertIsNotNone(self.cache.lookup('https://a.com/1'))
+        self.assertIsNone(self.cache.lookup('https://a.com/2'))
+        self.assertIsNotNone(self.cache.lookup('https://a.com/3'))
+        self.assertLessEqual(self.cache.total_size(), 25)
+        self.assertEqual(len([p for p in self.cache.bodies.rglob('*') if p.is_file()]), 2)
+
+
+class TestCachingClients(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = CacheServer()
+        cls.base_url = cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = HTTPCache(Path(self.tmp_dir.name), host_ttls={})
+        self.server.hits.clear()
+        self.server.not_modified = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_requests_serves_fresh_and_revalidates_stale(self):
+        session = create_session(retries=0, http_cache=self.cache)
+
+        first = session.get(f'{self.base_url}/max-age')
+        second = session.get(f'{self.base_url}/max-age')
+        self.assertEqual(second.json(), first.json())
+        self.assertTrue(second.from_cache)
+        self.assertEqual(self.server.hits['/max-age'], 1)
+
+        session.get(f'{self.base_url}/etag')
+        revalidated = session.get(f'{self.base_url}/etag')
+        self.assertEqual(revalidated.status_code, 200)
+        self.assertEqual(revalidated.json(), {'path': 'etag'})
+        self.assertEqual(self.server.hits['/etag'], 2)
+        self.assertEqual(self.server.not_modified, 1)
+
+        session.get(f'{self.base_url}/no-store')
+        session.get(f'{self.base_url}/no-store')
+        self.assertEqual(self.server.hits['/no-store'], 2)
+
+    def test_requests_partial_stream_not_cached(self):
+        session = create_session(retries=0, http_cache=self.cache)
+        response = session.get(f'{self.base_url}/large', stream=True)
+        next(response.iter_content(1024))
+        response.close()
+        self.assertIsNone(self.cache.lookup(f'{self.base_url}/large'))
+
+        with session.get(f'{self.base_url}/large', stream=True) as response:
+            self.assertEqual(sum(len(chunk) for chunk in response.iter_content(1024)), 100000)
+        self.assertIsNotNone(self.cache.lookup(f'{self.base_url}/large'))
+
+    def test_aiohttp_serves_fresh_and_revalidates_stale(self):
+        holder = AsyncSessionHolder(http_cache=self.cache)
+
+        async def scenario():
+            session = holder.get()
+            results = []
+            for path in ('max-age', 'max-age', 'etag', 'etag'):
+                async with session.get(f'{self.base_url}/{path}') as response:
+                    response.raise_for_status()
+                    results.append((response.status, await response.json()))
+            async with session.get(f'{self.base_url}/large') as response:
+                received = 0
+                async for chunk in response.content.iter_chunked(4096):
+                    received += len(chunk)
+            async with session.get(f'{self.base_url}/large') as response:
+                cached = await response.read()
+            return results, received, cached
+
+        results, received, cached = run_with_sessions(scenario(), holder)
+        self.assertEqual(results, [(200, {'path': 'max-age'})] * 2 + [(200, {'path': 'etag'})] * 2)
+        self.assertEqual(self.server.hits, {'/max-age': 1, '/etag': 2, '/large': 1})
+        self.assertEqual(self.server.not_modified, 1)
+        self.assertEqual(received, 100000)
+        self.assertEqual(cached, b'x' * 100000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawlers.http_client import AsyncSessionHolder, TimeoutHTTPAdapter, get_session, run_with_sessions
+
+
+class TestHttpClient(unittest.TestCase):
+    def test_shared_session_enforces_timeout(self):
+        """没有显式传 timeout 时使用适配器上的默认超时"""
+        session = get_session()
+        self.assertIs(session, get_session())
+        adapter = session.get_adapter('https://example.com')
+        self.assertIsInstance(adapter, TimeoutHTTPAdapter)
+
+        with patch('requests.adapters.HTTPAdapter.send') as send:
+            adapter.send(object())
+            self.assertEqual(send.call_args.kwargs['timeout'], adapter.timeout)
+            adapter.send(object(), timeout=3)
+            self.assertEqual(send.call_args.kwargs['timeout'], 3)
+
+    def test_holder_reuses_session_within_loop(self):
+        holder = AsyncSessionHolder()
+
+        async def scenario():
+            first = holder.get()
+            self.assertIs(first, holder.get())
+            return first
+
+        session = run_with_sessions(scenario(), holder)
+        self.assertTrue(session.closed)
+
+        # 新的事件循环会拿到新的会话
+        async def another_loop():
+            return holder.get()
+        self.assertIsNot(run_with_sessions(another_loop(), holder), session)
+
+
+if __name__ == '__main__':
+    unittest.main()
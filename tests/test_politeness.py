@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import asyncio
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawlers.politeness import HostPolicy, PolitenessScheduler, is_throttled
+
+
+class TestPolitenessScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = PolitenessScheduler(policies={
+            'slow.example.com': HostPolicy(min_interval=0.1, max_interval=1.0, jitter=(0, 0)),
+            'fast.example.com': HostPolicy(min_interval=0.1, jitter=(0, 0), burst=3),
+        })
+
+    def test_first_request_does_not_wait(self):
+        self.assertEqual(self.scheduler.reserve('https://slow.example.com/a'), 0)
+
+    def test_queued_requests_are_spaced(self):
+        delays = [self.scheduler.reserve('slow.example.com') for _ in range(3)]
+        self.assertEqual(delays[0], 0)
+        self.assertAlmostEqual(delays[1], 0.1, places=2)
+        self.assertAlmostEqual(delays[2], 0.2, places=2)
+
+    def test_burst_allows_immediate_requests(self):
+        delays = [self.scheduler.reserve('fast.example.com') for _ in range(4)]
+        self.assertEqual(delays[:3], [0, 0, 0])
+        self.assertGreater(delays[3], 0)
+
+    def test_hosts_run_in_parallel(self):
+        """不同 host 的等待互不影响"""
+        async def scenario():
+            start = time.monotonic()
+            await asyncio.gather(*(
+                self.scheduler.wait(host)
+                for host in ['slow.example.com', 'slow.example.com', 'fast.example.com', 'other.example.com']
+            ))
+            return time.monotonic() - start
+        self.assertLess(asyncio.run(scenario()), 0.5)
+
+    def test_throttling_grows_and_success_shrinks_interval(self):
+        self.scheduler.report('slow.example.com', status=429)
+        self.assertAlmostEqual(self.scheduler.interval('slow.example.com'), 0.2)
+        self.scheduler.report('slow.example.com', status=200, code=-799)
+        self.assertAlmostEqual(self.scheduler.interval('slow.example.com'), 0.4)
+        for _ in range(10):
+            self.scheduler.report('slow.example.com', throttled=True)
+        self.assertEqual(self.scheduler.interval('slow.example.com'), 1.0)
+        for _ in range(30):
+            self.scheduler.report('slow.example.com', status=200, code=0)
+        self.assertEqual(self.scheduler.interval('slow.example.com'), 0.1)
+
+    def test_is_throttled(self):
+        self.assertTrue(is_throttled(status=429))
+        self.assertTrue(is_throttled(code=-412))
+        self.assertFalse(is_throttled(status=200, code=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
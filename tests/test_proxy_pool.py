@@ -0,0 +1,330 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import tempfile
+import unittest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from proxy_pool import Proxy, ProxyManager, ProxySnapshot
+from proxy_pool.health import HostHealth, host_key
+from tests.fixtures.proxy_server import ProxyStandIn
+
+
+class TestProxyValidation(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.manager = ProxyManager(config_dir=self.tmp_dir.name)
+        self.manager.config.update({
+            'test_url': 'http://health.invalid/health',
+            'test_timeout': 1,
+            'validate_concurrency': 10,
+            'validate_target': 0,
+        })
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def validate(self, server, names):
+        """返回 (可用代理, 验证耗时)"""
+        async def scenario():
+            await server.start()
+            try:
+                started = time.monotonic()
+                valid = await self.manager._validate_proxies(server.proxies(names))
+                return valid, time.monotonic() - started
+            finally:
+                await server.stop()
+        return asyncio.run(scenario())
+
+    def test_validates_concurrently_under_limit(self):
+        server = ProxyStandIn(default_delay=0.1, statuses={'p3': 503}, delays={'p5': 1.2})
+        names = [f'p{idx}' for idx in range(20)]
+
+        valid, elapsed = self.validate(server, names)
+        # 串行需要三秒以上；并发 10 个时两轮加上一个超时
+        self.assertLess(elapsed, 1.6)
+        self.assertLessEqual(server.max_in_flight, 10)
+        self.assertEqual(sorted(p.username for p in valid), sorted(set(names) - {'p3', 'p5'}))
+        for proxy in valid:
+            self.assertGreaterEqual(proxy.response_time_ms, 90)
+            self.assertTrue(proxy.is_active)
+            self.assertIsNotNone(proxy.last_checked)
+
+    def test_stops_once_target_reached(self):
+        self.manager.config.update({'validate_concurrency': 4, 'validate_target': 3})
+        server = ProxyStandIn(default_delay=0.05)
+        names = [f'p{idx}' for idx in range(40)]
+
+        valid, _ = self.validate(server, names)
+        self.assertEqual(len(valid), 3)
+        self.assertLess(sum(server.hits.values()), 10)
+
+
+class TestProxySelection(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.manager = ProxyManager(config_dir=self.tmp_dir.name)
+        self.manager.config.update({'refresh_interval': 3600, 'min_refresh_gap': 0, 'max_fail_count': 2})
+        self.candidates = [Proxy(host='10.0.0.1', port=8000 + idx, response_time_ms=100 - idx * 10)
+                           for idx in range(3)]
+        self.fetches = 0
+
+        async def fake_fetch():
+            self.fetches += 1
+            return list(self.candidates) if self.fetches > 1 else []
+
+        async def fake_validate(proxies):
+            # 和真实验证一样，验证通过的代理重新启用
+            for proxy in proxies:
+                proxy.fail_count = 0
+                proxy.is_active = True
+            return proxies
+
+        self.manager._fetch_proxies = fake_fetch
+        self.manager._validate_proxies = fake_validate
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_empty_pool_returns_immediately_and_wakes_refresh(self):
+        async def scenario():
+            await self.manager.start()
+            try:
+                await asyncio.sleep(0.01)
+                # 以前这里会在 _lock 上死锁
+                first = await asyncio.wait_for(self.manager.get_proxy(), 0.5)
+                for _ in range(50):
+                    await asyncio.sleep(0.01)
+                    if len(self.manager.snapshot):
+                        break
+                return first, await self.manager.get_proxy()
+            finally:
+                await self.manager.stop()
+
+        first, second = asyncio.run(scenario())
+        self.assertIsNone(first)
+        self.assertEqual(self.fetches, 2)
+        # 二选一时最慢的那个不会被选中
+        self.assertIn(second.port, (8001, 8002))
+
+    def test_refresh_swaps_snapshot_and_failures_rotate(self):
+        self.fetches = 1
+
+        async def scenario():
+            await asyncio.wait_for(self.manager.refresh_proxies(), 1)
+            old_snapshot = self.manager.snapshot
+            fastest = old_snapshot.best()
+            for _ in range(2):
+                await self.manager.report_result(fastest, success=False, error_message='timeout')
+            return old_snapshot, fastest, await self.manager.get_proxy()
+
+        old_snapshot, fastest, replacement = asyncio.run(scenario())
+        self.assertEqual([p.port for p in old_snapshot.proxies], [8002, 8001, 8000])
+        self.assertEqual(fastest.port, 8002)
+        # 只剩两个代理时二选一总是返回较快的
+        self.assertEqual(replacement.port, 8001)
+        # 旧快照没有被原地修改
+        self.assertEqual(len(old_snapshot), 3)
+        self.assertEqual(len(self.manager.snapshot), 2)
+
+        # 再次刷新时同一个出口不会重复
+        asyncio.run(self.manager.refresh_proxies())
+        self.assertEqual(len(self.manager.proxies), 3)
+
+
+class TestHealthScoring(unittest.TestCase):
+    def setUp(self):
+        self.proxies = [Proxy(host='10.0.0.3', port=7000 + idx, response_time_ms=100) for idx in range(4)]
+        self.snapshot = ProxySnapshot(self.proxies)
+        self.rng = random.Random(7)
+
+    def picks(self, host, rounds=2000):
+        counts = {p.port: 0 for p in self.proxies}
+        for _ in range(rounds):
+            counts[self.snapshot.pick(host, self.rng).port] += 1
+        return counts
+
+    def test_host_key_groups_subdomains(self):
+        self.assertEqual(host_key('https://m.weibo.cn/api/container/getIndex'), 'weibo.cn')
+        self.assertEqual(host_key('api.bilibili.com:443'), 'bilibili.com')
+        self.assertEqual(host_key('https://edith.xiaohongshu.com/api'), 'xiaohongshu.com')
+        self.assertEqual(host_key('127.0.0.1'), '127.0.0.1')
+
+    def test_ewma_tracks_latency_and_success(self):
+        stats = HostHealth()
+        stats.record(True, 100, alpha=0.5)
+        stats.record(False, 300, alpha=0.5)
+        self.assertEqual(stats.latency_ms, 200)
+        self.assertEqual(stats.success_rate, 0.5)
+        self.assertEqual(stats.cost(fallback_ms=50), 400)
+        self.assertEqual(HostHealth.from_dict(stats.to_dict()), stats)
+
+    def test_equal_proxies_share_load(self):
+        counts = self.picks('bilibili.com')
+        for count in counts.values():
+            self.assertGreater(count, 300)
+
+    def test_degraded_proxy_is_avoided_only_for_its_host(self):
+        slow = self.proxies[0]
+        for proxy in self.proxies:
+            for _ in range(5):
+                proxy.record('bilibili.com', proxy is not slow, 2000 if proxy is slow else 100, alpha=0.3)
+
+        self.assertEqual(self.picks('bilibili.com')[slow.port], 0)
+        # 其他站点仍然照常分配
+        self.assertGreater(self.picks('weibo.cn')[slow.port], 300)
+
+    def test_reported_results_update_host_health(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manager = ProxyManager(config_dir=tmp_dir)
+            manager.proxies = self.proxies
+            manager._publish()
+            proxy = self.proxies[1]
+            asyncio.run(manager.report_result(proxy, success=True, host='https://api.bilibili.com/x', latency_ms=80))
+            asyncio.run(manager.report_result(proxy, success=False, host='api.bilibili.com', error_message='412'))
+            manager._save_proxy_data()
+
+            stats = ProxyManager(config_dir=tmp_dir).proxies[1].health['bilibili.com']
+            self.assertEqual(stats.samples, 2)
+            self.assertEqual(stats.latency_ms, 80)
+            self.assertLess(stats.success_rate, 1)
+
+    def test_refresh_keeps_health_of_known_exits(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manager = ProxyManager(config_dir=tmp_dir)
+            manager.proxies = self.proxies
+            manager._publish()
+            known = self.proxies[0]
+            for _ in range(5):
+                asyncio.run(manager.report_result(known, success=True, host='api.bilibili.com', latency_ms=80))
+
+            # 刷新时提供方返回的是同一出口的新对象
+            fresh = Proxy(host=known.host, port=known.port, response_time_ms=40)
+
+            async def fetch():
+                return [fresh]
+
+            async def validate(proxies):
+                return proxies
+
+            manager._fetch_proxies = fetch
+            manager._validate_proxies = validate
+            asyncio.run(manager.refresh_proxies())
+
+            refreshed = next(p for p in manager.proxies if p.key == known.key)
+            self.assertIs(refreshed, known)
+            self.assertEqual(refreshed.response_time_ms, 40)
+            self.assertEqual(refreshed.success_count, 5)
+            self.assertEqual(refreshed.health['bilibili.com'].samples, 5)
+            self.assertIn(known, manager.snapshot.proxies)
+
+
+class TestHealthJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.manager = self.new_manager()
+        self.manager.proxies = [Proxy(host='10.0.0.2', port=9000 + idx, response_time_ms=50) for idx in range(3)]
+        self.manager._save_proxy_data()
+        self.base_mtime = os.stat(self.manager.data_path).st_mtime_ns
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def new_manager(self):
+        manager = ProxyManager(config_dir=self.tmp_dir.name)
+        manager.config.update({'max_fail_count': 3, 'flush_interval': 3600, 'journal_compact_lines': 1000})
+        return manager
+
+    def report(self, port, success, times=1):
+        proxy = next(p for p in self.manager.proxies if p.port == port)
+        for _ in range(times):
+            asyncio.run(self.manager.report_result(proxy, success=success, error_message='timeout'))
+
+    def test_reports_do_not_touch_disk_until_flush(self):
+        self.report(9000, True, times=5)
+        self.report(9001, False, times=2)
+        self.assertEqual(os.stat(self.manager.data_path).st_mtime_ns, self.base_mtime)
+        self.assertFalse(self.manager.journal.path.exists())
+
+        self.manager.flush()
+        # 每个有变化的代理一行，与报告次数无关
+        with open(self.manager.journal.path, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 2)
+        self.assertEqual(os.stat(self.manager.data_path).st_mtime_ns, self.base_mtime)
+
+    def test_new_manager_replays_journal(self):
+        self.report(9000, True, times=5)
+        self.report(9001, False, times=3)
+        self.manager.flush()
+        self.report(9000, True)
+        self.manager.flush()
+        with open(self.manager.journal.path, 'a', encoding='utf-8') as f:
+            f.write('{"seq": 99, "key": ["ht')
+
+        restored = {p.port: p for p in self.new_manager().proxies}
+        self.assertEqual(restored[9000].success_count, 6)
+        self.assertEqual(restored[9001].fail_count, 3)
+        self.assertFalse(restored[9001].is_active)
+        self.assertTrue(restored[9002].is_active)
+
+    def test_append_after_torn_line_survives(self):
+        self.report(9000, True)
+        self.manager.flush()
+        with open(self.manager.journal.path, 'a', encoding='utf-8') as f:
+            f.write('{"seq": 2, "key": ["ht')
+
+        # 重新加载时截掉残行，之后追加的记录不会和残行粘在一起
+        manager = self.new_manager()
+        proxy = next(p for p in manager.proxies if p.port == 9001)
+        asyncio.run(manager.report_result(proxy, success=True))
+        manager.flush()
+
+        restored = {p.port: p for p in self.new_manager().proxies}
+        self.assertEqual(restored[9000].success_count, 1)
+        self.assertEqual(restored[9001].success_count, 1)
+
+    def test_compaction_folds_journal_into_base(self):
+        self.manager.config['journal_compact_lines'] = 3
+        for port in (9000, 9001):
+            self.report(port, True)
+            self.manager.flush()
+        self.assertEqual(self.manager.journal.lines, 2)
+        self.report(9002, False)
+        self.manager.flush()
+
+        self.assertFalse(self.manager.journal.path.exists())
+        with open(self.manager.data_path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.assertEqual(data['seq'], 3)
+        self.assertEqual([p['success_count'] for p in data['proxies']], [1, 1, 0])
+
+        # 压缩后的新记录 seq 接着增长，重新加载时不会被当成旧记录
+        self.report(9002, True)
+        self.manager.flush()
+        restored = {p.port: p for p in self.new_manager().proxies}
+        self.assertEqual(restored[9002].success_count, 1)
+        self.assertEqual(restored[9002].fail_count, 0)
+
+    def test_legacy_list_format_still_loads(self):
+        with open(self.manager.data_path, 'w', encoding='utf-8') as f:
+            json.dump([p.to_dict() for p in self.manager.proxies], f)
+        self.assertEqual(len(self.new_manager().proxies), 3)
+
+    def test_stop_flushes_pending_reports(self):
+        self.manager._fetch_proxies = lambda: asyncio.sleep(0, [])
+
+        async def scenario():
+            await self.manager.start()
+            proxy = self.manager.proxies[0]
+            await self.manager.report_result(proxy, success=True)
+            await self.manager.stop()
+
+        asyncio.run(scenario())
+        self.assertEqual(self.new_manager().proxies[0].success_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
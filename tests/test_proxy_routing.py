@@ -0,0 +1,156 @@
+import os
+import sys
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawlers.bilibili import BilibiliCrawler
+from crawlers.http_client import AsyncSessionHolder, run_with_sessions
+from crawlers.politeness import PolitenessScheduler
+from crawlers.proxy_routing import ProxyRouter, get_proxy_router, proxy_pool_hosts
+from proxy_pool import Proxy, ProxyManager
+from tests.fixtures.proxy_server import ProxyStandIn
+
+TARGET = 'http://api.bilibili.com/x/space/wbi/acc/info'
+
+
+class TestProxyRouting(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.manager = ProxyManager(config_dir=self.tmp_dir.name)
+        self.manager.config.update({'refresh_interval': 3600, 'max_fail_count': 3})
+
+        async def no_new_proxies():
+            return []
+
+        self.manager._fetch_proxies = no_new_proxies
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_requests(self, server, exits, urls, on_response=None, **router_kwargs):
+        """exits: {名称: 验证耗时}，返回每个请求经过的出口和路由器
+
+        on_response: 每个响应读出 JSON 后调用的协程函数 (holder, response, data)
+        """
+        router = ProxyRouter(self.manager, **router_kwargs)
+        holder = AsyncSessionHolder(use_http_cache=False, proxy_router=router)
+
+        async def scenario():
+            await server.start()
+            try:
+                proxies = server.proxies(list(exits))
+                for proxy in proxies:
+                    proxy.response_time_ms = exits[proxy.username]
+                self.manager.proxies = proxies
+                self.manager._publish()
+                via = []
+                for url in urls:
+                    async with holder.get().get(url.format(port=server.port)) as response:
+                        data = await response.json()
+                        via.append(data['via'])
+                        if on_response is not None:
+                            await on_response(holder, response, data)
+                await holder.close()
+                return via
+            finally:
+                await server.stop()
+
+        return asyncio.run(scenario()), router
+
+    def proxy(self, name) -> Proxy:
+        return next(p for p in self.manager.proxies if p.username == name)
+
+    def test_sticks_to_one_exit_and_reports_results(self):
+        via, _ = self.run_requests(ProxyStandIn(), {'p0': 10, 'p1': 50}, [TARGET] * 5)
+        self.assertEqual(via, ['p0'] * 5)
+        stats = self.proxy('p0').health['bilibili.com']
+        self.assertEqual(stats.samples, 5)
+        self.assertEqual(self.proxy('p0').success_count, 5)
+        # 健康状态在事件循环结束时已写入日志
+        self.assertTrue(self.manager.journal.path.exists())
+
+    def test_throttled_exit_is_rotated_out(self):
+        server = ProxyStandIn(statuses={'p0': 412})
+        via, router = self.run_requests(server, {'p0': 10, 'p1': 50}, [TARGET] * 4)
+        self.assertEqual(via, ['p0', 'p1', 'p1', 'p1'])
+        self.assertEqual(self.proxy('p0').fail_count, 1)
+        self.assertLess(self.proxy('p0').health['bilibili.com'].success_rate, 1)
+
+    def test_business_code_throttle_retires_only_the_serving_exit(self):
+        with patch.object(BilibiliCrawler, '_load_or_create_session', return_value={}):
+            crawler = BilibiliCrawler(incremental=False, scheduler=PolitenessScheduler(policies={}))
+
+        async def report(holder, response, data):
+            crawler.http = holder
+            await crawler._report_response(response, data)
+
+        server = ProxyStandIn(bodies={'p0': {'code': -412}, 'p1': {'code': 0}})
+        via, router = self.run_requests(server, {'p0': 10, 'p1': 20, 'p2': 30}, [TARGET] * 4,
+                                        on_response=report, exits_per_host=2)
+        # 最慢的 p2 一开始不会被选中，前两个请求分别用 p0 和 p1
+        self.assertEqual(sorted(via[:2]), ['p0', 'p1'])
+        self.assertNotIn('p0', via[via.index('p0') + 1:])
+        # p1 一直保留，p0 换成了 p2
+        self.assertEqual(sorted(p.username for p in router._exits['bilibili.com']), ['p1', 'p2'])
+        p0 = self.proxy('p0')
+        self.assertEqual(p0.fail_count, 1)
+        self.assertEqual(p0.health['bilibili.com'].samples, 2)
+        self.assertEqual(self.proxy('p1').fail_count, 0)
+
+    def test_spreads_over_several_exits_per_host(self):
+        via, _ = self.run_requests(ProxyStandIn(), {'p0': 10, 'p1': 20, 'p2': 30}, [TARGET] * 6,
+                                   exits_per_host=2)
+        self.assertEqual(len(set(via)), 2)
+        self.assertEqual(via[:2] * 3, via)
+
+    def test_other_hosts_and_empty_pool_go_direct(self):
+        local = 'http://localhost:{port}/direct'
+        via, _ = self.run_requests(ProxyStandIn(), {'p0': 10}, [local, TARGET], hosts=['bilibili.com'])
+        self.assertEqual(via, ['direct', 'p0'])
+
+        via, _ = self.run_requests(ProxyStandIn(), {}, [local])
+        self.assertEqual(via, ['direct'])
+
+    def test_unreachable_exit_raises_and_is_reported(self):
+        router = ProxyRouter(self.manager)
+        holder = AsyncSessionHolder(use_http_cache=False, proxy_router=router)
+        dead = Proxy(host='127.0.0.1', port=1, response_time_ms=10)
+        self.manager.proxies = [dead]
+        self.manager._publish()
+
+        async def fetch():
+            async with holder.get().get(TARGET) as response:
+                return response.status
+
+        with self.assertRaises(Exception):
+            run_with_sessions(fetch(), holder)
+        self.assertEqual(dead.fail_count, 1)
+        self.assertEqual(router._exits['bilibili.com'], [])
+
+
+class TestProxyPoolSetting(unittest.TestCase):
+    def test_parses_hosts(self):
+        cases = {None: None, '0': None, '1': [], 'all': [],
+                 'bilibili.com, xiaohongshu.com': ['bilibili.com', 'xiaohongshu.com']}
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                if value is None:
+                    os.environ.pop('PROXY_POOL', None)
+                else:
+                    os.environ['PROXY_POOL'] = value
+                try:
+                    self.assertEqual(proxy_pool_hosts(), expected)
+                finally:
+                    os.environ.pop('PROXY_POOL', None)
+
+    def test_disabled_by_default(self):
+        os.environ.pop('PROXY_POOL', None)
+        self.assertIsNone(get_proxy_router())
+        self.assertIsNone(AsyncSessionHolder(use_http_cache=False).proxy_router)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,254 @@
+import os
+import sys
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawlers import registry
+from crawlers.deadlines import LatencyHistory, RunBudget, late_notice
+from crawlers.registry import SyncCrawlerAdapter, as_async, discover, fetch_sources, register_source, run_sources
+from crawlers.result_cache import SourceResultCache
+
+
+class NativeSource:
+    closed = []
+
+    def __init__(self, delay=0.05, count=3, fail=False):
+        self.delay = delay
+        self.count = count
+        self.fail = fail
+
+    async def fetch(self, limit):
+        for idx in range(self.count):
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError('boom')
+            yield {'title': f'item {idx}', 'thread': threading.get_ident()}
+
+    async def aclose(self):
+        NativeSource.closed.append(self)
+
+
+class BlockingSource:
+    def fetch_trending(self, limit=5):
+        return [{'title': f'sync {idx}'} for idx in range(limit)]
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        NativeSource.closed = []
+        register_source('test_native')(NativeSource)
+        register_source('test_blocking')(BlockingSource)
+
+    def tearDown(self):
+        registry._sources.pop('test_native', None)
+        registry._sources.pop('test_blocking', None)
+
+    def test_discovers_builtin_crawlers(self):
+        self.assertTrue({'hackernews', 'weibo', 'xiaohongshu', 'bilibili'} <= set(discover()))
+
+    def test_native_and_sync_crawlers(self):
+        from crawlers.weibo import WeiboCrawler
+        crawler = WeiboCrawler()
+        self.assertIs(as_async(crawler), crawler)
+        self.assertIsInstance(as_async(BlockingSource()), SyncCrawlerAdapter)
+        with self.assertRaises(TypeError):
+            as_async(object())
+
+    def test_sources_share_one_event_loop(self):
+        specs = {
+            'test_native': {'limit': 2, 'options': {'delay': 0.1}},
+            'test_blocking': {'limit': 3},
+            'missing_source': {'limit': 3},
+        }
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            results = await fetch_sources(specs)
+            return results, loop.time() - started
+
+        results, elapsed = asyncio.run(scenario())
+        self.assertEqual([item['title'] for item in results['test_native']], ['item 0', 'item 1'])
+        self.assertEqual(results['test_blocking'], [{'title': f'sync {idx}'} for idx in range(3)])
+        self.assertNotIn('missing_source', results)
+        # 原生异步来源在事件循环线程上运行
+        self.assertEqual(results['test_native'][0]['thread'], threading.get_ident())
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(len(NativeSource.closed), 1)
+
+    def test_timeout_and_errors_keep_partial_results(self):
+        results = asyncio.run(fetch_sources({'test_native': {'limit': 5, 'options': {'delay': 0.1, 'count': 5}}},
+                                            timeout=0.25))
+        self.assertEqual(len(results['test_native']), 2)
+
+        results = asyncio.run(fetch_sources({'test_native': {'options': {'fail': True}}}))
+        self.assertEqual(results['test_native'], [])
+        self.assertEqual(len(NativeSource.closed), 2)
+
+
+class VersionedSource:
+    """每次抓取返回递增版本号；failing 为 True 时抓取失败"""
+    calls = 0
+    failing = False
+    delay = 0.0
+
+    def fetch_trending(self, limit=5):
+        VersionedSource.calls += 1
+        time.sleep(VersionedSource.delay)
+        if VersionedSource.failing:
+            raise RuntimeError('upstream down')
+        return [{'title': f'v{VersionedSource.calls}'}]
+
+
+class TestStaleWhileRevalidate(unittest.TestCase):
+    specs = {'test_versioned': {'limit': 1}}
+
+    def setUp(self):
+        VersionedSource.calls, VersionedSource.failing, VersionedSource.delay = 0, False, 0.0
+        register_source('test_versioned')(VersionedSource)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = SourceResultCache(path=Path(self.tmp_dir.name) / 'results.json', ttl=60, max_stale=3600)
+
+    def tearDown(self):
+        self.cache.wait()
+        registry._sources.pop('test_versioned', None)
+        self.tmp_dir.cleanup()
+
+    def titles(self, **kwargs):
+        return [item['title'] for item in run_sources(self.specs, cache=self.cache, **kwargs)['test_versioned']]
+
+    def age_entry(self, seconds):
+        self.cache.entries['test_versioned']['fetched_at'] -= seconds
+
+    def test_fresh_results_skip_fetch(self):
+        self.assertEqual(self.titles(), ['v1'])
+        self.assertEqual(self.titles(), ['v1'])
+        self.assertEqual(VersionedSource.calls, 1)
+        self.assertFalse(self.cache.meta('test_versioned')['stale'])
+
+    def test_stale_results_served_while_refreshing(self):
+        self.titles()
+        self.age_entry(120)
+        VersionedSource.delay = 0.2
+
+        started = time.monotonic()
+        self.assertEqual(self.titles(), ['v1'])
+        self.assertLess(time.monotonic() - started, 0.15)
+        meta = self.cache.meta('test_versioned')
+        self.assertTrue(meta['stale'])
+        self.assertTrue(meta['refreshing'])
+        self.assertGreaterEqual(meta['age_seconds'], 120)
+
+        # 刷新进行中时不会重复发起
+        self.assertEqual(self.titles(), ['v1'])
+        self.cache.wait()
+        self.assertEqual(VersionedSource.calls, 2)
+        self.assertEqual(self.titles(), ['v2'])
+        self.assertFalse(self.cache.meta('test_versioned')['refreshing'])
+
+        # 缓存写到了磁盘，新的进程也能直接使用
+        reloaded = SourceResultCache(path=self.cache.path, ttl=60)
+        self.assertEqual(reloaded.lookup('test_versioned', 1)[0], [{'title': 'v2'}])
+
+    def test_brief_fetches_stale_sources_inline(self):
+        """每日简报：前一天的结果虽然还在 max_stale 之内，也要当场重新抓取"""
+        self.titles()
+        self.age_entry(120)
+        self.assertEqual(self.titles(serve_stale=False), ['v2'])
+        self.assertFalse(self.cache.meta('test_versioned')['refreshing'])
+
+        # 抓取失败时才退回缓存
+        self.age_entry(120)
+        VersionedSource.failing = True
+        self.assertEqual(self.titles(serve_stale=False), ['v2'])
+        self.assertEqual(VersionedSource.calls, 3)
+
+    def test_failed_refresh_keeps_last_good_result(self):
+        self.titles()
+        self.age_entry(7200)
+        VersionedSource.failing = True
+        self.assertEqual(self.titles(), ['v1'])
+        self.assertEqual(VersionedSource.calls, 2)
+        self.assertGreaterEqual(self.cache.meta('test_versioned')['age_seconds'], 7200)
+
+
+class TestRunBudget(unittest.TestCase):
+    def setUp(self):
+        NativeSource.closed = []
+        register_source('test_native')(NativeSource)
+        register_source('test_slow')(NativeSource)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.history = LatencyHistory(Path(self.tmp_dir.name) / 'latency.json', min_samples=3,
+                                      margin=0.5, min_deadline=0.05)
+
+    def tearDown(self):
+        registry._sources.pop('test_native', None)
+        registry._sources.pop('test_slow', None)
+        self.tmp_dir.cleanup()
+
+    def test_deadline_from_latency_history(self):
+        self.assertEqual(self.history.deadline('test_native', 30), 30)
+        for seconds in (0.1, 0.2, 0.1, 0.4):
+            self.history.add('test_native', seconds)
+        self.assertAlmostEqual(self.history.deadline('test_native', 30), 0.6)
+        # 超时样本按放大后的值记，截止时间会逐渐放宽
+        self.history.add('test_native', 0.6, timed_out=True)
+        self.assertAlmostEqual(self.history.deadline('test_native', 30), 1.35)
+
+        self.history.save()
+        reloaded = LatencyHistory(self.history.path, min_samples=3, margin=0.5, min_deadline=0.05)
+        self.assertAlmostEqual(reloaded.deadline('test_native', 30), 1.35)
+
+    def test_slow_source_marked_late_within_run_budget(self):
+        for _ in range(3):
+            self.history.add('test_native', 0.1)
+        specs = {
+            'test_native': {'limit': 3, 'options': {'delay': 0.02}},
+            'test_slow': {'limit': 5, 'options': {'delay': 0.15, 'count': 5}},
+        }
+        budget = RunBudget(0.5, self.history)
+
+        started = time.monotonic()
+        results = run_sources(specs, timeout=30, budget=budget)
+        self.assertLess(time.monotonic() - started, 0.7)
+
+        self.assertEqual(len(results['test_native']), 3)
+        self.assertNotIn('test_native', budget.late)
+        # 没有历史的来源用剩余预算作截止时间，保留已拿到的部分；说明不混进内容条目
+        self.assertEqual(budget.late, {'test_slow': 3})
+        self.assertEqual(len(results['test_slow']), 3)
+        self.assertFalse(any(item.get('late') for item in results['test_slow']))
+        self.assertIn('test_slow（已收到 3 条）', late_notice(budget.late))
+        self.assertEqual(late_notice({}), '')
+        self.assertEqual(len(self.history.samples['test_slow']), 1)
+        self.assertTrue(self.history.path.exists())
+
+    def test_failed_fetch_not_recorded_as_latency(self):
+        specs = {
+            'test_native': {'limit': 3, 'options': {'delay': 0.01, 'fail': True}},
+            'test_slow': {'limit': 3, 'options': {'delay': 0.01}},
+        }
+        run_sources(specs, budget=RunBudget(5, self.history))
+        self.assertNotIn('test_native', self.history.samples)
+        self.assertEqual(len(self.history.samples['test_slow']), 1)
+
+    def test_late_partial_results_not_cached_as_fresh(self):
+        cache = SourceResultCache(path=Path(self.tmp_dir.name) / 'results.json', ttl=60)
+        specs = {'test_slow': {'limit': 5, 'options': {'delay': 0.1, 'count': 5}}}
+        budget = RunBudget(0.25, self.history)
+        results = run_sources(specs, cache=cache, budget=budget)
+        self.assertIn('test_slow', budget.late)
+        self.assertLess(len(results['test_slow']), 5)
+        self.assertTrue(cache.meta('test_slow')['refreshing'])
+        # 后台用更宽的时限补抓到完整结果
+        cache.wait()
+        self.assertEqual(len(cache.lookup('test_slow', 5)[0]), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
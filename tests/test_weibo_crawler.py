@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import aiohttp
+from aiohttp import web
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawlers.politeness import HostPolicy, PolitenessScheduler
+from crawlers.weibo import BOARDS, WeiboCrawler, board_url
+from crawlers.json_stream import BracketMatcher, decode_chunks, iter_array_items, loads_js_object
+
+
+def build_payload(count=50):
+    card_group = []
+    for idx in range(count):
+        if idx % 5 == 0:
+            card_group.append({'card_type': 7, 'desc': '广告 [推荐]'})
+        card_group.append({
+            'card_type': 4,
+            'desc': f'热搜话题 {idx} "引号" {{括号}}',
+            'scheme': f'https://m.weibo.cn/search?containerid=topic{idx}',
+            'desc_extr': f'{1000000 - idx}',
+        })
+    return {'ok': 1, 'data': {'cardlistInfo': {'v_p': 42}, 'cards': [{'card_group': card_group}]}}
+
+
+class FakeResponse:
+    """模拟 aiohttp 响应：按固定大小分块返回响应体，并记录读取了多少块"""
+
+    def __init__(self, payload, chunk_size=64):
+        self.body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.chunk_size = chunk_size
+        self.chunks_read = 0
+        self.closed = False
+        self.status = 200
+        self.charset = 'utf-8'
+        self.content = self
+
+    @property
+    def total_chunks(self):
+        return -(-len(self.body) // self.chunk_size)
+
+    def raise_for_status(self):
+        pass
+
+    async def iter_chunked(self, n):
+        for start in range(0, len(self.body), self.chunk_size):
+            self.chunks_read += 1
+            yield self.body[start:start + self.chunk_size]
+
+    async def read(self):
+        return self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, respond):
+        self.respond = respond
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return self.respond(url)
+
+
+def board_payload(topics):
+    return {'data': {'cards': [{'card_group': [
+        {'card_type': 4, 'desc': title, 'scheme': f'https://m.weibo.cn/{title}', 'desc_extr': str(hot)}
+        for title, hot in topics
+    ]}]}}
+
+
+def make_crawler(**kwargs):
+    """请求间隔几乎为零，测试不用等 m.weibo.cn 的节奏"""
+    scheduler = PolitenessScheduler(default_policy=HostPolicy(min_interval=0.001, jitter=(0, 0)), policies={})
+    return WeiboCrawler(scheduler=scheduler, **kwargs)
+
+
+class TestJsonStream(unittest.TestCase):
+    def test_matcher_ignores_brackets_in_strings(self):
+        text = '{"a": "}]\\"{", "b": [1, {"c": 2}]} trailing'
+        matcher = BracketMatcher()
+        end = matcher.feed(text[:10])
+        self.assertEqual(end, -1)
+        end = matcher.feed(text, 10)
+        self.assertEqual(json.loads(text[:end]), {'a': '}]"{', 'b': [1, {'c': 2}]})
+
+    def test_items_split_across_chunks(self):
+        payload = {'head': {'card_group_x': 1}, 'card_group': [{'k': '中文'}, [1, 2], 3, 'a,]b', None, 4.5]}
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        for size in (1, 2, 7, len(body)):
+            chunks = (body[i:i + size] for i in range(0, len(body), size))
+            items = list(iter_array_items(decode_chunks(chunks), 'card_group'))
+            self.assertEqual(items, payload['card_group'], size)
+
+    def test_js_undefined_replaced_outside_strings_only(self):
+        text = '{"a": "x, undefined}", "b": undefined, "c": [undefined, "[undefined]", "\\\\", undefined]}'
+        self.assertEqual(loads_js_object(text),
+                         {'a': 'x, undefined}', 'b': None, 'c': [None, '[undefined]', '\\', None]})
+
+    def test_missing_or_truncated_array(self):
+        self.assertEqual(list(iter_array_items(['{"cards": []}'], 'card_group')), [])
+        self.assertEqual(list(iter_array_items(['{"card_group": [{"a": 1}, {"b"'], 'card_group')), [{'a': 1}])
+
+
+class TestWeiboStreaming(unittest.TestCase):
+    def fetch(self, response, limit, **kwargs):
+        crawler = make_crawler(**kwargs)
+        with patch.object(crawler.http, 'get', return_value=FakeSession(lambda url: response)), \
+                patch('builtins.print'):
+            return crawler.fetch_trending(limit=limit)
+
+    def test_stops_reading_after_limit(self):
+        response = FakeResponse(build_payload())
+        topics = self.fetch(response, limit=5)
+
+        self.assertEqual([t['title'] for t in topics], [f'热搜话题 {i} "引号" {{括号}}' for i in range(5)])
+        self.assertEqual(topics[0]['hot_value'], 1000000)
+        self.assertTrue(response.closed)
+        self.assertLess(response.chunks_read, response.total_chunks // 4)
+
+    def test_streaming_matches_buffered(self):
+        streamed = self.fetch(FakeResponse(build_payload()), limit=20)
+        buffered = self.fetch(FakeResponse(build_payload()), limit=20, stream=False)
+        strip = lambda items: [{k: v for k, v in t.items() if k != 'timestamp'} for t in items]
+        self.assertEqual(strip(streamed), strip(buffered))
+
+    def test_debug_dump_only_when_enabled(self):
+        for debug_dump in (False, True):
+            crawler = make_crawler(debug_dump=debug_dump)
+            session = FakeSession(lambda url: FakeResponse({'ok': 0, 'msg': '这里没有数据'}))
+            with patch.object(crawler.http, 'get', return_value=session), patch('builtins.print') as printed:
+                self.assertEqual(crawler.fetch_trending(limit=5), [])
+            dumped = any('这里没有数据' in str(call.args[0]) for call in printed.call_args_list)
+            self.assertEqual(dumped, debug_dump)
+
+
+class TestWeiboBoards(unittest.TestCase):
+    def test_default_board_keeps_original_url(self):
+        crawler = make_crawler()
+        self.assertEqual(
+            crawler.api_url,
+            "https://m.weibo.cn/api/container/getIndex?containerid=106003type%3D25%26t%3D3%26disable_hot%3D1%26filter_type%3Drealtimehot"
+        )
+
+    def test_boards_merged_by_title_and_ranked(self):
+        payloads = {
+            board_url('realtime'): [('话题A', 500000), ('话题B', 300000)],
+            board_url('society'): [('话题B', 800000), ('话题C', 100000)],
+            board_url('tech-board-id'): [('话题D', 600000)],
+        }
+        crawler = make_crawler(boards=['realtime', 'society', 'tech-board-id'])
+
+        session = FakeSession(lambda url: FakeResponse(board_payload(payloads[url])))
+        with patch.object(crawler.http, 'get', return_value=session), patch('builtins.print'):
+            topics = crawler.fetch_trending(limit=3)
+
+        self.assertEqual(len(session.urls), 3)
+        self.assertEqual([(t['title'], t['hot_value']) for t in topics],
+                         [('话题B', 800000), ('话题D', 600000), ('话题A', 500000)])
+        self.assertEqual(topics[0]['board'], 'society')
+        self.assertIn('realtime', BOARDS)
+
+    def test_board_requests_go_through_scheduler(self):
+        scheduler = PolitenessScheduler(policies={'m.weibo.cn': HostPolicy(min_interval=0.001, jitter=(0, 0))})
+        crawler = WeiboCrawler(boards=['realtime', 'society'], scheduler=scheduler)
+        responses = {board_url('realtime'): 200, board_url('society'): 412}
+
+        def respond(url):
+            response = FakeResponse(board_payload([('话题A', 1)]))
+            response.status = responses[url]
+            return response
+
+        with patch.object(crawler.http, 'get', return_value=FakeSession(respond)), \
+                patch.object(scheduler, 'wait', wraps=scheduler.wait) as wait, patch('builtins.print'):
+            crawler.fetch_trending(limit=5)
+
+        self.assertEqual(wait.call_count, 2)
+        self.assertTrue(all('m.weibo.cn' in call.args[0] for call in wait.call_args_list))
+        # 被限流的榜单拉长了 m.weibo.cn 的请求间隔
+        self.assertGreater(scheduler.interval('m.weibo.cn'), 0.001)
+
+    def test_failed_board_does_not_drop_others(self):
+        crawler = make_crawler(boards=['realtime', 'society'])
+
+        def respond(url):
+            if url == board_url('society'):
+                raise aiohttp.ClientConnectionError('boom')
+            return FakeResponse(board_payload([('话题A', 1)]))
+
+        with patch.object(crawler.http, 'get', return_value=FakeSession(respond)), patch('builtins.print'):
+            self.assertEqual([t['title'] for t in crawler.fetch_trending(limit=5)], ['话题A'])
+
+
+class TestWeiboAsync(unittest.TestCase):
+    async def serve(self, payloads):
+        """按 containerid 分块流式返回榜单"""
+
+        async def get_index(request):
+            containerid = request.query['containerid']
+            body = json.dumps(payloads[containerid], ensure_ascii=False).encode('utf-8')
+            response = web.StreamResponse(headers={'Content-Type': 'application/json; charset=utf-8'})
+            await response.prepare(request)
+            for start in range(0, len(body), 256):
+                await response.write(body[start:start + 256])
+                await asyncio.sleep(0.002)
+            await response.write_eof()
+            return response
+
+        app = web.Application()
+        app.router.add_get('/api/container/getIndex', get_index)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, 'localhost', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f'http://localhost:{port}/api/container/getIndex'
+
+    def test_native_fetch_merges_boards(self):
+        realtime = build_payload()
+        society = {'data': {'cards': [{'card_group': [
+            {'card_type': 4, 'desc': '社会话题', 'scheme': '', 'desc_extr': '2000000'},
+        ]}]}}
+
+        async def scenario():
+            runner, api_base = await self.serve({BOARDS['realtime']: realtime, BOARDS['society']: society})
+            crawler = make_crawler(boards=['realtime', 'society'])
+            crawler.api_base = api_base
+            try:
+                return [topic async for topic in crawler.fetch(limit=3)]
+            finally:
+                await crawler.aclose()
+                await runner.cleanup()
+
+        with patch('builtins.print'):
+            topics = asyncio.run(scenario())
+        self.assertEqual([t['title'] for t in topics],
+                         ['社会话题', '热搜话题 0 "引号" {括号}', '热搜话题 1 "引号" {括号}'])
+        self.assertEqual(topics[0]['board'], 'society')
+
+    def test_native_fetch_ranks_by_hot_value_and_keeps_hottest_duplicate(self):
+        payloads = {
+            board_url('realtime'): [('话题A', 500000), ('话题B', 300000), ('话题C', 200000)],
+            board_url('society'): [('话题B', 800000), ('话题D', 100000)],
+        }
+        crawler = make_crawler(boards=['realtime', 'society'])
+        session = FakeSession(lambda url: FakeResponse(board_payload(payloads[url])))
+
+        async def scenario():
+            with patch.object(crawler.http, 'get', return_value=session):
+                return [topic async for topic in crawler.fetch(limit=4)]
+
+        with patch('builtins.print'):
+            topics = asyncio.run(scenario())
+        self.assertEqual([(t['title'], t['hot_value']) for t in topics],
+                         [('话题B', 800000), ('话题A', 500000), ('话题C', 200000), ('话题D', 100000)])
+        self.assertEqual(topics[0]['board'], 'society')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawlers.weibo import WeiboCrawler
+from crawlers.weibo_history import HotValueStore
+
+STEP = 300
+START = 1_700_000_000
+
+
+def poll_series(store, hours=24, spike_hours=1):
+    """稳定话题每小时涨 1 万；爆发话题前面同样平稳，最后 spike_hours 小时每小时涨 50 万"""
+    steady, spiking = 100000, 100000
+    steps = hours * 3600 // STEP
+    for i in range(steps + 1):
+        ts = START + i * STEP
+        steady += 10000 * STEP // 3600
+        in_spike = i > steps - spike_hours * 3600 // STEP
+        spiking += (500000 if in_spike else 10000) * STEP // 3600
+        store.record([
+            {'title': '平稳话题', 'hot_value': steady},
+            {'title': '爆发话题', 'hot_value': spiking},
+        ], now=ts)
+    return START + steps * STEP
+
+
+class TestHotValueStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / 'weibo_hot'
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_rising_topic_detected_against_own_history(self):
+        store = HotValueStore(path=self.path)
+        now = poll_series(store)
+
+        trends = store.trends(now=now)
+        self.assertAlmostEqual(trends['爆发话题']['velocity'], 500000, delta=1000)
+        self.assertAlmostEqual(trends['平稳话题']['velocity'], 10000, delta=1000)
+        self.assertGreater(trends['爆发话题']['zscore'], 100)
+        self.assertLess(abs(trends['平稳话题']['zscore']), 1)
+        self.assertEqual([title for title, _ in store.rising(now=now)], ['爆发话题'])
+
+    def test_reopen_and_window_slicing(self):
+        now = poll_series(HotValueStore(path=self.path), hours=48)
+        store = HotValueStore(path=self.path)
+        self.assertEqual(len(store), 2 * (48 * 3600 // STEP + 1))
+
+        ts, topic, hot = store.window_rows(now - 3600, now)
+        self.assertEqual(len(ts), 2 * (3600 // STEP + 1))
+        self.assertTrue((ts >= now - 3600).all())
+
+        # 重新打开后话题 ID 保持不变，新观测继续追加
+        store.record([{'title': '平稳话题', 'hot_value': 1}, {'title': '新话题', 'hot_value': 2}], now=now + STEP)
+        self.assertEqual(store.titles, ['平稳话题', '爆发话题', '新话题'])
+        self.assertIsNone(store.trends(now=now + STEP)['新话题']['zscore'])
+
+    def test_partial_write_is_truncated(self):
+        store = HotValueStore(path=self.path)
+        store.record([{'title': 'a', 'hot_value': 1}], now=START)
+        with open(self.path / 'hot.bin', 'ab') as f:
+            f.write(b'\x00' * 5)
+        self.assertEqual(len(HotValueStore(path=self.path)), 1)
+        self.assertEqual((self.path / 'hot.bin').stat().st_size, 8)
+
+    def test_new_titles_are_appended(self):
+        store = HotValueStore(path=self.path)
+        store.record([{'title': 'a', 'hot_value': 1}, {'title': 'b', 'hot_value': 2}], now=START)
+        before = (self.path / 'topics.jsonl').read_bytes()
+        store.record([{'title': 'b', 'hot_value': 3}, {'title': 'c', 'hot_value': 4}], now=START + STEP)
+        after = (self.path / 'topics.jsonl').read_bytes()
+        self.assertTrue(after.startswith(before))
+        self.assertEqual(after.decode('utf-8').splitlines(), ['"a"', '"b"', '"c"'])
+
+        # 追加到一半的标题行丢弃，列文件里还没有引用它
+        with open(self.path / 'topics.jsonl', 'ab') as f:
+            f.write(b'"d')
+        self.assertEqual(HotValueStore(path=self.path).titles, ['a', 'b', 'c'])
+        self.assertEqual((self.path / 'topics.jsonl').read_bytes(), after)
+
+    def test_legacy_title_table_is_converted(self):
+        store = HotValueStore(path=self.path)
+        store.record([{'title': 'a', 'hot_value': 1}, {'title': '话题', 'hot_value': 2}], now=START)
+        (self.path / 'topics.jsonl').unlink()
+        (self.path / 'topics.json').write_text('["a","话题"]', encoding='utf-8')
+        store = HotValueStore(path=self.path)
+        self.assertEqual(store.titles, ['a', '话题'])
+        self.assertFalse((self.path / 'topics.json').exists())
+        self.assertTrue((self.path / 'topics.jsonl').exists())
+
+    def test_aged_out_rows_and_titles_are_pruned(self):
+        store = HotValueStore(path=self.path, window=STEP, history=STEP, retention=3600, prune_every=1800)
+        store.record([{'title': '过期话题', 'hot_value': 1}, {'title': '保留话题', 'hot_value': 10}], now=START)
+        for i in range(1, 18):
+            store.record([{'title': '保留话题', 'hot_value': 10 + i}], now=START + i * STEP)
+        self.assertEqual(store.titles, ['过期话题', '保留话题'])
+
+        # 最早的观测超出保留时长 prune_every 以上时清理
+        store.record([{'title': '保留话题', 'hot_value': 100}], now=START + 18 * STEP + 1)
+        self.assertEqual(store.titles, ['保留话题'])
+        ts, topic, hot = store.window_rows(0, START + 19 * STEP)
+        self.assertTrue((ts >= START + 18 * STEP + 1 - 3600).all())
+        self.assertTrue((topic == 0).all())
+        self.assertEqual(int(hot[-1]), 100)
+
+        reopened = HotValueStore(path=self.path)
+        self.assertEqual(reopened.titles, ['保留话题'])
+        self.assertEqual(len(reopened), len(ts))
+        self.assertFalse(self.path.with_name('weibo_hot.old').exists())
+
+    def test_interrupted_prune_keeps_old_data(self):
+        store = HotValueStore(path=self.path)
+        store.record([{'title': 'a', 'hot_value': 1}], now=START)
+        # 清理时刚把原目录挪开就退出
+        self.path.rename(self.path.with_name('weibo_hot.old'))
+        self.path.with_name('weibo_hot.prune').mkdir()
+        store = HotValueStore(path=self.path)
+        self.assertEqual(store.titles, ['a'])
+        self.assertEqual(len(store), 1)
+        self.assertFalse(self.path.with_name('weibo_hot.prune').exists())
+
+    def test_instances_sharing_a_path_agree_on_topic_ids(self):
+        first, second = HotValueStore(path=self.path), HotValueStore(path=self.path)
+        first.record([{'title': '甲', 'hot_value': 1}], now=START)
+        second.record([{'title': '乙', 'hot_value': 2}, {'title': '甲', 'hot_value': 3}], now=START + STEP)
+        self.assertEqual(second.titles, ['甲', '乙'])
+        self.assertEqual(first.trends(now=START + STEP)['乙']['hot_value'], 2)
+        self.assertEqual(HotValueStore(path=self.path).titles, ['甲', '乙'])
+
+    def test_concurrent_writers_keep_rows_and_titles_consistent(self):
+        def writer(prefix, offset):
+            store = HotValueStore(path=self.path)
+            for i in range(100):
+                store.record([{'title': f'{prefix}{i % 30}', 'hot_value': offset + i % 30}], now=START + i)
+
+        threads = [threading.Thread(target=writer, args=args) for args in (('a', 0), ('b', 1000))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        store = HotValueStore(path=self.path)
+        self.assertEqual(len(store), 200)
+        self.assertEqual(len(store.titles), 60)
+        _, topic, hot = store.window_rows(0, START + 100)
+        # 每个话题的热度编码了它的标题，行里的话题 ID 必须指回同一个标题
+        for topic_id, value in zip(topic, hot):
+            prefix, idx = ('a', value) if value < 1000 else ('b', value - 1000)
+            self.assertEqual(store.titles[topic_id], f'{prefix}{idx}')
+
+    def test_prune_by_another_instance_is_picked_up(self):
+        kwargs = dict(window=STEP, history=STEP, retention=3600, prune_every=1800)
+        writer, reader = HotValueStore(path=self.path, **kwargs), HotValueStore(path=self.path, **kwargs)
+        writer.record([{'title': '过期话题', 'hot_value': 1}], now=START)
+        reader.record([{'title': '保留话题', 'hot_value': 2}], now=START + STEP)
+        writer.record([{'title': '保留话题', 'hot_value': 3}], now=START + 18 * STEP + 1)
+        self.assertEqual(writer.titles, ['保留话题'])
+
+        reader.record([{'title': '新话题', 'hot_value': 4}], now=START + 19 * STEP)
+        self.assertEqual(reader.titles, ['保留话题', '新话题'])
+        self.assertEqual(HotValueStore(path=self.path).titles, ['保留话题', '新话题'])
+
+    def test_crawler_promotes_rising_topics(self):
+        store = HotValueStore(path=self.path)
+        now = poll_series(store)
+        crawler = WeiboCrawler(history=store)
+        fetched = [
+            {'title': '平稳话题', 'hot_value': 340100, 'url': '', 'source': 'Weibo'},
+            {'title': '爆发话题', 'hot_value': 835000, 'url': '', 'source': 'Weibo'},
+        ]
+        with patch.object(crawler, '_fetch_board', return_value=fetched), \
+                patch('crawlers.weibo_history.time.time', return_value=now + 60), patch('builtins.print'):
+            topics = crawler.fetch_trending(limit=1)
+        self.assertEqual(topics[0]['title'], '爆发话题')
+        self.assertGreater(topics[0]['zscore'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from aiohttp import web
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawlers.politeness import HostPolicy, PolitenessScheduler
+from crawlers.xiaohongshu import XiaohongshuCrawler, parse_liked_count
+from crawlers.xiaohongshu_cache import SearchResultCache
+
+
+def build_page(items, padding=200000):
+    """模拟搜索页：初始数据前后都有大量无关 HTML，JSON 里带 < 和 undefined"""
+    state = json.dumps({'searchResult': {'items': items}, 'user': {'note': '<b>粗体</b>'}}, ensure_ascii=False)
+    state = state.replace('"user": {', '"extra": undefined, "user": {')
+    return (
+        '<html><head>' + '<meta name="x">' * (padding // 16) +
+        f'<script>window.__INITIAL_STATE__ = {state};</script>' +
+        '<div>footer</div>' * (padding // 17) + '</html>'
+    ).encode('utf-8')
+
+
+class FakePageResponse:
+    """模拟 aiohttp 响应，记录下载了多少字节"""
+
+    def __init__(self, body, status=200):
+        self.body = body
+        self.status = status
+        # Content-Type 没有声明 charset
+        self.charset = None
+        self.content = self
+        self.bytes_read = 0
+        self.closed = False
+
+    async def iter_chunked(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            chunk = self.body[start:start + chunk_size]
+            self.bytes_read += len(chunk)
+            yield chunk
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, url, **kwargs):
+        return self.response
+
+
+def note(idx, likes):
+    return {'note': {'id': f'n{idx}', 'title': f'笔记 {idx} <标题>', 'interactInfo': {'likedCount': likes}}}
+
+
+class TestXiaohongshuStreaming(unittest.TestCase):
+    def make_crawler(self, **kwargs):
+        scheduler = PolitenessScheduler(default_policy=HostPolicy(min_interval=0.001, jitter=(0, 0)), policies={})
+        return XiaohongshuCrawler(scheduler=scheduler, use_cache=False, **kwargs)
+
+    def test_stops_downloading_after_initial_state(self):
+        items = [note(i, 10 * i) for i in range(3)]
+        response = FakePageResponse(build_page(items))
+        crawler = self.make_crawler()
+        with patch.object(crawler.http, 'get', return_value=FakeSession(response)), patch('builtins.print'):
+            result = crawler.get_search_results('穿搭')
+
+        self.assertEqual(result, items)
+        self.assertTrue(response.closed)
+        # 初始数据之后的页脚没有被下载
+        self.assertLess(response.bytes_read, len(response.body) * 0.6)
+
+    def test_byte_cap(self):
+        response = FakePageResponse(build_page([note(1, 1)]))
+        crawler = self.make_crawler(max_page_bytes=64 * 1024)
+        with patch.object(crawler.http, 'get', return_value=FakeSession(response)), patch('builtins.print'):
+            self.assertEqual(crawler.get_search_results('穿搭'), [])
+        self.assertLessEqual(response.bytes_read, 64 * 1024 + crawler.chunk_size)
+
+    def test_native_fetch_reads_initial_state(self):
+        pages = {'穿搭': build_page([note(1, '2万'), note(2, 10)]), '美食': build_page([note(3, 500), note(1, '2万')])}
+
+        async def search(request):
+            return web.Response(body=pages[request.query['keyword']], content_type='text/html')
+
+        async def scenario():
+            app = web.Application()
+            app.router.add_get('/search_result', search)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, 'localhost', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            crawler = self.make_crawler(keywords=list(pages))
+            crawler.search_url = f'http://localhost:{port}/search_result'
+            try:
+                return [trend async for trend in crawler.fetch(limit=5)]
+            finally:
+                await crawler.aclose()
+                await runner.cleanup()
+
+        with patch('builtins.print'):
+            trends = asyncio.run(scenario())
+        self.assertEqual([(t['url'].rsplit('/', 1)[-1], t['likes']) for t in trends],
+                         [('n1', 20000), ('n3', 500), ('n2', 10)])
+
+
+class TestXiaohongshuFanOut(unittest.TestCase):
+    KEYWORD_RESULTS = {
+        '穿搭': [note(1, '1.2万'), note(2, 300)],
+        '美食': [note(3, '10w+'), note(2, 300)],
+        '旅行': [note(4, 5000)],
+    }
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = Path(self.tmp_dir.name) / 'search.json'
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def fake_search(self, keyword, limit=5):
+        self.calls.append(keyword)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.05)
+        self.active -= 1
+        return self.KEYWORD_RESULTS[keyword]
+
+    def make_crawler(self, ttl=1800):
+        return XiaohongshuCrawler(keywords=list(self.KEYWORD_RESULTS),
+                                  cache=SearchResultCache(path=self.cache_path, ttl=ttl))
+
+    def test_liked_count_parsing(self):
+        self.assertEqual(parse_liked_count('1.2万'), 12000)
+        self.assertEqual(parse_liked_count('10w+'), 100000)
+        self.assertEqual(parse_liked_count('356'), 356)
+        self.assertEqual(parse_liked_count(None), 0)
+
+    def test_all_keywords_searched_concurrently_deduped_and_ranked(self):
+        crawler = self.make_crawler()
+        with patch.object(crawler, 'get_search_results_async', side_effect=self.fake_search), patch('builtins.print'):
+            trends = crawler.fetch_trending(limit=5)
+
+        self.assertEqual(sorted(self.calls), sorted(self.KEYWORD_RESULTS))
+        self.assertGreater(self.max_active, 1)
+        self.assertEqual([t['url'].rsplit('/', 1)[-1] for t in trends], ['n3', 'n1', 'n4', 'n2'])
+        self.assertEqual(trends[0]['likes'], 100000)
+
+    def test_cache_with_smaller_limit_is_a_miss(self):
+        cache = SearchResultCache(path=self.cache_path)
+        cache.put('穿搭', [note(1, 1)], limit=1)
+        self.assertIsNone(cache.get('穿搭', 5))
+        self.assertEqual(cache.get('穿搭', 1), [note(1, 1)])
+
+        # 搜索得更多时，少要几条可以直接截取
+        cache.put('穿搭', [note(i, i) for i in range(5)], limit=5)
+        self.assertEqual(cache.get('穿搭', 2), [note(0, 0), note(1, 1)])
+        # 当时就只搜到这么多，不算缺
+        cache.put('美食', [note(1, 1)], limit=5)
+        self.assertEqual(cache.get('美食', 5), [note(1, 1)])
+
+    def test_cached_keywords_not_searched_again(self):
+        with patch.object(XiaohongshuCrawler, 'get_search_results_async', side_effect=self.fake_search), \
+                patch('builtins.print'):
+            self.make_crawler().fetch_trending(limit=5)
+            # 新的爬虫实例从磁盘读到同一份缓存
+            self.make_crawler().fetch_trending(limit=5)
+            self.assertEqual(len(self.calls), 3)
+
+            self.make_crawler(ttl=0).fetch_trending(limit=5)
+            self.assertEqual(len(self.calls), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,8 @@ import httpx
 from anthropic import Anthropic
 from pathlib import Path
 
+from crawlers.cassette import httpx_transport
+
 logger = logging.getLogger(__name__)
 
 class BaseContentFilter:
@@ -24,7 +26,9 @@ class AIContentFilter(BaseContentFilter):
         http_client = httpx.Client(
             base_url="https://api.anthropic.com",
             headers={"anthropic-version": "2023-06-01"},
-            timeout=30.0
+            timeout=30.0,
+            # 启用录制带时录制/回放对 Anthropic 的请求
+            transport=httpx_transport()
         )
         self.client = Anthropic(
             api_key=self.api_key,
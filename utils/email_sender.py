@@ -9,6 +9,7 @@ import json
 from datetime import datetime
 import logging
 from config import EMAIL_CONFIG, SUBSCRIBERS
+from crawlers.deadlines import late_notice
 from .content_filter import ContentFilterManager  # 更新导入
 from flask import render_template_string
 
@@ -37,6 +38,7 @@ def format_html_content(content):
     
     template_vars = {
         'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
+        'incomplete': late_notice(content.get('late')) if isinstance(content, dict) else '',
         'sections': {
             cat: {
                 'name': info['name'],
@@ -95,6 +97,9 @@ def render_fallback_template(vars):
             html += "<p>暂无内容</p>"
             
         html += "</div>"
+
+    if vars.get('incomplete'):
+        html += f"<p><small>{vars['incomplete']}</small></p>"
     
     html += """
         </body>